@@ -117,6 +117,9 @@ class BaseHandler(AbstractPlatformHandler, AssetsMixin, ServicesMixin, OutputMix
     configPath = 'apptools.project'
     context_injectors = []
 
+    # Model API
+    model_session = False  # open a `model.Session` for each request, flushing buffered writes after dispatch
+
     # Base HTTP Headers
     @webapp2.cached_property
     def logging(self):
@@ -170,8 +173,13 @@ class BaseHandler(AbstractPlatformHandler, AssetsMixin, ServicesMixin, OutputMix
                 self.logging.warning('Exception encountered parsing uagent: ' + str(e))
                 pass
 
-        # Dispatch method (GET/POST/etc.)
-        result = super(BaseHandler, self).dispatch()
+        # Dispatch method (GET/POST/etc.), optionally inside a request-scoped model session
+        if self.model_session:
+            from apptools import model
+            with model.Session():
+                result = super(BaseHandler, self).dispatch()
+        else:
+            result = super(BaseHandler, self).dispatch()
 
         if not self.direct:
             # Check platforms for post-dispatch hooks
@@ -198,6 +206,14 @@ class BaseHandler(AbstractPlatformHandler, AssetsMixin, ServicesMixin, OutputMix
         ''' Handle an unhandled exception during method dispatch. '''
 
         self.logging.exception('Unhandled exception encountered in RequestHandler code: "%s".' % exception)
+
+        # Drop model writes buffered by the failed request
+        if self.model_session:
+            from apptools import model
+            session = model.Session.current()
+            if session is not None:
+                session.discard()
+
         if debug:
             raise
         else:
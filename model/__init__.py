@@ -36,6 +36,7 @@ from . import exceptions
 # apptools model adapters
 from .adapter import abstract, concrete
 from .adapter import KeyMixin, ModelMixin
+from .adapter import Session
 
 # apptools datastructures
 from apptools.util.datastructures import _EMPTY
@@ -57,6 +58,10 @@ else:  # pragma: no cover
 _MULTITENANCY = False  # toggle multitenant key namespaces
 _DEFAULT_KEY_SCHEMA = tuple(['id', 'kind', 'parent'])  # default key schema
 _MULTITENANT_KEY_SCHEMA = tuple(['id', 'kind', 'parent', 'namespace', 'app'])
+_KEY_MEMOS = ('__flattened__', '__urlsafe__', '__encoded__')  # memoized key forms (see `AdaptedKey.flatten`)
+_KEY_MEMO_SAFE = frozenset(('__owner__', '__persisted__'))  # key internals that don't change memoized forms
+_COMPACT_SLOTS = ('__key__', '__explicit__', '__initialized__', '__previous__', '__projection__', '__values__',
+                  '__dirtied__')  # entity internals of compact models (see `AbstractModel._SlotStorage`)
 
 
 ## == Metaclasses == ##
@@ -297,7 +302,7 @@ class AbstractKey(_key_parent()):
     __str__ = __unicode__ = __repr__
 
     # util: support for `__nonzero__` and aliased `__len__`
-    __nonzero__ = lambda self: isinstance(self.__id__, (basestring, int))
+    __nonzero__ = lambda self: isinstance(self.__id__, (basestring, int, long))
     __len__ = lambda self: (int(self.__nonzero__()) if self.__parent__ is None else sum((1 for i in self.ancestry)))
 
     ## = Property Setters = ##
@@ -376,6 +381,102 @@ class AbstractModel(_model_parent()):
 
             return _filter_prop
 
+        @staticmethod
+        def _compile(kind, name, source, namespace):
+
+            ''' Compile generated source for a model class, and return the function it defines as ``name``. '''
+
+            exec compile('\n'.join(source), '<generated %s.%s>' % (kind, name), 'exec') in namespace
+            return namespace[name]
+
+        @classmethod
+        def _compile_accessors(cls, order, compact):
+
+            ''' Generate the statements that fetch property values from an ``entity``, as
+                ``value``, for its storage: by offset for compact models, by name otherwise. '''
+
+            if compact:
+                return ['    values = entity.__values__'], lambda i, name: 'value = values[%d]' % i
+            return ['    get = entity.__data__.get'], lambda i, name: 'value = get(%r, _UNSET)[0]' % name
+
+        @classmethod
+        def _compile_validator(cls, kind, order, property_map, compact):
+
+            ''' Generate a validator for a model class, unrolling :py:meth:`Property.valid`
+                for each of its properties (in explicit mode), with their policies and
+                basetypes resolved ahead of time.
+
+                :returns: Function, accepting an entity, which raises validation exceptions. '''
+
+            prelude, fetch = cls._compile_accessors(order, compact)
+            source, namespace = ['def validate(entity):'] + prelude, {
+                '_EMPTY': _EMPTY, '_UNSET': (_EMPTY,), '_MULTI': (list, tuple, set, frozenset),
+                '_required': exceptions.PropertyRequired, '_repeated': exceptions.PropertyRepeated,
+                '_not_repeated': exceptions.PropertyNotRepeated, '_invalid': exceptions.InvalidPropertyValue}
+
+            for i, name in enumerate(order):
+                prop, fail = property_map[name], '%%s(%r, entity.kind()%%s)' % name
+                namespace['_p%d' % i] = prop
+
+                if prop.__class__ is not Property and hasattr(prop, 'validate'):  # pragma: no cover
+                    source.extend(['    with entity:', '        _p%d.valid(entity)' % i])
+                    continue
+
+                basetype = prop._basetype
+                if basetype is not None:
+                    namespace['_t%d' % i], namespace['_n%d' % i] = (basetype, type(None)), basetype.__name__
+                invalid = fail % ('_invalid', ', type(%%s).__name__, _n%d' % i)
+
+                source.extend(['    ' + fetch(i, name), '    if value is _EMPTY or value is None:'])
+                if prop._required:
+                    source.append('        raise ' + fail % ('_required', ''))
+                elif prop._repeated:
+                    source.append('        if value is None: raise ' + fail % ('_repeated', ''))
+                else:
+                    source.append('        pass')
+
+                if prop._repeated:
+                    source.extend(['    elif not isinstance(value, _MULTI):',
+                                   '        raise ' + fail % ('_repeated', '')])
+                    if basetype is not None:
+                        source.extend(['    else:', '        for item in value:',
+                                       '            if item is _EMPTY or not isinstance(item, _t%d):' % i,
+                                       '                raise ' + invalid % 'item'])
+                else:
+                    source.extend(['    elif isinstance(value, _MULTI):',
+                                   '        raise ' + fail % ('_not_repeated', '')])
+                    if basetype is not None:
+                        source.extend(['    elif not isinstance(value, _t%d):' % i,
+                                       '        raise ' + invalid % 'value'])
+
+            return cls._compile(kind, 'validate', source + ['    return True'], namespace)
+
+        @classmethod
+        def _compile_to_dict(cls, kind, order, property_map, compact):
+
+            ''' Generate a serializer for a model class, equivalent to :py:meth:`to_dict`
+                without ``exclude``, ``include``, ``filter`` or ``map``, with each
+                property's default resolved ahead of time.
+
+                :returns: Function, accepting an entity and ``_all`` flag, which returns a ``dict``. '''
+
+            prelude, fetch = cls._compile_accessors(order, compact)
+            source = ['def to_dict(entity, _all=False):',
+                      '    explicit, dictionary = entity.__explicit__, {}'] + prelude
+            namespace = {'_EMPTY': _EMPTY, '_UNSET': (_EMPTY,)}
+
+            for i, name in enumerate(order):
+                source.extend(['    ' + fetch(i, name),
+                               '    if value is not _EMPTY:', '        dictionary[%r] = value' % name,
+                               '    elif explicit:', '        dictionary[%r] = _EMPTY' % name])
+                if property_map[name]._default is not Property._sentinel:
+                    namespace['_d%d' % i] = property_map[name]._default
+                    source.extend(['    else:', '        dictionary[%r] = _d%d' % (name, i)])
+                else:
+                    source.extend(['    elif _all:', '        dictionary[%r] = None' % name])
+
+            return cls._compile(kind, 'to_dict', source + ['    return dictionary'], namespace)
+
         @classmethod
         def initialize(cls, name, bases, properties):
 
@@ -412,6 +513,13 @@ class AbstractModel(_model_parent()):
                 prop_lookup = frozenset((k for k, v in property_map.iteritems()))  # freeze property lookup
                 model_adapter = cls.resolve(name, bases, properties)  # resolve default adapter for model
 
+                # compact models (`__compact__ = True`, inherited) keep values in slots, in a fixed property order
+                inherited = any((getattr(b, '__compact__', False) for b in bases))
+                compact, order = (properties.get('__compact__', False) or inherited), tuple(sorted(prop_lookup))
+                if compact and not inherited:
+                    modelclass.update(((k, v) for k, v in AbstractModel._SlotStorage.__dict__.iteritems()
+                                       if k not in ('__module__', '__doc__', '__dict__', '__weakref__')))
+
                 _model_internals = {  # build class layout, initialize core model class attributes.
                     '__impl__': {},  # holds cached implementation classes generated from this model
                     '__name__': name,  # map-in internal class name (should be == to Model kind)
@@ -420,7 +528,16 @@ class AbstractModel(_model_parent()):
                     '__lookup__': prop_lookup,  # frozenset of allocated attributes, for quick lookup
                     '__adapter__': model_adapter,  # resolves default adapter class for this key/model
                     '__module__': properties.get('__module__'),  # add model's module location for future import
-                    '__slots__': tuple()}  # seal-off object attributes (but allow weakrefs and explicit flag)
+                    '__slots__': _COMPACT_SLOTS if (compact and not inherited) else tuple()}  # seal-off attributes
+
+                if compact:  # slot offsets for compact models, by property name
+                    _model_internals.update({'__compact__': True, '__order__': order,
+                                             '__offsets__': dict(((k, i) for i, k in enumerate(order)))})
+
+                # validation and serialization, specialized to this class' properties and storage
+                _model_internals.update({
+                    '__validate__': staticmethod(cls._compile_validator(name, order, property_map, compact)),
+                    '__to_dict__': staticmethod(cls._compile_to_dict(name, order, property_map, compact))})
 
                 modelclass.update(property_map)  # update at class-level with descriptor map
                 modelclass.update(_nondata_map)  # update at class-level with non data properties
@@ -492,6 +609,77 @@ class AbstractModel(_model_parent()):
         data = property(operator.itemgetter(0), doc='Alias for `PropertyValue.data` at index 0.')
         dirty = property(operator.itemgetter(1), doc='Alias for `PropertyValue.dirty` at index 1.')
 
+    ## AbstractModel.SlotStorage
+    # Storage internals for compact models, copied onto model classes that set `__compact__`.
+    class _SlotStorage(object):
+
+        ''' Slot-backed value storage, for models that set ``__compact__``. Rather
+            than a ``__data__`` dict of `_PropertyValue` tuples, entities hold a
+            ``list`` of values in ``__values__``, indexed by the class' fixed property
+            order (``__offsets__``), and a bitmask of dirty properties in ``__dirtied__``.
+            Entity internals live in slots, so instances carry no ``__dict__``.
+
+            The descriptor and item APIs are unchanged, and ``__data__`` is still
+            available (as a built-on-read ``dict``) for compatibility. '''
+
+        def _get_data(self):
+
+            ''' Build a ``__data__``-style ``dict`` of set values, by name. '''
+
+            values, dirtied = self.__values__, self.__dirtied__
+            return dict(((name, AbstractModel._PropertyValue(values[i], bool((dirtied >> i) & 1)))
+                         for i, name in enumerate(self.__order__) if values[i] is not _EMPTY))
+
+        def _set_data(self, data):
+
+            ''' Replace stored values from a ``__data__``-style ``dict``. '''
+
+            self.__values__, self.__dirtied__ = [_EMPTY] * len(self.__order__), 0
+            for name, (value, dirty) in data.iteritems():
+                self.__values__[self.__offsets__[name]] = value
+                self.__dirtied__ |= (int(dirty) << self.__offsets__[name])
+
+        __data__ = property(_get_data, _set_data)
+        __len__ = __nonzero__ = lambda self: len(self.__values__) - self.__values__.count(_EMPTY)
+        __dirty__ = property(lambda self: bool(self.__dirtied__))
+
+        def _set_persisted(self, flag=False):
+
+            ''' Notify this entity that it has been persisted to storage. '''
+
+            self.key.__persisted__, self.__previous__, self.__dirtied__ = True, {}, 0
+            return self
+
+        def _get_value(self, name, default=None):
+
+            ''' Retrieve the value of a named property on this Entity. '''
+
+            if name:
+                offset = self.__offsets__.get(name)
+                if offset is not None:
+                    value = self.__values__[offset]
+                    if value is _EMPTY:
+                        return _EMPTY if self.__explicit__ else default
+                    return value
+                raise exceptions.InvalidAttribute('get', name, self.kind())
+            return [(i, getattr(self, i)) for i in self.__lookup__]
+
+        def _set_value(self, name, value=_EMPTY, _dirty=True):
+
+            ''' Set (or reset) the value of a named property on this Entity. Batches,
+                keys and invalid names are handled by :py:meth:`AbstractModel._set_value`. '''
+
+            offset = self.__offsets__.get(name) if isinstance(name, basestring) else None
+            if offset is None:
+                return AbstractModel._set_value(self, name, value, _dirty)
+
+            if _dirty and self.__previous__ is not None and name not in self.__previous__:
+                self.__previous__[name] = self.__values__[offset]
+
+            self.__values__[offset] = value
+            self.__dirtied__ = (self.__dirtied__ | (1 << offset)) if _dirty else (self.__dirtied__ & ~(1 << offset))
+            return self
+
     # = Internal Methods = #
     def __new__(cls, *args, **kwargs):
 
@@ -501,10 +689,17 @@ class AbstractModel(_model_parent()):
             raise exceptions.AbstractConstructionFailure('AbstractModel')
         return super(AbstractModel, cls).__new__(cls, *args, **kwargs)
 
-    # util: generate a string representation of this entity, alias to string conversion methods too
-    __repr__ = __str__ = __unicode__ = lambda self: "%s(%s, %s)" % (self.__kind__, self.__key__,
-                                                    ', '.join(['='.join([k, str(self.__data__.get(k, None))])
-                                                               for k in self.__lookup__]))
+    def __repr__(self):
+
+        ''' Generate a string representation of this entity. Reads ``__data__``
+            once, as compact models build it on each read. '''
+
+        data = self.__data__
+        return "%s(%s, %s)" % (self.__kind__, self.__key__, ', '.join(['='.join([k, str(data.get(k, None))])
+                                                                        for k in self.__lookup__]))
+
+    # util: alias string conversion methods to `__repr__`
+    __str__ = __unicode__ = __repr__
 
     def __setattr__(self, name, value, exception=exceptions.InvalidAttribute):
 
@@ -567,7 +762,7 @@ class AbstractModel(_model_parent()):
 
         ''' Notify this entity that it has been persisted to storage. '''
 
-        self.key.__persisted__ = True
+        self.key.__persisted__, self.__previous__ = True, {}
         for name in self.__data__:  # iterate over set properties
             # set value to previous, with `False` dirty flag
             self._set_value(name, self._get_value(name, default=Property._sentinel), False)
@@ -598,7 +793,7 @@ class AbstractModel(_model_parent()):
             if isinstance(name, dict):
                 name = name.items()  # convert dict to list of tuples
             # filter out flags from caller
-            return [self._set_value(k, i, _dirty=_dirty) for k, i in name if k not in ('key', '_persisted')]
+            return [self._set_value(k, i, _dirty=_dirty) for k, i in name if k not in ('key', '_persisted', '_projection')]
 
         if isinstance(name, tuple):  # pragma: no cover
             name, value = name  # allow a tuple of (name, value), for use in map/filter/etc
@@ -607,6 +802,11 @@ class AbstractModel(_model_parent()):
             return self._set_key(value).owner  # returns `self` :)
 
         if name in self.__lookup__:  # check property lookup
+
+            # on persisted entities, remember a property's stored value the first time it's dirtied (for index diffs)
+            if _dirty and self.__previous__ is not None and name not in self.__previous__:
+                self.__previous__[name] = self.__data__[name].data if name in self.__data__ else Property._sentinel
+
             # if it's a valid property, create a namedtuple value placeholder
             self.__data__[name] = self.__class__._PropertyValue(value, _dirty)
             return self
@@ -709,13 +909,15 @@ class Key(AbstractKey):
 
     def __setattr__(cls, name, value):
 
-        ''' Block attribute overwrites. '''
+        ''' Block attribute overwrites, and drop memoized flattened/encoded forms when parts change. '''
 
         if not name.startswith('__'):
             if name not in cls.__schema__:
                 raise exceptions.InvalidKeyAttributeWrite('create', name, cls)
             if getattr(cls, name) is not None:
                 raise exceptions.InvalidKeyAttributeWrite('overwrite', name, cls)
+        elif name not in _KEY_MEMO_SAFE:
+            for memo in _KEY_MEMOS: cls.__dict__.pop(memo, None)
         return super(AbstractKey, cls).__setattr__(name, value)
 
 
@@ -813,7 +1015,7 @@ class Property(object):
                                         self._required, self._repeated, self._indexed, **self._options)
 
     ## == Query Overrides (Operators) == ##
-    __sort__ = lambda self, other, direction: query.Sort(self, other, direction=(direction or query.Sort.ASCENDING))
+    __sort__ = lambda self, direction: query.Sort(self, operator=(direction or query.Sort.ASCENDING))
     __filter__ = lambda self, other, operator: query.Filter(self, other, operator=(operator or query.Filter.EQUALS))
 
 
@@ -829,6 +1031,7 @@ class Property(object):
     __ge__ = lambda self, other: self.__filter__(other, query.Filter.GREATER_THAN_EQUAL_TO)  # `>=` operator override
     __lt__ = lambda self, other: self.__filter__(other, query.Filter.LESS_THAN)  # `<` operator override
     __le__ = lambda self, other: self.__filter__(other, query.Filter.LESS_THAN_EQUAL_TO)  # `<=` operator override
+    IN = lambda self, values: self.__filter__(list(values), query.Filter.IN)  # matches any of several values
 
 
 ## Model
@@ -847,6 +1050,12 @@ class Model(AbstractModel):
         # grab key / persisted flag, if any, and set explicit flag to `False`
         self.__explicit__, self.__initialized__ = False, True
 
+        # stored values of dirtied properties, tracked only for entities inflated from storage
+        self.__previous__ = {} if properties.get('_persisted', False) else None
+
+        # names of the properties loaded by a projection query, if this entity is only partially populated
+        self.__projection__ = properties.get('_projection', None)
+
         # initialize key, internals, and map any kwargs into data
         self.key, self.__data__ = properties.get('key', False) or self.__keyclass__(self.kind(), _persisted=False), {}
         self._set_value(properties, _dirty=(not properties.get('_persisted', False)))
@@ -857,8 +1066,8 @@ class Model(AbstractModel):
 
 # Module Globals
 __abstract__ = [abstract, MetaFactory, AbstractKey, AbstractModel]
-__concrete__ = [concrete, Property, KeyMixin, ModelMixin, Key, Model]
+__concrete__ = [concrete, Property, KeyMixin, ModelMixin, Key, Model, Session]
 
 # All modules
 __all__ = ['concrete', 'abstract', 'MetaFactory', 'AbstractKey', 'AbstractModel', 'query',
-           'Property', 'KeyMixin', 'ModelMixin', 'Key', 'Model', 'adapter', 'exceptions']
+           'Property', 'KeyMixin', 'ModelMixin', 'Key', 'Model', 'Session', 'adapter', 'exceptions']
@@ -59,6 +59,16 @@ from .inmemory import InMemoryAdapter
 concrete = (InMemoryAdapter, RedisAdapter, SQLAdapter, MongoAdapter, MemcacheAdapter)
 
 
+# entity caching
+from . import cache
+from .cache import EntityCache
+
+
+# request-scoped sessions
+from . import session
+from .session import Session
+
+
 # builtin mixins
 from . import core
 from .core import DictMixin
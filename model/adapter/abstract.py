@@ -21,11 +21,14 @@
 
 
 # stdlib
+import os
+import re
 import abc
 import zlib
 import time
 import base64
 import datetime
+import threading
 
 # apptools utils
 from apptools.util import json
@@ -42,10 +45,14 @@ else:
 
 
 # Globals
+_caches = {}
 _adapters = {}
+_allocators = {}
+_codecs = {}
 _adapters_by_model = {}
 _encoder = base64.b64encode  # encoder for key names and special strings, if enabled
 _compressor = zlib.compress  # compressor for data values, if enabled
+_DECIMAL = re.compile(r'^(0|-?[1-9][0-9]*)\Z')  # string IDs that round-trip through `int`
 _core_mixin_classes = ('Mixin', 'KeyMixin', 'ModelMixin', 'CompoundKey', 'CompoundModel')
 
 # Computed Classes
@@ -53,6 +60,256 @@ CompoundKey = None
 CompoundModel = None
 
 
+## IDAllocator
+# Hands out Key IDs locally, from blocks reserved in bulk through an adapter.
+class IDAllocator(object):
+
+    ''' Client-side "hi/lo" ID allocator. Reserves blocks of IDs per kind
+        with one call to an adapter's ``allocate_ids``, then hands them out
+        from process memory under a lock. Block sizes adapt to the observed
+        allocation rate: a block used up within ``window`` seconds doubles
+        the next reservation (up to ``maximum``), and one that lasts longer
+        than ten windows halves it (down to ``minimum``).
+
+        IDs remain unique across processes, but are only monotonic within a
+        block - concurrent processes interleave their blocks. '''
+
+    block = 1000  # initial number of IDs to reserve per round-trip
+    minimum = 10  # smallest block to reserve, once adapted
+    maximum = 100000  # largest block to reserve, once adapted
+    window = 1.0  # seconds - blocks used up faster than this grow
+
+    def __init__(self, adapter, block=None, minimum=None, maximum=None, window=None):
+
+        ''' Initialize this :py:class:`IDAllocator`.
+
+            :param adapter: :py:class:`ModelAdapter` to reserve ID blocks through.
+            :param block: Initial block size. A block size of ``1`` disables
+            reservation (every allocation goes straight to the adapter).
+            :param minimum: Smallest adapted block size.
+            :param maximum: Largest adapted block size.
+            :param window: Block lifetime, in seconds, that triggers adaptation. '''
+
+        self.adapter, self.lock, self.blocks, self.pid = adapter, threading.Lock(), {}, os.getpid()
+        self.block, self.minimum, self.maximum, self.window = (
+            block or self.block, minimum or self.minimum, maximum or self.maximum, window or self.window)
+
+    def allocate(self, key_class, kind, count=1):
+
+        ''' Allocate ``count`` IDs for ``kind``, reserving new blocks as needed.
+
+            :param key_class: Descendent of :py:class:`model.Key` to allocate IDs for.
+            :param kind: String :py:class:`model.Model` kind name.
+            :param count: Number of IDs to allocate. Defaults to ``1``.
+            :returns: ``list`` of integer IDs. '''
+
+        if self.block <= 1:
+            ids = self.adapter.allocate_ids(key_class, kind, count)
+            return [ids] if count == 1 else list(ids())
+
+        with self.lock:
+
+            # blocks reserved before a fork would be handed out twice
+            if self.pid != os.getpid():
+                self.blocks, self.pid = {}, os.getpid()
+
+            ids = []
+            while len(ids) < count:
+                block = self.blocks.get(kind)
+                if block is None or block[0] > block[1]:
+                    block = self.blocks[kind] = self._reserve(key_class, kind, block, count - len(ids))
+
+                take = min(count - len(ids), block[1] - block[0] + 1)
+                ids.extend(xrange(block[0], block[0] + take))
+                block[0] += take
+            return ids
+
+    def _reserve(self, key_class, kind, previous, needed):
+
+        ''' Reserve a new block of IDs, sizing it by how quickly ``previous`` was used up.
+
+            :returns: Block state, as ``[<next ID>, <last ID>, <size>, <reserved at>]``. '''
+
+        size, now = self.block, time.time()
+        if previous is not None:
+            lifetime, size = now - previous[3], previous[2]
+            if lifetime < self.window:
+                size = min(size * 2, self.maximum)
+            elif lifetime > (self.window * 10):
+                size = max(size / 2, self.minimum)
+
+        size = max(size, needed)
+        ids = self.adapter.allocate_ids(key_class, kind, size)
+        first = ids if size == 1 else ids().next()  # adapters allocate contiguous ranges
+        return [first, first + size - 1, size, now]
+
+
+## KeyCodec
+# Packs keys into a compact binary form for storage, and back.
+class KeyCodec(object):
+
+    ''' Compact storage codec for :py:class:`model.Key` objects, as an
+        alternative to ``base64``-encoding joined keys. An encoded key is a
+        marker byte, the length of its ancestry, then - root first - each
+        key's kind (as a code from a kind dictionary, kept through the
+        adapter's ``kind_code`` and ``code_kind``) and ID. Integer IDs (and
+        string IDs holding one) are packed as varints, other string IDs are
+        length-prefixed.
+
+        Varints carry six bits per byte, with the seventh flagging that more
+        follow, so encoded keys stay 7-bit clean and ``NUL``-free: they can
+        be embedded in index members, scripts and cursors just like
+        ``base64`` keys. Keys outside the default key schema aren't packed,
+        and are left to the adapter's usual encoding. '''
+
+    marker = '\x01'  # first byte of compactly-encoded keys (never the first byte of a `base64` key)
+
+    def __init__(self, adapter):
+
+        ''' Initialize this :py:class:`KeyCodec`.
+
+            :param adapter: :py:class:`ModelAdapter` to keep the kind dictionary through. '''
+
+        self.adapter, self.lock, self.codes, self.kinds = adapter, threading.Lock(), {}, {}
+
+    @classmethod
+    def compact(cls, encoded):
+
+        ''' Check whether an encoded key was packed by a :py:class:`KeyCodec`.
+
+            :param encoded: Encoded key.
+            :returns: ``bool``. '''
+
+        return encoded[:1] == cls.marker
+
+    def code(self, kind):
+
+        ''' Resolve the dictionary code for a kind, assigning one (via the adapter) the first time it's seen.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :returns: Integer code. '''
+
+        code = self.codes.get(kind)
+        if code is None:
+            with self.lock:
+                code = self.codes[kind] = int(self.adapter.kind_code(kind))
+                self.kinds[code] = kind
+        return code
+
+    def kind(self, code):
+
+        ''' Resolve the kind for a dictionary code, asking the adapter for codes assigned by other processes.
+
+            :param code: Integer code.
+            :raises: :py:exc:`ValueError` if no kind has been assigned ``code``.
+            :returns: String :py:class:`model.Model` kind. '''
+
+        kind = self.kinds.get(code)
+        if kind is None:
+            kind = self.adapter.code_kind(code)
+            if kind is None:
+                raise ValueError('Unknown kind code in compact key: "%s".' % code)
+            with self.lock:
+                self.kinds[code], self.codes[kind] = kind, code
+        return kind
+
+    def encode(self, flattened):
+
+        ''' Pack a flattened :py:class:`model.Key` (see :py:meth:`model.Key.flatten`).
+
+            :param flattened: Flattened ``tuple`` (raw) key.
+            :returns: Packed key, or ``None`` if the key isn't in the default key schema. '''
+
+        path = []
+        while flattened:
+            if len(flattened) != 3 or not flattened[1]:
+                return None
+            parent, kind, id = flattened
+            path.append(self._pack(self.code(kind)) + self._pack_id(id))
+            flattened = parent[1] if (isinstance(parent, tuple) and len(parent) == 2) else parent  # joined parents
+
+        return self.marker + self._pack(len(path)) + ''.join(reversed(path))
+
+    def decode(self, encoded, key_class, persisted=True):
+
+        ''' Unpack a key packed by :py:meth:`encode`.
+
+            :param encoded: Packed key.
+            :param key_class: :py:class:`model.Key` class to inflate.
+            :param persisted: Whether the key is known to be persisted. Defaults to ``True``.
+            :raises: :py:exc:`ValueError` if ``encoded`` wasn't packed by a :py:class:`KeyCodec`.
+            :returns: Inflated :py:class:`model.Key`. '''
+
+        if not self.compact(encoded):
+            raise ValueError('Not a compact key: "%s".' % encoded)
+
+        key, (depth, offset) = None, self._unpack(encoded, 1)
+        for i in xrange(depth):
+            code, offset = self._unpack(encoded, offset)
+            value, offset = self._unpack(encoded, offset)
+
+            if value == 1:
+                id = None
+            elif not value & 1:
+                value = (value - 2) >> 1
+                id = -((value + 1) >> 1) if value & 1 else value >> 1  # zigzag, so negative IDs pack small too
+            else:
+                length = (value - 3) >> 1
+                id, offset = encoded[offset:offset + length].decode('unicode_escape'), offset + length
+            key = key_class(self.kind(code), id, parent=key, _persisted=persisted)
+        return key
+
+    def clear(self):
+
+        ''' Forget every kind code known to this process.
+
+            :returns: Nothing. '''
+
+        with self.lock:
+            self.codes.clear()
+            self.kinds.clear()
+
+    @classmethod
+    def _pack_id(cls, id):
+
+        ''' Pack a key ID: ``1`` for none, an even varint for integers, or an odd varint length before a string. '''
+
+        if id is None or id == '':
+            return cls._pack(1)
+        if isinstance(id, basestring) and _DECIMAL.match(id):
+            id = int(id)  # joined keys can't tell `5` from `"5"`, so neither can packed ones
+        if isinstance(id, (int, long)) and not isinstance(id, bool):
+            return cls._pack(2 + ((id << 2) if id >= 0 else ((-id << 2) - 2)))
+        escaped = unicode(id).encode('unicode_escape')
+        return cls._pack(3 + (len(escaped) << 1)) + escaped
+
+    @staticmethod
+    def _pack(value):
+
+        ''' Pack a non-negative integer as a 7-bit clean varint, least significant six bits first. '''
+
+        chunks = []
+        while value >> 6:
+            chunks.append(chr((value & 0x3f) | 0x40))
+            value >>= 6
+        chunks.append(chr(value))
+        return ''.join(chunks)
+
+    @staticmethod
+    def _unpack(encoded, offset):
+
+        ''' Unpack a varint packed by :py:meth:`_pack`.
+
+            :returns: Tupled ``(<value>, <offset after the varint>)``. '''
+
+        value, shift = 0, 0
+        while True:
+            byte = ord(encoded[offset])
+            value, offset, shift = value | ((byte & 0x3f) << shift), offset + 1, shift + 6
+            if not byte & 0x40:
+                return value, offset
+
+
 ## ModelAdapter
 # Adapt apptools models to a storage backend.
 class ModelAdapter(object):
@@ -86,6 +343,31 @@ class ModelAdapter(object):
             'path': '.'.join(psplit[0:-1]),
             'name': psplit[-1]})._setcondition(cls.config.get('debug', True))
 
+    @decorators.classproperty
+    def allocator(cls):
+
+        ''' Shared :py:class:`IDAllocator` for this adapter, configured via
+            the ``ids`` config block (``block``, ``minimum``, ``maximum``
+            and ``window``).
+
+            :returns: Cached :py:class:`IDAllocator` instance. '''
+
+        if cls.__name__ not in _allocators:
+            _allocators[cls.__name__] = IDAllocator(cls, **cls.config.get('ids', {}))
+        return _allocators[cls.__name__]
+
+    @decorators.classproperty
+    def codec(cls):
+
+        ''' Shared :py:class:`KeyCodec` for this adapter, for adapters that
+            can store keys compactly (see :py:meth:`kind_code`).
+
+            :returns: Cached :py:class:`KeyCodec` instance. '''
+
+        if cls.__name__ not in _codecs:
+            _codecs[cls.__name__] = KeyCodec(cls)
+        return _codecs[cls.__name__]
+
     @decorators.classproperty
     def serializer(cls):
 
@@ -143,20 +425,24 @@ class ModelAdapter(object):
             # grab getter method
             getter = getattr(self.__class__, 'get')
 
-        # flatten key into stringified repr
+        # flatten key into stringified repr, and encode it (via the adapter, or regular base64 via `AbstractKey`)
         joined, flattened = key.flatten(True)
         parent, kind, id = flattened
+        encoded = self._encode(key)
 
-        # optionally allow adapter to encode key
-        encoded = self.encode_key(joined, flattened)
-
-        if not encoded:
-            # otherwise, use regular base64 via `AbstractKey`
-            encoded = key.urlsafe(joined)
+        # consult the model's entity cache first, if it has one
+        cache = self._cache(kind)
+        cached = cache.lookup([encoded]) if cache is not None else {}
 
         # pass off to delegated `get`
         try:
-            entity = getter((encoded, flattened), **kwargs)
+            if encoded in cached:
+                entity = cached[encoded]
+            else:
+                started = cache.token() if cache is not None else None
+                entity = getter((encoded, flattened), **kwargs)
+                if cache is not None:
+                    cache.fill({encoded: entity}, started)
         except RuntimeError:  # pragma: no cover
             raise
         else:
@@ -176,34 +462,51 @@ class ModelAdapter(object):
 
             :param entity: Object descendent of :py:class:`model.Model`, suitable for
                            storage via the currently-active adapter.
-            :raises ValueError: In the case of an unknown or unregistered *kind*.
+            :raises ValueError: In the case of an unknown or unregistered *kind*, or
+                                of an entity returned by a projection query.
             :returns: New (or updated) key value for the target ``entity``. '''
 
         if self.config.get('debug', False):  # pragma: no cover
             self.logging.info("Saving entity: \"%s\"." % entity)
 
-        # resolve model class
-        _model = self.registry.get(entity.kind())
-        if not _model: raise ValueError('Could not resolve model class "%s".' % entity.kind())
-
+        _model = self._validate(entity)
         with entity:  # enter explicit mode
 
-            # validate entity, will raise validation exceptions
-            for name, value in entity.to_dict(_all=True).items():
-                _model.__dict__[name].valid(entity)
-
             # resolve key if we have a zero-y key or key class
             if not entity.key or entity.key is None:
                 # build an ID-based key
-                ids = self.allocate_ids(_model.__keyclass__, entity.kind())
-                entity._set_key(_model.__keyclass__(entity.kind(), ids))
+                ids = self.allocator.allocate(_model.__keyclass__, entity.kind())
+                entity._set_key(_model.__keyclass__(entity.kind(), ids[0]))
 
             # flatten key/entity
             joined, flattened = entity.key.flatten(True)
 
-        # delegate
-        return self.put((self.encode_key(joined, flattened) or entity.key.urlsafe(joined), flattened),
-                        entity._set_persisted(True), _model, **kwargs)
+        # delegate, then drop any cached copy
+        encoded = self._encode(entity.key)
+        written = self.put((encoded, flattened), entity._set_persisted(True), _model, **kwargs)
+        self._invalidate(((flattened[1], encoded),))
+        return written
+
+    def _validate(self, entity):
+
+        ''' Low-level method for validating an entity before it's persisted.
+
+            :param entity: Object descendent of :py:class:`model.Model`.
+            :raises ValueError: In the case of an unknown or unregistered *kind*, or
+                                of an entity returned by a projection query.
+            :returns: The :py:class:`model.Model` class registered for ``entity``. '''
+
+        # resolve model class
+        _model = self.registry.get(entity.kind())
+        if not _model: raise ValueError('Could not resolve model class "%s".' % entity.kind())
+
+        # partially-populated entities would overwrite the properties they're missing
+        if getattr(entity, '__projection__', None):
+            raise ValueError('Cannot persist projected entity "%s".' % entity.key)
+
+        # validate entity (via the validator generated for its class), will raise validation exceptions
+        _model.__validate__(entity)
+        return _model
 
     def _delete(self, key, **kwargs):
 
@@ -216,7 +519,151 @@ class ModelAdapter(object):
             self.logging.info("Deleting Key: \"%s\"." % key)
 
         joined, flattened = key.flatten(True)
-        return self.delete((self.encode_key(joined, flattened) or key.urlsafe(joined), flattened), **kwargs)
+        encoded = self._encode(key)
+        result = self.delete((encoded, flattened), **kwargs)
+        self._invalidate(((flattened[1], encoded),))
+        return result
+
+    def _get_multi(self, keys, **kwargs):
+
+        ''' Low-level method for retrieving a batch of entities by Key. Fetches
+            and deserializes each entity in as few round-trips as the concrete
+            adapter allows, via :py:meth:`get_multi`.
+
+            :param keys: Iterable of :py:class:`model.Key` instances to retrieve.
+            :returns: ``list`` of inflated :py:class:`model.Model` instances, in the
+                      same order as ``keys``, with ``None`` in place of any entity
+                      that could not be found. '''
+
+        if self.config.get('debug', False):  # pragma: no cover
+            self.logging.info("Retrieving %s entities by Key." % len(keys))
+
+        # flatten and encode each key
+        encoded = []
+        for key in keys:
+            encoded.append((self._encode(key), key.flatten(True)[1]))
+
+        # serve what we can from entity caches, and pass the rest off to delegated `get_multi`
+        cached, started = {}, {}
+        for kind in set((flattened[1] for _, flattened in encoded)):
+            cache = self._cache(kind)
+            if cache is not None:
+                started[kind] = cache.token()
+                cached.update(cache.lookup([joined for joined, flattened in encoded if flattened[1] == kind]))
+        misses = [bundle for bundle in encoded if bundle[0] not in cached]
+
+        if misses:
+            fetched = dict(zip((joined for joined, flattened in misses), self.get_multi(misses, **kwargs)))
+            for kind in started:
+                self._cache(kind).fill(dict(((joined, fetched[joined]) for joined, flattened in misses
+                                             if flattened[1] == kind)), started[kind])
+            cached.update(fetched)
+
+        # inflate keys + models
+        results = []
+        for key, (joined, flattened) in zip(keys, encoded):
+            entity = cached[joined]
+            if entity is None:
+                results.append(None)  # not found
+                continue
+
+            key.__persisted__ = True
+            entity['key'] = key
+            results.append(self.registry[flattened[1]](_persisted=True, **entity))
+        return results
+
+    def _put_multi(self, entities, **kwargs):
+
+        ''' Low-level method for persisting a batch of entities. Validates each
+            entity, allocates IDs for keyless entities in one call per kind, and
+            delegates to :py:meth:`put_multi` for storage.
+
+            :param entities: Iterable of :py:class:`model.Model` instances to persist.
+            :raises ValueError: In the case of an unknown or unregistered *kind*, or
+                                of an entity returned by a projection query.
+            :returns: ``list`` of new (or updated) keys, in the same order as ``entities``. '''
+
+        if self.config.get('debug', False):  # pragma: no cover
+            self.logging.info("Saving %s entities." % len(entities))
+
+        writes, keyless = [], {}
+        for entity in entities:
+            _model = self._validate(entity)
+
+            # queue zero-y keys for batch allocation
+            if not entity.key or entity.key is None:
+                keyless.setdefault(entity.kind(), []).append(entity)
+            writes.append((entity, _model))
+
+        # allocate IDs for keyless entities, at most one reservation per kind
+        for kind, batch in keyless.items():
+            _model = self.registry[kind]
+            for entity, id in zip(batch, self.allocator.allocate(_model.__keyclass__, kind, len(batch))):
+                entity._set_key(_model.__keyclass__(kind, id))
+
+        # flatten keys/entities and delegate
+        bundles = []
+        for entity, _model in writes:
+            bundles.append(((self._encode(entity.key), entity.key.flatten(True)[1]),
+                            entity._set_persisted(True), _model))
+
+        self.put_multi(bundles, **kwargs)
+        self._invalidate(((flattened[1], encoded) for (encoded, flattened), entity, _model in bundles))
+        return [entity.key for entity, _model in writes]
+
+    def _delete_multi(self, keys, **kwargs):
+
+        ''' Low-level method for deleting a batch of entities by Key.
+
+            :param keys: Iterable of :py:class:`model.Key` instances to delete.
+            :returns: ``list`` of delete results, in the same order as ``keys``. '''
+
+        if self.config.get('debug', False):  # pragma: no cover
+            self.logging.info("Deleting %s Keys." % len(keys))
+
+        encoded = []
+        for key in keys:
+            encoded.append((self._encode(key), key.flatten(True)[1]))
+        results = self.delete_multi(encoded, **kwargs)
+        self._invalidate(((flattened[1], joined) for joined, flattened in encoded))
+        return results
+
+    def _cache(self, kind):
+
+        ''' Resolve the read-through :py:class:`cache.EntityCache` for a kind.
+            Caching is enabled per model, with a ``__cache__`` class property:
+            ``True`` for defaults, or a ``dict`` of options (``size``, ``ttl``,
+            ``negative``, ``shared`` and ``shared_ttl``) layered over this
+            adapter's ``cache`` config block (where memcache ``servers`` and
+            the key ``prefix`` usually live).
+
+            :param kind: String kind name.
+            :returns: Cached :py:class:`cache.EntityCache` instance, or ``None``
+                      if the kind's model doesn't enable caching. '''
+
+        if (self.__class__.__name__, kind) not in _caches:
+            spec = getattr(self.registry.get(kind), '__cache__', None)
+            if spec:
+                from . import cache
+                options = dict(self.config.get('cache', {}), **(spec if isinstance(spec, dict) else {}))
+                spec = cache.EntityCache(kind, **options)
+            _caches[(self.__class__.__name__, kind)] = spec or None
+        return _caches[(self.__class__.__name__, kind)]
+
+    def _invalidate(self, keys):
+
+        ''' Drop written or deleted keys from their models' entity caches.
+
+            :param keys: Iterable of ``(<kind>, <encoded key>)`` tuples.
+            :returns: Nothing. '''
+
+        by_kind = {}
+        for kind, encoded in keys:
+            by_kind.setdefault(kind, []).append(encoded)
+        for kind, encoded in by_kind.iteritems():
+            cache = self._cache(kind)
+            if cache is not None:
+                cache.invalidate(encoded)
 
     @classmethod
     def _register(cls, model):
@@ -316,6 +763,88 @@ class ModelAdapter(object):
 
         raise NotImplementedError()
 
+    @classmethod
+    def kind_code(cls, kind):  # pragma: no cover
+
+        ''' Assign (or look up) the :py:class:`KeyCodec` dictionary code for
+            ``kind``, where every process using this adapter can see it. Adapters
+            that store keys compactly *must* override this and :py:meth:`code_kind`.
+
+            :param kind: String ``kind`` name from :py:class:`model.Model` class.
+            :raises: :py:exc:`NotImplementedError`, by default.
+            :returns: Integer code, starting at ``1``. '''
+
+        raise NotImplementedError()
+
+    @classmethod
+    def code_kind(cls, code):  # pragma: no cover
+
+        ''' Look up the kind assigned a :py:class:`KeyCodec` dictionary code by :py:meth:`kind_code`.
+
+            :param code: Integer code.
+            :raises: :py:exc:`NotImplementedError`, by default.
+            :returns: String ``kind`` name, or ``None`` if ``code`` hasn't been assigned. '''
+
+        raise NotImplementedError()
+
+    @classmethod
+    def get_multi(cls, keys, **kwargs):
+
+        ''' Retrieve a batch of entities by :py:class:`model.Key`. Accepts
+            a list of tuples in the same format as :py:meth:`get`. Adapters
+            that can fetch several entities in one round-trip *should*
+            override this - by default, it dispatches :py:meth:`get` once
+            per key.
+
+            :param keys: List of ``(<joined Key repr>, <flattened key>)`` tuples.
+            :returns: ``list`` of raw entities (or ``None``), in the same order as ``keys``. '''
+
+        return [cls.get(key, **kwargs) for key in keys]
+
+    @classmethod
+    def put_multi(cls, writes, **kwargs):
+
+        ''' Persist a batch of entities in storage. Adapters that can write
+            several entities in one round-trip *should* override this - by
+            default, it dispatches :py:meth:`put` once per entity.
+
+            :param writes: List of ``(key, entity, model)`` tuples, in the same
+                           format as the arguments to :py:meth:`put`.
+            :returns: ``list`` of results from the lower-level write operations. '''
+
+        return [cls.put(key, entity, model, **kwargs) for key, entity, model in writes]
+
+    @classmethod
+    def delete_multi(cls, keys, **kwargs):
+
+        ''' Delete a batch of entities by :py:class:`model.Key`. Adapters that
+            can delete several entities in one round-trip *should* override
+            this - by default, it dispatches :py:meth:`delete` once per key.
+
+            :param keys: List of ``(<joined Key repr>, <flattened key>)`` tuples.
+            :returns: ``list`` of results from the lower-level delete operations. '''
+
+        return [cls.delete(key, **kwargs) for key in keys]
+
+    @classmethod
+    def _encode(cls, key):
+
+        ''' Encode a :py:class:`model.Key` via :py:meth:`encode_key`, falling back
+            to :py:meth:`model.Key.urlsafe`. Memoized on the key, per adapter, in
+            ``__encoded__`` (which is dropped if the key's parts change).
+
+            :param key: Target :py:class:`model.Key` to encode.
+            :returns: The encoded key. '''
+
+        memo = key.__dict__.get('__encoded__')
+        if memo is None:
+            memo = key.__dict__['__encoded__'] = {}
+
+        if cls.__name__ not in memo:
+            joined, flattened = key.flatten(True)
+            memo[cls.__name__] = cls.encode_key(joined, flattened) or key.urlsafe(joined)
+        return memo[cls.__name__]
+
     @classmethod
     def encode_key(cls, key, joined=None, flattened=None):  # pragma: no cover
 
@@ -382,8 +911,8 @@ class IndexedModelAdapter(ModelAdapter):
                 :param date: Python ``date`` to convert.
                 :returns: Tupled ``(<magic date code>, <flattened date>)`` to add to the index. '''
 
-            # convert to ISO format, return date with magic
-            return (cls._magic['date'], _date.isoformat())
+            # convert to a (sortable) day ordinal, return date with magic
+            return (cls._magic['date'], _date.toordinal())
 
         @classmethod
         def convert_time(cls, _time):
@@ -394,8 +923,9 @@ class IndexedModelAdapter(ModelAdapter):
                 :returns: Tupled ``(<magic time code>, <flattened time>)``, suitable
                           for addition to the index. '''
 
-            # convert to ISO format, return time with magic
-            return (cls._magic['time'], _time.isoformat())
+            # convert to (sortable) seconds since midnight, return time with magic
+            return (cls._magic['time'], (_time.hour * 3600) + (_time.minute * 60) + _time.second + (
+                    _time.microsecond / 1000000.0))
 
         @classmethod
         def convert_datetime(cls, _datetime):
@@ -442,22 +972,108 @@ class IndexedModelAdapter(ModelAdapter):
         # index writes (assuming async is supported in the underlying driver)
 
         _indexed_properties = self._pluck_indexed(entity)
+        _changes = self._diff_indexed(entity, _indexed_properties)  # before the write resets dirty flags
 
         # delegate write up the chain
         written_key = super(IndexedModelAdapter, self)._put(entity, **kwargs)
 
-        # proxy to `generate_indexes` and write indexes
-        if not _indexed_properties:
-            origin, meta = self.generate_indexes(entity.key)
-            property_map = {}
-        else:
-            origin, meta, property_map = self.generate_indexes(entity.key, _indexed_properties)
-
-        self.write_indexes((origin, meta, property_map), **kwargs)
+        # proxy to `generate_indexes` and write (or incrementally update) indexes
+        if _changes is None:
+            self.write_indexes(self._generate_writes(entity.key, _indexed_properties), **kwargs)
+        elif _changes[1] or _changes[2]:
+            self.update_indexes(_changes, **kwargs)
 
         # delegate up the chain for entity write
         return written_key
 
+    def _put_multi(self, entities, **kwargs):
+
+        ''' Hook to trigger index writes for a batch of entities.
+            Defers up the chain to :py:class:`ModelAdapter` for the
+            entity writes, then writes indexes for each entity.
+
+            :param entities: Iterable of :py:class:`model.Model` entities to persist.
+            :returns: ``list`` of resulting :py:class:`model.Key` objects. '''
+
+        # pluck indexed properties and diff them before entities are marked as persisted
+        _indexed_properties = [self._pluck_indexed(entity) for entity in entities]
+        _changes = [self._diff_indexed(entity, properties) for entity, properties in zip(entities, _indexed_properties)]
+
+        # delegate writes up the chain
+        written_keys = super(IndexedModelAdapter, self)._put_multi(entities, **kwargs)
+
+        for entity, properties, changes in zip(entities, _indexed_properties, _changes):
+            if changes is None:
+                self.write_indexes(self._generate_writes(entity.key, properties), **kwargs)
+            elif changes[1] or changes[2]:
+                self.update_indexes(changes, **kwargs)
+
+        return written_keys
+
+    def _delete_multi(self, keys, **kwargs):
+
+        ''' Hook to trigger index cleanup for a batch of keys. Defers
+            up the chain to :py:class:`ModelAdapter` after cleaning
+            indexes for each target key.
+
+            :param keys: Iterable of :py:class:`model.Key` objects to delete.
+            :returns: ``list`` of delete results. '''
+
+        for key in keys:
+            self.clean_indexes(self.generate_indexes(key), **kwargs)
+
+        # delegate delete up the chain
+        return super(IndexedModelAdapter, self)._delete_multi(keys, **kwargs)
+
+    def _diff_indexed(self, entity, properties):
+
+        ''' Diff the indexed properties of an entity against their stored
+            values, so only index entries for properties that actually
+            changed need to be touched. Stored values are tracked by the
+            entity itself, in ``__previous__``, as properties are dirtied.
+
+            :param entity: Entity :py:class:`model.Model` about to be persisted.
+            :param properties: Map of indexed properties, from :py:meth:`_pluck_indexed`.
+            :returns: Tupled ``(encoded_key, removals, additions)`` of property
+                      index entries (in the format yielded by :py:meth:`generate_indexes`),
+                      or ``None`` if the entity wasn't inflated from storage and all
+                      of its indexes must be written. '''
+
+        if entity.__previous__ is None or not entity.key:
+            return None  # new (or re-constructed) entity: full write
+
+        removals, additions = [], []
+        for name, previous in entity.__previous__.iteritems():
+            prop = entity.__class__.__dict__[name]
+            if not prop._indexed:
+                continue
+
+            current = properties.get(name, (prop, entity._get_value(name, default=prop._sentinel)))[1]
+            if current == previous and type(current) is type(previous):
+                continue  # re-set to the same value
+
+            # entries under the stored value go, entries under the new one arrive
+            if previous is not prop._sentinel:
+                removals.extend(self.generate_indexes(entity.key, {name: (prop, previous)})[2])
+            if name in properties:
+                additions.extend(self.generate_indexes(entity.key, {name: properties[name]})[2])
+
+        return self._encode(entity.key), removals, additions
+
+    def _generate_writes(self, key, properties):
+
+        ''' Generate a full index write bundle for a key and its indexed
+            properties, suitable for passing to :py:meth:`write_indexes`.
+
+            :param key: Target :py:class:`model.Key` to index.
+            :param properties: Map of indexed properties, from :py:meth:`_pluck_indexed`.
+            :returns: Tupled ``(encoded_key, meta_indexes, property_indexes)``. '''
+
+        if not properties:
+            origin, meta = self.generate_indexes(key)
+            return origin, meta, {}
+        return self.generate_indexes(key, properties)
+
     def _delete(self, key, **kwargs):
 
         ''' Hook to trigger index cleanup for a given key. Defers
@@ -468,10 +1084,10 @@ class IndexedModelAdapter(ModelAdapter):
             :returns: Result of delete operation. '''
 
         # generate meta indexes only, then clean
-        self.clean_indexes(self.generate_indexes(key))
+        self.clean_indexes(self.generate_indexes(key), **kwargs)
 
         # delegate delete up the chain
-        return super(IndexedModelAdapter, self)._delete(key)
+        return super(IndexedModelAdapter, self)._delete(key, **kwargs)
 
     def _pluck_indexed(self, entity):
 
@@ -507,7 +1123,7 @@ class IndexedModelAdapter(ModelAdapter):
         if key is not None:
 
             # provision vars, generate meta indexes
-            encoded_key = cls.encode_key(*key.flatten(True)) or key.urlsafe()
+            encoded_key = cls._encode(key)
             _meta_indexes.append((cls._key_prefix,))
             _meta_indexes.append((cls._kind_prefix, key.kind))  # map kind to encoded key
 
@@ -523,14 +1139,15 @@ class IndexedModelAdapter(ModelAdapter):
                 root_key = [i for i in key.ancestry][0]
 
                 # encode root key
-                encoded_root_key = cls.encode_key(root_key) or root_key.urlsafe()
+                encoded_root_key = cls._encode(root_key)
 
                 _meta_indexes.append((cls._group_prefix, encoded_root_key))
 
         # add property index entries
         if properties:
 
-            # we're applying writes
+            # we're applying writes (resolving the basetype map once, rather than per value)
+            basetypes = cls._index_basetypes
             for k, v in properties.items():
 
                 # extract property class and value
@@ -543,7 +1160,7 @@ class IndexedModelAdapter(ModelAdapter):
                 # iterate through property values
                 for v in value:
                     context = (cls._index_prefix, key.kind, k, v)
-                    _property_indexes.append((cls._index_basetypes.get(prop._basetype, basestring), context))
+                    _property_indexes.append((basetypes.get(prop._basetype, basestring), context))
 
                 continue
 
@@ -592,6 +1209,21 @@ class IndexedModelAdapter(ModelAdapter):
 
         raise NotImplementedError()
 
+    @abc.abstractmethod
+    def update_indexes(cls, writes, **kwargs):  # pragma: no cover
+
+        ''' Incrementally update the indexes of a persisted entity,
+            removing entries for stored property values and adding
+            entries for new ones, as calculated by :py:meth:`_diff_indexed`.
+            This method is abstract and **must** be overridden by
+            concrete implementors of :py:class:`IndexedModelAdapter`.
+
+            :param writes: Tupled ``(encoded_key, removals, additions)``
+                           of property index entries.
+            :raises: :py:exc:`NotImplementedError`, as this method is abstract. '''
+
+        raise NotImplementedError()
+
     @abc.abstractmethod
     def execute_query(cls, kind, spec, options, **kwargs):  # pragma: no cover
 
@@ -604,6 +1236,61 @@ class IndexedModelAdapter(ModelAdapter):
 
         raise NotImplementedError()
 
+    @classmethod
+    def explain_query(cls, kind, spec, options, **kwargs):
+
+        ''' Explain how a query, specified by ``spec``, would
+            be executed, without executing it. Adapters that
+            plan queries override this.
+
+            :param spec: Object specification (:py:class:`model.Query`)
+                         specifying the query to explain.
+            :raises: :py:exc:`NotImplementedError`, unless overridden. '''
+
+        raise NotImplementedError('Adapter "%s" does not support query plans.' % cls.__name__)
+
+    @classmethod
+    def count_query(cls, kind, spec, options, **kwargs):
+
+        ''' Count the results of a query, specified by ``spec``.
+            Adapters that can count from their indexes override
+            this - by default, matching keys are fetched and
+            counted.
+
+            :param spec: Object specification (:py:class:`model.Query`)
+                         specifying the query to count.
+            :returns: Count of matching entities (``int``). '''
+
+        options._set_option('keys_only', True)
+        return len(cls.execute_query(kind, spec, options))
+
+    @classmethod
+    def aggregate_query(cls, kind, spec, options, prop, function, **kwargs):
+
+        ''' Aggregate a numeric property over the results of a
+            query, specified by ``spec``. Adapters that can
+            aggregate from their indexes override this - by
+            default, matching entities are fetched.
+
+            :param spec: Object specification (:py:class:`model.Query`)
+                         specifying the query to aggregate.
+            :param prop: :py:class:`model.Property` to aggregate.
+            :param function: ``'sum'``, ``'min'``, ``'max'`` or ``'avg'``.
+            :returns: Aggregated value, or ``None`` if nothing matched
+                      (except for ``sum``, which is then ``0``). '''
+
+        values = []
+        for entity in cls.execute_query(kind, spec, options):
+            value = entity._get_value(prop.name, default=prop._sentinel)
+            if value is not prop._sentinel and value is not None:
+                values.extend(value if prop._repeated else [value])
+
+        if function == 'sum':
+            return sum(values)
+        if not values:
+            return None
+        return {'min': min, 'max': max, 'avg': lambda v: sum(v) / float(len(v))}[function](values)
+
 
 ## Mixin
 # Metaclass for registering mixins and applying them later.
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+    apptools model adapter: cache
+
+    read-through entity caching, in front of any
+    model adapter: a bounded in-process LRU, backed
+    by memcache where it's available.
+
+    :author: Sam Gammon <sam@momentum.io>
+    :copyright: (c) momentum labs, 2013
+    :license: The inspection, use, distribution, modification or implementation
+              of this source code is governed by a private license - all rights
+              are reserved by the Authors (collectively, "momentum labs, ltd")
+              and held under relevant California and US Federal Copyright laws.
+              For full details, see ``LICENSE.md`` at the root of this project.
+              Continued inspection of this source code demands agreement with
+              the included license and explicitly means acceptance to these terms.
+
+'''
+
+
+# stdlib
+import time
+import hashlib
+import threading
+import collections
+
+# memcache (App Engine, then `python-memcached`)
+try:
+    from google.appengine.api import memcache
+except ImportError as e:  # pragma: no cover
+    try:
+        import memcache
+    except ImportError as e:
+        memcache, _APPENGINE = None, False
+    else:
+        _APPENGINE = False
+else:  # pragma: no cover
+    _APPENGINE = True
+
+
+## Globals
+_MISSING = '__apptools_cache_missing__'  # stands in for a negatively-cached entity in memcache
+_LOCKED = '__apptools_cache_locked__'  # marks a memcache key as invalidated (or reserved by a reader)
+_INVALIDATED = object()  # marks a locally-invalidated key, until its TTL runs out
+
+
+## EntityCache
+# Two-tier read-through cache for raw entities, keyed by encoded key.
+class EntityCache(object):
+
+    ''' Caches raw entities (as returned by an adapter's ``get``) for one
+        model. Tier one is a bounded, in-process LRU with a TTL. Tier two
+        is memcache, shared across processes, and only consulted when a
+        client is available (always on App Engine, elsewhere when memcache
+        ``servers`` are configured).
+
+        Entities that don't exist are cached too, for the (shorter)
+        ``negative`` TTL. Writes and deletes invalidate both tiers, and
+        leave a local marker behind so a read that started before the
+        invalidation (per :py:meth:`token`) can't fill the LRU with what
+        it read.
+
+        Memcache is guarded the way ndb guards it: invalidations write a
+        short-lived lock value, and a lookup that misses reserves the key
+        (locking it unless it already is, and noting its CAS ID). Fills
+        then ``cas`` against that reservation, so a stale read from any
+        process can't overwrite an invalidation that landed during it. '''
+
+    size = 1000  # maximum number of entities held in process
+    ttl = 60  # seconds - lifetime of entities held in process
+    negative = 5  # seconds - lifetime of cached misses, in either tier
+    shared_ttl = 300  # seconds - lifetime of entities held in memcache
+    lock_ttl = 32  # seconds - lifetime of invalidation locks and read reservations in memcache
+    prefix = 'apptools:entity:'  # prefix for memcache keys
+
+    def __init__(self, kind, size=None, ttl=None, negative=None, shared=True, shared_ttl=None, servers=None,
+                 prefix=None, client=None):
+
+        ''' Initialize this :py:class:`EntityCache`.
+
+            :param kind: String kind name of the cached model, used to namespace memcache keys.
+            :param size: Maximum number of entities held in process.
+            :param ttl: Lifetime, in seconds, of entities held in process.
+            :param negative: Lifetime, in seconds, of cached misses.
+            :param shared: Whether to use memcache as a second tier. Defaults to ``True``.
+            :param shared_ttl: Lifetime, in seconds, of entities held in memcache.
+            :param servers: ``list`` of memcache servers, where not on App Engine.
+            :param prefix: Prefix for memcache keys.
+            :param client: Explicit memcache client, overriding ``servers``. '''
+
+        self.kind, self.lock, self.entries, self.sequence = kind, threading.Lock(), collections.OrderedDict(), 0
+        self.local = threading.local()  # memcache keys reserved by this thread's lookups
+        self.size, self.ttl, self.negative, self.shared_ttl, self.prefix = (
+            size or self.size, ttl or self.ttl, negative or self.negative, shared_ttl or self.shared_ttl,
+            (prefix or self.prefix) + kind + ':')
+
+        self.client = client
+        if client is None and shared and memcache is not None and (_APPENGINE or servers):
+            self.client = memcache.Client() if _APPENGINE else memcache.Client(servers, cache_cas=True)
+
+    def token(self):
+
+        ''' Mark the start of a read from the underlying adapter, to pass to :py:meth:`fill`.
+
+            :returns: Opaque token, ordered against invalidations. '''
+
+        return self.sequence
+
+    def lookup(self, keys):
+
+        ''' Look up encoded keys, in process and then in memcache. Entities
+            found in memcache are promoted into the process tier.
+
+            :param keys: Iterable of encoded keys.
+            :returns: ``dict`` of cached raw entities (``None`` for cached
+            misses) by encoded key. Keys that aren't cached are left out. '''
+
+        found, missing, now, started = {}, [], time.time(), self.sequence
+        with self.lock:
+            for encoded in keys:
+                entry = self.entries.get(encoded)
+                if entry is None or entry[1] is _INVALIDATED:
+                    missing.append(encoded)
+                    continue
+                if entry[0] < now:
+                    del self.entries[encoded]
+                    missing.append(encoded)
+                    continue
+
+                # refresh recency
+                del self.entries[encoded]
+                self.entries[encoded] = entry
+                found[encoded] = self._copy(entry[1])
+
+        if missing and self.client is not None:
+            shared = self.client.get_multi([self._shared_key(encoded) for encoded in missing])
+            promoted, unfilled = {}, []
+            for encoded in missing:
+                value = shared.get(self._shared_key(encoded))
+                if value is None or value == _LOCKED:
+                    unfilled.append(self._shared_key(encoded))
+                else:
+                    promoted[encoded] = None if value == _MISSING else value
+            self._reserve(unfilled)
+            for encoded, value in self._store(promoted, started).iteritems():
+                found[encoded] = self._copy(value)
+        return found
+
+    def fill(self, entities, started):
+
+        ''' Cache raw entities read from the underlying adapter.
+
+            :param entities: ``dict`` of raw entities (or ``None``, for entities
+            that weren't found) by encoded key.
+            :param started: Token from :py:meth:`token`, taken as the read began.
+            Keys invalidated since then are skipped.
+            :returns: Nothing. '''
+
+        stored = self._store(dict(((k, self._copy(v)) for k, v in entities.iteritems())), started)
+
+        # only keys reserved by a lookup reach memcache, and only if nothing invalidated them since
+        if self.client is not None:
+            reserved = self._reserved()
+            for encoded in entities:
+                shared = self._shared_key(encoded)
+                if shared not in reserved:
+                    continue
+                reserved.discard(shared)
+                if encoded in stored:
+                    value = stored[encoded]
+                    self.client.cas(shared, _MISSING if value is None else value,
+                                    time=self.negative if value is None else self.shared_ttl)
+
+    def invalidate(self, keys):
+
+        ''' Drop encoded keys from both tiers, after a write or delete.
+
+            :param keys: Iterable of encoded keys.
+            :returns: Nothing. '''
+
+        keys, now = list(keys), time.time()
+        with self.lock:
+            self.sequence += 1
+            for encoded in keys:
+                self.entries.pop(encoded, None)
+                self.entries[encoded] = (now + self.ttl, _INVALIDATED, self.sequence)
+            self._trim()
+
+        # lock (rather than delete) shared entries, so in-flight reservations elsewhere fail their `cas`
+        if self.client is not None:
+            self.client.set_multi(dict(((self._shared_key(encoded), _LOCKED) for encoded in keys)),
+                                  time=self.lock_ttl)
+
+    def clear(self):
+
+        ''' Drop every entity held in process. Memcache entries are left to expire.
+
+            :returns: Nothing. '''
+
+        with self.lock:
+            self.entries.clear()
+
+    def _store(self, entities, started):
+
+        ''' Hold raw entities in process, evicting the least-recently-used
+            entries past ``size``.
+
+            :param entities: ``dict`` of raw entities (or ``None``) by encoded key.
+            :param started: Token taken as the entities were read. Keys invalidated since then are skipped.
+            :returns: ``dict`` of the entities that were stored. '''
+
+        now = time.time()
+        with self.lock:
+            stored = {}
+            for encoded, value in entities.iteritems():
+                if self._invalidated(encoded, started, now):
+                    continue
+                self.entries.pop(encoded, None)
+                self.entries[encoded] = (now + (self.negative if value is None else self.ttl), value, None)
+                stored[encoded] = value
+            self._trim()
+        return stored
+
+    def _reserve(self, keys):
+
+        ''' Reserve memcache keys ahead of a read from the underlying adapter: each is locked unless it
+            already is, and its CAS ID noted (by the client) for :py:meth:`fill`.
+
+            :param keys: ``list`` of memcache keys.
+            :returns: Nothing. '''
+
+        if not keys:
+            return
+        self.client.add_multi(dict(((key, _LOCKED) for key in keys)), time=self.lock_ttl)
+        reserved = self._reserved()
+        for key in keys:
+            if self.client.gets(key) == _LOCKED:
+                reserved.add(key)
+
+    def _reserved(self):
+
+        ''' Memcache keys reserved by this thread's lookups, and not yet filled. '''
+
+        if not hasattr(self.local, 'reserved'):
+            self.local.reserved = set()
+        return self.local.reserved
+
+    def _trim(self):
+
+        ''' Evict least-recently-used entries past ``size``. Must be called under ``lock``. '''
+
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def _invalidated(self, encoded, started, now):
+
+        ''' Check whether a key was invalidated since ``started``. Must be called under ``lock``. '''
+
+        entry = self.entries.get(encoded)
+        return entry is not None and entry[1] is _INVALIDATED and entry[2] > started and entry[0] >= now
+
+    def _shared_key(self, encoded):
+
+        ''' Build a memcache-safe key (bounded length, no whitespace) for an encoded key. '''
+
+        return self.prefix + hashlib.sha1(encoded).hexdigest()
+
+    @staticmethod
+    def _copy(value):
+
+        ''' Copy a raw entity (and its repeated values), so callers can't mutate cached state. '''
+
+        if value is None:
+            return None
+        return dict(((name, list(item) if isinstance(item, list) else item) for name, item in value.iteritems()))
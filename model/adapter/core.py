@@ -29,10 +29,18 @@ from abstract import KeyMixin
 from abstract import ModelMixin
 from abstract import IndexedModelAdapter
 
+# request-scoped sessions
+from session import Session
+
 # apptools util
 from apptools.util import json
 
 
+## Globals
+_interned = {}  # persisted keys decoded by `from_urlsafe` (or by adapters), by class and encoded key
+_intern_limit = 4096  # maximum number of interned keys
+
+
 ## AdaptedKey
 # Provides bridging between `Key` and the Adapter API.
 class AdaptedKey(KeyMixin):
@@ -44,32 +52,63 @@ class AdaptedKey(KeyMixin):
 
         ''' Retrieve a previously-constructed key from available persistence mechanisms. '''
 
+        session = Session.current()
+        if session is not None: return session.get(self.__adapter__, self)
         return self.__adapter__._get(self)
 
     def delete(self):
 
         ''' Delete a previously-constructed key from available persistence mechanisms. '''
 
-        if self.__owner__:
-            return self.__owner__.__adapter__._delete(self)  # if possible, delegate to owner model
-        return self.__class__.__adapter__._delete(self)
+        adapter = self.__owner__.__adapter__ if self.__owner__ else self.__class__.__adapter__  # if possible, delegate to owner model
+        session = Session.current()
+        if session is not None: return session.delete(adapter, self)
+        return adapter._delete(self)
 
     def flatten(self, join=False):
 
-        ''' Flatten this Key into a basic structure suitable for transport or storage. '''
+        ''' Flatten this Key into a basic structure suitable for transport or storage. Memoized
+            on the Key (in ``__flattened__``) until one of its parts is written. '''
+
+        memo = self.__dict__.get('__flattened__')
+        if memo is not None and join in memo: return memo[join]
 
         flattened = tuple((i if not isinstance(i, self.__class__) else i.flatten(join)) for i in map(lambda x: getattr(self, x), reversed(self.__schema__)))
-        if join: return self.__class__.__separator__.join([u'' if i is None else unicode(i) for i in map(lambda x: x[0] if isinstance(x, tuple) else x, flattened)]), flattened
+        if join: flattened = self.__class__.__separator__.join([u'' if i is None else unicode(i) for i in map(lambda x: x[0] if isinstance(x, tuple) else x, flattened)]), flattened
+        self.__dict__.setdefault('__flattened__', {})[join] = flattened
         return flattened
 
     def urlsafe(self, joined=None):
 
-        ''' Generate an encoded version of this Key, suitable for use in URLs. '''
+        ''' Generate an encoded version of this Key, suitable for use in URLs. Memoized like `flatten`. '''
 
         if not joined: joined, flat = self.flatten(True)
-        return base64.b64encode(joined)
+        memo = self.__dict__.get('__urlsafe__')
+        if memo is not None and memo[0] == joined: return memo[1]
+
+        encoded = base64.b64encode(joined)
+        self.__dict__['__urlsafe__'] = (joined, encoded)
+        return encoded
 
     ## = Class Methods = ##
+    @classmethod
+    def get_multi(cls, keys):
+
+        ''' Retrieve a batch of previously-constructed keys from available persistence mechanisms, in one adapter call. '''
+
+        session = Session.current()
+        if session is not None: return session.get_multi(cls.__adapter__, keys)
+        return cls.__adapter__._get_multi(keys)
+
+    @classmethod
+    def delete_multi(cls, keys):
+
+        ''' Delete a batch of previously-constructed keys from available persistence mechanisms, in one adapter call. '''
+
+        session = Session.current()
+        if session is not None: return session.delete_multi(cls.__adapter__, keys)
+        return cls.__adapter__._delete_multi(keys)
+
     @classmethod
     def from_raw(cls, encoded, **kwargs):
 
@@ -91,9 +130,26 @@ class AdaptedKey(KeyMixin):
     @classmethod
     def from_urlsafe(cls, encoded, _persisted=False):
 
-        ''' Inflate a Key from a URL-encoded representation. '''
+        ''' Inflate a Key from a URL-encoded representation. Persisted keys are decoded once (into
+            a bounded intern table), then copied - keys are bound to their owners, so aren't shared. '''
+
+        if not _persisted: return cls.from_raw(base64.b64decode(encoded), _persisted=_persisted)
+        return cls._intern(encoded, lambda: cls.from_raw(base64.b64decode(encoded), _persisted=True))
+
+    @classmethod
+    def _intern(cls, encoded, decode):
+
+        ''' Resolve a persisted Key by its encoded form, calling `decode` only the first time it's seen. '''
 
-        return cls.from_raw(base64.b64decode(encoded), _persisted=_persisted)
+        interned = _interned.get((cls, encoded))
+        if interned is None:
+            if len(_interned) >= _intern_limit: _interned.popitem()  # evict an arbitrary key
+            interned = _interned[(cls, encoded)] = decode()
+            interned.flatten(), interned.urlsafe()  # warm memos, so copies share them
+
+        key = cls.__new__(cls)  # bare instance, skipping part validation
+        key.__dict__.update(interned.__dict__)
+        return key
 
 
 ## AdaptedModel
@@ -109,13 +165,49 @@ class AdaptedModel(ModelMixin):
         ''' Retrieve a persisted version of this model via the current datastore adapter. '''
 
         if not key and not name: raise ValueError('Must pass either a Key or key name into `%s.get`.' % cls.kind())
-        if name: return cls.__adapter__._get(cls.__keyclass__(cls.kind(), name), **kwargs)  # if we're passed a name, construct a key with the local kind
-        if isinstance(key, basestring):
+        if name: key = cls.__keyclass__(cls.kind(), name)  # if we're passed a name, construct a key with the local kind
+        elif isinstance(key, basestring):
             key = cls.__keyclass__.from_urlsafe(key)  # assume URL-encoded key, this is user-facing
         elif isinstance(key, (list, tuple)):
             key = cls.__keyclass__(*key)  # an ordered partslist is fine too
+
+        session = Session.current()
+        if session is not None and not kwargs: return session.get(cls.__adapter__, key)
         return cls.__adapter__._get(key, **kwargs)
 
+    @classmethod
+    def get_multi(cls, keys, **kwargs):
+
+        ''' Retrieve a batch of persisted entities of this model via the current datastore adapter, in one call. '''
+
+        # accept URL-encoded keys and ordered partslists, like `get`
+        keys = [cls.__keyclass__.from_urlsafe(key) if isinstance(key, basestring) else (
+                cls.__keyclass__(*key) if isinstance(key, (list, tuple)) else key) for key in keys]
+
+        session = Session.current()
+        if session is not None and not kwargs: return session.get_multi(cls.__adapter__, keys)
+        return cls.__adapter__._get_multi(keys, **kwargs)
+
+    @classmethod
+    def put_multi(cls, entities, adapter=None, **kwargs):
+
+        ''' Persist a batch of entities via the current datastore adapter, in one call. '''
+
+        if not adapter: adapter = cls.__adapter__  # Allow adapter override
+        session = Session.current()
+        if session is not None and not kwargs: return session.put_multi(adapter, entities)
+        return adapter._put_multi(entities, **kwargs)
+
+    @classmethod
+    def delete_multi(cls, keys, adapter=None, **kwargs):
+
+        ''' Discard any primary or index-based data linked to a batch of Keys, in one call. '''
+
+        if not adapter: adapter = cls.__adapter__  # Allow adapter override
+        session = Session.current()
+        if session is not None and not kwargs: return session.delete_multi(adapter, keys)
+        return adapter._delete_multi(keys, **kwargs)
+
     @classmethod
     def query(cls, *args, **kwargs):
 
@@ -135,6 +227,8 @@ class AdaptedModel(ModelMixin):
         ''' Persist this entity via the current datastore adapter. '''
 
         if not adapter: adapter = self.__class__.__adapter__  # Allow adapter override
+        session = Session.current()
+        if session is not None and not kwargs: return session.put(adapter, self)
         return adapter._put(self, **kwargs)
 
     def delete(self, adapter=None, **kwargs):
@@ -142,6 +236,8 @@ class AdaptedModel(ModelMixin):
         ''' Discard any primary or index-based data linked to this Key. '''
 
         if not adapter: adapter = self.__class__.__adapter__  # Allow adapter override
+        session = Session.current()
+        if session is not None and not kwargs: return session.delete(adapter, self.__key__)
         return adapter._delete(self.__key__, **kwargs)
 
 
@@ -163,6 +259,10 @@ class DictMixin(KeyMixin, ModelMixin):
 
         ''' Export this Entity as a dictionary, excluding/including/filtering/mapping as we go. '''
 
+        # without options, defer to the serializer generated for this model class
+        if not (exclude or include or filter or map) and hasattr(self, '__to_dict__'):
+            return self.__to_dict__(self, _all)
+
         dictionary = {}  # return dictionary
         _default_map = False  # flag for default map lambda, so we can exclude only on custom map
         _default_include = False  # flag for including properties unset and explicitly listed in a custom inclusion list
@@ -21,8 +21,13 @@
 
 
 # stdlib
+import time
 import json
 import base64
+import bisect
+import datetime
+import threading
+import contextlib
 
 # adapter API
 from .abstract import IndexedModelAdapter
@@ -32,6 +37,8 @@ from .abstract import IndexedModelAdapter
 _init = False
 _metadata = {}
 _datastore = {}
+_lock = threading.RLock()  # guards first init, global counters and indexes shared across kinds
+_stripes = tuple((threading.RLock() for x in xrange(64)))  # guard entities and indexes, striped by kind
 
 
 ## InMemoryAdapter
@@ -56,23 +63,25 @@ class InMemoryAdapter(IndexedModelAdapter):
         global _metadata
 
         # perform first init, if it hasn't been done
-        if not _init:
-            _init, _metadata = True, {
-                'ops': {  # holds count of performed operations
-                    'get': 0,  # track # of entity get() operations
-                    'put': 0,  # track # of entity put() operations
-                    'delete': 0  # track # of entity delete() operations
-                },
-                'kinds': {},  # holds current count and ID increment pointer for each kind
-                'global': {  # holds global metadata, like entity count across kind classes
-                    'entity_count': 0  # holds global count of all entities
-                },
-                cls._key_prefix: set([]),  # full, simple indexed set of all keys
-                cls._kind_prefix: {},  # maps keys to their kinds
-                cls._group_prefix: {},  # maps keys to their entity groups
-                cls._index_prefix: {},  # maps property values to keys
-                cls._reverse_prefix: {}  # maps keys to indexes they are present in
-            }
+        with _lock:
+            if not _init:
+                _init, _metadata = True, {
+                    'ops': {  # holds count of performed operations
+                        'get': 0,  # track # of entity get() operations
+                        'put': 0,  # track # of entity put() operations
+                        'delete': 0  # track # of entity delete() operations
+                    },
+                    'kinds': {},  # holds current count and ID increment pointer for each kind
+                    'global': {  # holds global metadata, like entity count across kind classes
+                        'entity_count': 0  # holds global count of all entities
+                    },
+                    cls._key_prefix: set([]),  # full, simple indexed set of all keys
+                    cls._kind_prefix: {},  # maps keys to their kinds
+                    cls._group_prefix: {},  # maps keys to their entity groups
+                    cls._index_prefix: {},  # maps property values to keys
+                    'sorted': {},  # maps properties to their values and keys, in bisect-maintained sorted lists
+                    cls._reverse_prefix: {}  # maps keys to indexes they are present in
+                }
 
         # pass up the chain to create a singleton
         return super(InMemoryAdapter, cls).acquire(name, bases, properties)
@@ -85,92 +94,171 @@ class InMemoryAdapter(IndexedModelAdapter):
         # always supported: used in dev/debug, RAM is always there
         return True
 
+    @classmethod
+    @contextlib.contextmanager
+    def _locked(cls, kinds):
+
+        ''' Hold the lock stripes guarding a set of kinds, acquired in stripe
+            order (so overlapping batches can't deadlock). Stripes are
+            reentrant, so locked operations may nest.
+
+            :param kinds: Iterable of string kind names.
+            :returns: Context manager, holding the stripes while entered. '''
+
+        stripes = [_stripes[i] for i in sorted(set((hash(kind) % len(_stripes) for kind in kinds)))]
+        for stripe in stripes:
+            stripe.acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                stripe.release()
+
+    def _put(self, entity, **kwargs):
+
+        ''' Persist an entity and its indexes under its kind's lock stripe. '''
+
+        with self._locked((entity.kind(),)):
+            return super(InMemoryAdapter, self)._put(entity, **kwargs)
+
+    def _put_multi(self, entities, **kwargs):
+
+        ''' Persist a batch of entities and their indexes under their kinds' lock stripes. '''
+
+        with self._locked((entity.kind() for entity in entities)):
+            return super(InMemoryAdapter, self)._put_multi(entities, **kwargs)
+
+    def _delete(self, key, **kwargs):
+
+        ''' Delete an entity and clean its indexes under its kind's lock stripe. '''
+
+        with self._locked((key.kind,)):
+            return super(InMemoryAdapter, self)._delete(key, **kwargs)
+
+    def _delete_multi(self, keys, **kwargs):
+
+        ''' Delete a batch of entities and clean their indexes under their kinds' lock stripes. '''
+
+        with self._locked((key.kind for key in keys)):
+            return super(InMemoryAdapter, self)._delete_multi(keys, **kwargs)
+
     @classmethod
     def get(cls, key, **kwargs):
 
         ''' Retrieve an entity by Key from Python RAM. '''
 
-        global _metadata
+        return cls.get_multi([key], **kwargs)[0]
 
-        # key format: tuple(<str encoded key>, <tuple flattened key>)
-        encoded, flattened = key
-        parent, kind, id = flattened
+    @classmethod
+    def get_multi(cls, keys, **kwargs):
 
-        # pull from in-memory backend
-        entity = _datastore.get(encoded)
-        if entity is None: return  # not found
+        ''' Retrieve a batch of entities by Key from Python RAM. '''
 
-        _metadata['ops']['get'] = _metadata['ops']['get'] + 1
+        global _metadata
 
-        # construct + inflate entity
-        return entity
+        # key format: tuple(<str encoded key>, <tuple flattened key>), copied so inflation can't touch storage
+        entities = [_datastore.get(encoded) for encoded, flattened in keys]
+        entities = [dict(entity) if entity is not None else None for entity in entities]
+
+        with _lock:
+            _metadata['ops']['get'] = _metadata['ops']['get'] + sum((1 for entity in entities if entity is not None))
+
+        # construct + inflate entities
+        return entities
 
     @classmethod
     def put(cls, key, entity, model, **kwargs):
 
         ''' Persist an entity to storage in Python RAM. '''
 
+        return cls.put_multi([(key, entity, model)], **kwargs)[0]
+
+    @classmethod
+    def put_multi(cls, writes, **kwargs):
+
+        ''' Persist a batch of entities to storage in Python RAM. '''
+
         global _metadata
         global _datastore
 
-        # encode key and flatten
-        encoded, flattened = key
+        written = []
+        with cls._locked((flattened[1] for (encoded, flattened), entity, model in writes)):
+            for key, entity, model in writes:
 
-        # perform validation
-        with entity:
+                # encode key and flatten
+                encoded, flattened = key
 
-            if entity.key.kind not in _metadata['kinds']:  # pragma: no cover
-                _metadata['kinds'][entity.key.kind] = {
-                    'id_pointer': 0,  # keep current key ID pointer
-                    'entity_count': 0  # keep count of seen entities for each kind
-                }
+                # perform validation
+                with entity:
+
+                    kind_blob = _metadata['kinds'].setdefault(entity.key.kind, {
+                        'id_pointer': 0,  # keep current key ID pointer
+                        'entity_count': 0  # keep count of seen entities for each kind
+                    })
 
-            # update count
-            _metadata['ops']['put'] = _metadata['ops'].get('put', 0) + 1
-            _metadata['global']['entity_count'] = _metadata['global'].get('entity_count', 0) + 1
-            kinded_entity_count = _metadata['kinds'][entity.key.kind].get('entity_count', 0)
-            _metadata['kinds'][entity.key.kind]['entity_count'] = kinded_entity_count + 1
+                    # update count
+                    kind_blob['entity_count'] = kind_blob.get('entity_count', 0) + 1
 
-            # save to datastore
-            _datastore[encoded] = entity.to_dict()
+                    # save to datastore
+                    _datastore[encoded] = entity.to_dict()
 
-        return entity.key
+                written.append(entity.key)
+
+        # update global counts once per batch
+        with _lock:
+            _metadata['ops']['put'] = _metadata['ops'].get('put', 0) + len(written)
+            _metadata['global']['entity_count'] = _metadata['global'].get('entity_count', 0) + len(written)
+        return written
 
     @classmethod
     def delete(cls, key, **kwargs):
 
         ''' Delete an entity by Key from memory. '''
 
+        # extract key
+        if not isinstance(key, tuple):  # pragma: no cover
+            key = key.flatten(True)
+        return cls.delete_multi([key], **kwargs)[0]
+
+    @classmethod
+    def delete_multi(cls, keys, **kwargs):
+
+        ''' Delete a batch of entities by Key from memory. '''
+
         global _metadata
         global _datastore
 
-        # extract key
-        if not isinstance(key, tuple):  # pragma: no cover
-            encoded, flattened = key.flatten(True)
-        else:
-            encoded, flattened = key
+        results = []
+        with cls._locked((flattened[1] for encoded, flattened in keys)):
+            for encoded, flattened in keys:
 
-        # extract key parts
-        parent, kind, id = flattened
+                # extract key parts
+                parent, kind, id = flattened
 
-        # if we have the key...
-        if encoded in _metadata[cls._key_prefix]:
-            try:
-                del _datastore[encoded]  # delete from datastore
+                # if we have the key...
+                if encoded in _metadata[cls._key_prefix]:
+                    try:
+                        del _datastore[encoded]  # delete from datastore
 
-            except KeyError:  # pragma: no cover
-                _metadata[cls._key_prefix].remove(encoded)
-                return False  # untrimmed key
+                    except KeyError:  # pragma: no cover
+                        _metadata[cls._key_prefix].remove(encoded)
+                        results.append(False)  # untrimmed key
+                        continue
 
-            else:
-                # update meta
-                _metadata[cls._key_prefix].remove(encoded)
-                _metadata['ops']['delete'] = _metadata['ops'].get('delete', 0) + 1
-                _metadata['global']['entity_count'] = _metadata['global'].get('entity_count', 1) - 1
-                _metadata['kinds'][kind]['entity_count'] = _metadata['kinds'][kind].get('entity_count', 1) - 1
+                    else:
+                        # update meta
+                        _metadata[cls._key_prefix].remove(encoded)
+                        _metadata['kinds'][kind]['entity_count'] = _metadata['kinds'][kind].get('entity_count', 1) - 1
 
-            return True
-        return False
+                    results.append(True)
+                    continue
+                results.append(False)
+
+        # update global counts once per batch
+        with _lock:
+            _metadata['ops']['delete'] = _metadata['ops'].get('delete', 0) + results.count(True)
+            _metadata['global']['entity_count'] = _metadata['global'].get('entity_count', 0) - results.count(True)
+        return results
 
     @classmethod
     def allocate_ids(cls, key_class, kind, count=1, **kwargs):
@@ -179,18 +267,17 @@ class InMemoryAdapter(IndexedModelAdapter):
 
         global _metadata
 
-        # resolve kind meta and increment pointer
-        kind_blob = _metadata['kinds'].get(kind, {})
-        current = kind_blob.get('id_pointer', 0)
-        pointer = kind_blob['id_pointer'] = (current + count)
-
-        # update kind blob
-        _metadata['kinds'][kind] = kind_blob
+        # resolve kind meta and increment pointer, under the global lock rather than the kind's stripe:
+        # the ID allocator calls in holding its own lock, which writes take while holding the stripe
+        with _lock:
+            kind_blob = _metadata['kinds'].setdefault(kind, {})
+            current = kind_blob.get('id_pointer', 0)
+            pointer = kind_blob['id_pointer'] = (current + count)
 
         # return IDs
         if count > 1:
             def _generate_id_range():
-                for x in xrange(current, pointer):
+                for x in xrange(current + 1, pointer + 1):
                     yield x
                 raise StopIteration()
             return _generate_id_range
@@ -225,6 +312,10 @@ class InMemoryAdapter(IndexedModelAdapter):
                 elif (path, value) not in _metadata[index]:
                     _metadata[index][(path, value)] = set()
 
+                # property indexes are also kept sorted, for range filters and sorts
+                if index == cls._index_prefix and encoded not in _metadata[index][(path, value)]:
+                    cls._sorted_insert(path, value, encoded)
+
                 # write key to index
                 _metadata[index][(path, value)].add(encoded)
 
@@ -265,19 +356,22 @@ class InMemoryAdapter(IndexedModelAdapter):
                 # extract write, inflate
                 index, value = write
 
-                # init index hash
-                if index not in _metadata:  # pragma: no cover
-                    _metadata[index] = {value: set()}
+                # entity groups span kinds (and so lock stripes)
+                with _lock:
+
+                    # init index hash
+                    if index not in _metadata:  # pragma: no cover
+                        _metadata[index] = {value: set()}
 
-                # init value set
-                elif value not in _metadata[index]:
-                    _metadata[index][value] = set()
+                    # init value set
+                    elif value not in _metadata[index]:
+                        _metadata[index][value] = set()
 
-                # only provision if value and index are different
-                if index != value:
+                    # only provision if value and index are different
+                    if index != value:
 
-                    # add encoded key
-                    _metadata[index][value].add(encoded)
+                        # add encoded key
+                        _metadata[index][value].add(encoded)
 
                 # add reverse index
                 if encoded not in _metadata[cls._reverse_prefix]:
@@ -348,6 +442,8 @@ class InMemoryAdapter(IndexedModelAdapter):
                     if isinstance(path, tuple):
                         if index in _metadata and (path, value) in _metadata[index]:
                             _metadata[index][(path, value)].remove(encoded)
+                            if index == cls._index_prefix:
+                                cls._sorted_remove(path, value, encoded)
 
                             # if there's no keys left in the index, trim it
                             if len(_metadata[index][(path, value)]) == 0:
@@ -370,12 +466,13 @@ class InMemoryAdapter(IndexedModelAdapter):
                     # extract write, clean
                     index, value = i
 
-                    if index in _metadata and value in _metadata[index]:
-                        _metadata[index][value].remove(encoded)  # remove from set at item in mapping
+                    with _lock:  # entity groups span kinds (and so lock stripes)
+                        if index in _metadata and value in _metadata[index]:
+                            _metadata[index][value].discard(encoded)  # remove from set at item in mapping
 
-                        # if there's no keys left in the index, trim it
-                        if len(_metadata[index][value]) == 0:
-                            del _metadata[index][value]
+                            # if there's no keys left in the index, trim it
+                            if len(_metadata[index][value]) == 0:
+                                del _metadata[index][value]
 
                     continue
 
@@ -392,8 +489,334 @@ class InMemoryAdapter(IndexedModelAdapter):
         return _cleaned
 
     @classmethod
-    def execute_query(cls, kind, spec, options, **kwargs):  # pragma: no cover
+    def update_indexes(cls, writes, **kwargs):
+
+        ''' Incrementally update indexes for a persisted key. '''
+
+        global _metadata
+
+        # extract changes
+        encoded, removals, additions = writes
+
+        # drop entries for stored values - and any other entries under changed properties,
+        # which a concurrent write from another copy of the entity may have left behind
+        changed = set(((write[0], write[1:-1]) for serializer, write in removals + additions))
+        stale = set(((write[0], write[1:-1], write[-1]) for serializer, write in removals))
+        stale.update((entry for entry in _metadata[cls._reverse_prefix].get(encoded, ())
+                      if isinstance(entry, tuple) and len(entry) == 3 and entry[:2] in changed))
+
+        for index, path, value in stale:
+            if index in _metadata and encoded in _metadata[index].get((path, value), ()):
+                _metadata[index][(path, value)].discard(encoded)
+                cls._sorted_remove(path, value, encoded)
+
+                # if there's no keys left in the index, trim it
+                if not _metadata[index][(path, value)]:
+                    del _metadata[index][(path, value)]
+
+            _metadata[cls._reverse_prefix].get(encoded, set()).discard((index, path, value))
+
+        # add entries for new values
+        return cls.write_indexes((encoded, [], additions), **kwargs)
+
+    @classmethod
+    def execute_query(cls, kind, spec, options, **kwargs):
+
+        ''' Execute a query across one (or multiple) indexed properties.
+            Equality (and ``IN``) filters intersect hash indexes, smallest
+            first, and range (and ``!=``) filters bisect sorted property
+            indexes (see :py:meth:`_sorted_insert`). Queries sorted by one
+            property walk its sorted index, stopping once the page is full.
+
+            :param kind: :py:class:`model.Model` class being queried.
+            :param spec: Tupled ``(<filters>, <sorts>)``.
+            :param options: :py:class:`query.QueryOptions` for the query.
+            :returns: ``list`` of matching entities (or keys, if ``keys_only``
+            is set). Sets the ``cursor`` option to resume just after the last
+            result, or to ``None`` if no more results follow. '''
+
+        from apptools import model
+        from apptools.model import query
+
+        # hold the kind's stripe while candidates are gathered, ordered and read
+        with cls._locked((kind.kind(),)):
+
+            filters, sorts = spec
+            kind_name, offset, limit = kind.kind(), options.offset or 0, options.limit
+            stop = None if (limit is None or limit < 0) else offset + limit
+
+            ancestor = options.ancestor or None
+            if isinstance(ancestor, basestring):
+                ancestor = model.Key.from_urlsafe(ancestor)
+
+            # gather candidates: each filter contributes a set of keys (or a sorted index span), smallest first
+            sources, ranges = [], {}
+            for _filter in filters:
+                path, value = (kind_name, _filter.target.name), _filter.value.data
+
+                if _filter.operator is query.EQUALS:
+                    members = _metadata[cls._index_prefix].get((path, value), set())
+                    sources.append((len(members), lambda members=members: members))
+
+                elif _filter.operator is query.CONTAINS:
+                    values = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+                    members = set().union(*[_metadata[cls._index_prefix].get((path, v), ()) for v in values])
+                    sources.append((len(members), lambda members=members: members))
+
+                elif _filter.operator is query.NOT_EQUALS:
+                    keys = _metadata['sorted'].get(path, ([], []))[1]
+                    low, high = cls._span(path, (None, False, value, True)), cls._span(path, (value, True, None, False))
+                    sources.append(((low[1] - low[0]) + (high[1] - high[0]),
+                                    lambda keys=keys, low=low, high=high: keys[low[0]:low[1]] + keys[high[0]:high[1]]))
+
+                else:
+                    # range filters on the same property narrow one span
+                    bounds = ranges.setdefault(path, [None, False, None, False])
+                    cls._narrow(bounds, _filter.operator, cls._sortable(value))
+
+            for path, bounds in ranges.items():
+                lo, hi = cls._span(path, bounds)
+                keys = _metadata['sorted'].get(path, ([], []))[1]
+                sources.append((hi - lo, lambda keys=keys, lo=lo, hi=hi: keys[lo:hi]))
+
+            if sources:
+                sources.sort(key=lambda source: source[0])
+                candidates = set(sources[0][1]())
+                for size, members in sources[1:]:
+                    if not candidates:
+                        break
+                    candidates.intersection_update(members())
+            else:
+                candidates = _metadata[cls._kind_prefix].get(kind_name, set())
+
+            # ancestor queries only match the ancestor's descendants
+            decoded = {}
+            if ancestor is not None:
+                flattened = ancestor.flatten(True)[0]
+                for encoded in candidates:
+                    decoded[encoded] = model.Key.from_urlsafe(encoded, _persisted=True)
+                candidates = set((encoded for encoded in candidates
+                                  if flattened in [k.flatten(True)[0] for k in decoded[encoded].ancestry][:-1]))
+
+            position = options.cursor.position if options.cursor is not None else None
+            if len(sorts) == 1 and not sorts[0].target._repeated:
+                ordered = cls._walk(kind_name, sorts[0], candidates, position, stop)
+            else:
+                ordered = cls._order(kind_name, sorts, candidates, position, decoded)
+
+            # page through, leaving a cursor just past the page if anything follows it
+            page, more = [], False
+            for index, entry in enumerate(ordered):
+                if stop is not None and index >= stop:
+                    more = True
+                    break
+                if index >= offset:
+                    page.append(entry)
+            options.cursor = query.Cursor(page[-1]) if (more and page) else None
+
+            keys = [decoded.get(entry[-1]) or model.Key.from_urlsafe(entry[-1], _persisted=True) for entry in page]
+            if options.keys_only:
+                return keys
+
+            results = []
+            for key, entry in zip(keys, page):
+                data = _datastore.get(entry[-1])
+                if data is None:
+                    continue
+                data = dict(data)
+                if options.projection:
+                    data = dict(((name, data[name]) for name in options.projection if name in data))
+                    data['_projection'] = options.projection
+                data['key'] = key
+                results.append(kind(_persisted=True, **data))
+            return results
+
+    @classmethod
+    def _walk(cls, kind, sort, candidates, position, stop):
+
+        ''' Order candidates by walking the sorted index of a single-property
+            sort, stopping once ``stop`` results (and one more, to tell if more
+            follow) have been found. Entities lacking the property are dropped.
+
+            :param kind: String kind name.
+            :param sort: :py:class:`query.Sort` directive.
+            :param candidates: Set of encoded keys matching the query's filters.
+            :param position: Cursor position to resume after, if any.
+            :param stop: Number of results needed, or ``None`` for all of them.
+            :returns: Generator of ``[<sort value>, <encoded key>]`` entries. '''
+
+        from apptools.model import query
+
+        descending = sort.operator is query.DESCENDING
+        values, keys = _metadata['sorted'].get((kind, sort.target.name), ([], []))
+
+        # start just past the cursor, or at the head of the index
+        if position is None:
+            start = (len(keys) - 1) if descending else 0
+        else:
+            lo, hi = bisect.bisect_left(values, position[0]), bisect.bisect_right(values, position[0])
+            start = bisect.bisect_left(keys, position[1], lo, hi) - 1 if descending else (
+                bisect.bisect_right(keys, position[1], lo, hi))
+
+        found, step = 0, -1 if descending else 1
+        for index in xrange(start, -1 if descending else len(keys), step):
+            if keys[index] in candidates:
+                yield [values[index], keys[index]]
+                found += 1
+                if stop is not None and found > stop:
+                    return
+
+    @classmethod
+    def _order(cls, kind, sorts, candidates, position, decoded):
+
+        ''' Order candidates by their values for each sort (the smallest value
+            of a repeated property ascending, the largest descending), then by
+            key - or, if unsorted, by key ID. Entities lacking a sorted property
+            are dropped.
+
+            :param kind: String kind name.
+            :param sorts: :py:class:`query.Sort` directives.
+            :param candidates: Iterable of encoded keys matching the query's filters.
+            :param position: Cursor position to resume after, if any.
+            :param decoded: ``dict`` of already-decoded keys, by encoded key.
+            :returns: ``list`` of ``[<sort values>..., <encoded key>]`` entries. '''
+
+        from apptools import model
+        from apptools.model import query
+
+        directions = [sort.operator is query.DESCENDING for sort in sorts] or [False]
+        directions.append(directions[-1])  # ties follow the last sort's direction
+
+        entries = []
+        for encoded in candidates:
+            if not sorts:
+                key_id = (decoded.get(encoded) or model.Key.from_urlsafe(encoded)).id
+                if isinstance(key_id, basestring) and key_id.isdigit():
+                    key_id = int(key_id)  # IDs come back from encoded keys as strings
+                entries.append([key_id if isinstance(key_id, (int, long)) else 0, encoded])
+                continue
+
+            values = {}
+            for entry in _metadata[cls._reverse_prefix].get(encoded, ()):
+                if isinstance(entry, tuple) and len(entry) == 3 and entry[0] == cls._index_prefix:
+                    values.setdefault(entry[1], []).append(cls._sortable(entry[2]))
+
+            entry = []
+            for sort, descending in zip(sorts, directions):
+                found = values.get((kind, sort.target.name))
+                if not found:
+                    break
+                entry.append(max(found) if descending else min(found))
+            else:
+                entries.append(entry + [encoded])
+
+        def compare(a, b):
+            for x, y, descending in zip(a, b, directions):
+                if x != y:
+                    return (1 if x < y else -1) if descending else (-1 if x < y else 1)
+            return 0
+
+        entries.sort(cmp=compare)
+        if position is not None:
+            entries = [entry for entry in entries if compare(entry, position) > 0]
+        return entries
+
+    @classmethod
+    def _sortable(cls, value):
+
+        ''' Convert a property value to the form sorted indexes hold it in:
+            dates and times become numbers, and keys their encoded form.
+
+            :param value: Property value.
+            :returns: Sortable (and JSON-serializable) value. '''
+
+        if isinstance(value, datetime.datetime):
+            return time.mktime(value.timetuple()) + (value.microsecond / 1000000.0)
+        if isinstance(value, datetime.date):
+            return cls.Indexer.convert_date(value)[1]
+        if isinstance(value, datetime.time):
+            return cls.Indexer.convert_time(value)[1]
+        if hasattr(value, 'urlsafe'):
+            return value.urlsafe()
+        return value
+
+    @classmethod
+    def _sorted_insert(cls, path, value, encoded):
+
+        ''' Add an entry to the sorted index for a property. Entries are held
+            in two parallel lists (values and keys), ordered by value and then
+            key, so both can be bisected.
+
+            :param path: Tupled ``(<kind>, <property name>)``.
+            :param value: Property value.
+            :param encoded: Encoded key.
+            :returns: Nothing. '''
+
+        values, keys = _metadata['sorted'].setdefault(path, ([], []))
+        value = cls._sortable(value)
+        index = bisect.bisect_left(keys, encoded, bisect.bisect_left(values, value), bisect.bisect_right(values, value))
+        values.insert(index, value)
+        keys.insert(index, encoded)
+
+    @classmethod
+    def _sorted_remove(cls, path, value, encoded):
+
+        ''' Remove an entry from the sorted index for a property.
+
+            :param path: Tupled ``(<kind>, <property name>)``.
+            :param value: Property value.
+            :param encoded: Encoded key.
+            :returns: Nothing. '''
+
+        if path not in _metadata['sorted']:
+            return
+
+        values, keys = _metadata['sorted'][path]
+        value = cls._sortable(value)
+        lo, hi = bisect.bisect_left(values, value), bisect.bisect_right(values, value)
+        index = bisect.bisect_left(keys, encoded, lo, hi)
+        if index < hi and keys[index] == encoded:
+            del values[index], keys[index]
+
+    @classmethod
+    def _narrow(cls, bounds, operator, value):
+
+        ''' Narrow range bounds by a range filter.
+
+            :param bounds: ``list`` of ``[<low>, <low exclusive>, <high>, <high exclusive>]``,
+            where ``None`` leaves a side open.
+            :param operator: Range filter operator.
+            :param value: Sortable filter value (see :py:meth:`_sortable`).
+            :returns: ``bounds``. '''
+
+        from apptools.model import query
+
+        if operator in (query.GREATER_THAN, query.GREATER_THAN_EQUAL_TO):
+            exclusive = operator is query.GREATER_THAN
+            if bounds[0] is None or value > bounds[0] or (value == bounds[0] and exclusive):
+                bounds[0], bounds[1] = value, exclusive
+        else:
+            exclusive = operator is query.LESS_THAN
+            if bounds[2] is None or value < bounds[2] or (value == bounds[2] and exclusive):
+                bounds[2], bounds[3] = value, exclusive
+        return bounds
+
+    @classmethod
+    def _span(cls, path, bounds):
+
+        ''' Bisect the sorted index for a property to the span of entries
+            within range bounds (see :py:meth:`_narrow`).
+
+            :param path: Tupled ``(<kind>, <property name>)``.
+            :param bounds: Range bounds.
+            :returns: Tupled ``(<start>, <end>)`` indexes of the span. '''
 
-        ''' Execute a query across one (or multiple) indexed properties. '''
+        values = _metadata['sorted'].get(path, ([], []))[0]
+        low, low_exclusive, high, high_exclusive = bounds
 
-        raise NotImplementedError('Queries are not yet supported in `InMemoryAdapter`.')
+        start, end = 0, len(values)
+        if low is not None:
+            start = (bisect.bisect_right if low_exclusive else bisect.bisect_left)(values, cls._sortable(low))
+        if high is not None:
+            end = (bisect.bisect_left if high_exclusive else bisect.bisect_right)(values, cls._sortable(high))
+        return start, max(start, end)
@@ -21,6 +21,11 @@
 
 
 # stdlib
+import math
+import time
+import bisect
+import itertools
+import uuid
 import hashlib
 import datetime
 
@@ -52,6 +57,7 @@ else:
 # resolve gevent
 try:
     import gevent
+    import gevent.queue
 except ImportError as e:  # pragma: no cover
     _GEVENT = False
 else:
@@ -65,8 +71,18 @@ else:
 _server_profiles = {}  # holds globally-configured server profiles
 _default_profile = None  # holds the default redis instance mapping
 _client_connections = {}  # holds instantiated redis connection clients
+_connection_pools = {}  # holds shared connection pools, by server profile
 _profiles_by_model = {}  # holds specific model => redis instance mappings, if any
+_shards_by_model = {}  # holds specific model => hash ring mappings, for models sharded across profiles
+_modes_by_model = {}  # holds specific model => storage mode mappings, if any
+_consistency_by_model = {}  # holds specific model => read consistency mappings, if any
+_replica_sets = {}  # holds read replica sets, by server profile
+_last_writes = {}  # holds the time of this process' last write, by server profile
+_scripts = {}  # holds registered Lua scripts, by name or query shape
 _SERIES_BASETYPES = (datetime.datetime, datetime.date, datetime.time, float, int, long)
+_SORTABLE_SAMPLES = {int: 0, long: 0L, float: 0.0, datetime.datetime: datetime.datetime(1970, 1, 2),
+                     datetime.date: datetime.date(1970, 1, 2), datetime.time: datetime.time(0)}
+_LEXICAL_BASETYPES = (basestring, str, unicode)
 
 
 ## RedisMode
@@ -81,6 +97,556 @@ class RedisMode(object):
     toplevel_blob = 'toplevel'  # SET <key>, <entity>
 
 
+## RedisConsistency
+# Enumerates read consistency levels, for server profiles with replicas.
+class RedisConsistency(object):
+
+    ''' Map of read consistency levels for the `RedisAdapter`, which only matter for profiles with replicas. '''
+
+    eventual = 'eventual'  # reads may be served by any replica
+    session = 'session'  # reads stay on the primary for a window after this process writes to it
+    strong = 'strong'  # reads are always served by the primary
+
+
+## Lua Scripts
+# Server-side routines. Query fragments are assembled by `RedisAdapter.compile_query` into one script per query shape.
+# Query scripts return `{<page of keys>, <values>, <cursor position after the page>, <more>, <sort scores of each key>}`,
+# or, for counts and aggregates, `<count>` and `{<count>, <sum>, <min>, <max>}` of the matching entities.
+
+_LUA_CLEAN_INDEXES = """
+local reverse = redis.call('HGETALL', KEYS[1])
+for i = 1, #reverse, 2 do
+  if reverse[i + 1] == 'Z' then
+    redis.call('ZREM', reverse[i], ARGV[1])
+  elseif string.sub(reverse[i + 1], 1, 1) == 'L' then
+    redis.call('ZREM', reverse[i], string.sub(reverse[i + 1], 2) .. '\\0' .. ARGV[1])
+  else
+    redis.call('SREM', reverse[i], ARGV[1])
+  end
+end
+redis.call('DEL', KEYS[1])
+return #reverse / 2
+"""
+
+_LUA_CLEAN_PROPERTIES = """
+local reverse = redis.call('HGETALL', KEYS[1])
+local cleaned = 0
+for i = 1, #reverse, 2 do
+  for j = 3, #ARGV do
+    if reverse[i] == ARGV[j] or string.sub(reverse[i], 1, #ARGV[j] + #ARGV[2]) == ARGV[j] .. ARGV[2] then
+      if reverse[i + 1] == 'Z' then
+        redis.call('ZREM', reverse[i], ARGV[1])
+      elseif string.sub(reverse[i + 1], 1, 1) == 'L' then
+        redis.call('ZREM', reverse[i], string.sub(reverse[i + 1], 2) .. '\\0' .. ARGV[1])
+      else
+        redis.call('SREM', reverse[i], ARGV[1])
+      end
+      redis.call('HDEL', KEYS[1], reverse[i])
+      cleaned = cleaned + 1
+      break
+    end
+  end
+end
+return cleaned
+"""
+
+_LUA_KIND_CODE = """
+local code = redis.call('HGET', KEYS[1], ARGV[1])
+if not code then
+  code = tostring(math.floor(redis.call('HLEN', KEYS[1]) / 2) + 1)
+  redis.call('HSET', KEYS[1], ARGV[1], code)
+  redis.call('HSET', KEYS[1], code, ARGV[1])
+end
+return code
+"""
+
+_LUA_RANGE_UNION = """
+redis.call('DEL', KEYS[1])
+for i = 3, #ARGV, 2 do
+  local members
+  if ARGV[2] == 'lex' then
+    members = redis.call('ZRANGEBYLEX', KEYS[2], ARGV[i], ARGV[i + 1])
+    for j, member in ipairs(members) do members[j] = string.sub(member, string.find(member, '\\0', 1, true) + 1) end
+  else
+    members = redis.call('ZRANGEBYSCORE', KEYS[2], ARGV[i], ARGV[i + 1])
+  end
+  for j = 1, #members, 1000 do
+    redis.call('SADD', KEYS[1], unpack(members, j, math.min(j + 999, #members)))
+  end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return redis.call('SCARD', KEYS[1])
+"""
+
+_LUA_CACHED_INTERSECT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  redis.call('SINTERSTORE', KEYS[1], unpack(KEYS, 2))
+  redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return redis.call('SCARD', KEYS[1])
+"""
+
+_LUA_AGGREGATE_INDEX = """
+local entries = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[2], 'WITHSCORES')
+local total = 0
+for i = 2, #entries, 2 do total = total + tonumber(entries[i]) end
+if #entries == 0 then return {0, '0', false, false} end
+return {#entries / 2, string.format('%.17g', total), entries[2], entries[#entries]}
+"""
+
+_LUA_QUERY_PRELUDE = """
+local offset, limit = tonumber(ARGV[1]), tonumber(ARGV[2])
+local more = false
+
+local function bound(value)
+  if value == '-inf' then return -math.huge, false end
+  if value == '+inf' then return math.huge, false end
+  if string.sub(value, 1, 1) == '(' then return tonumber(string.sub(value, 2)), true end
+  return tonumber(value), false
+end
+
+local function within(score, low, low_x, high, high_x)
+  if not score then return false end
+  score = tonumber(score)
+  if (low_x and score <= low) or ((not low_x) and score < low) then return false end
+  if (high_x and score >= high) or ((not high_x) and score > high) then return false end
+  return true
+end
+
+local function before(a, b)
+  if a == b then return false end
+  for i = 1, math.min(#a, #b) do
+    local x, y = string.byte(a, i), string.byte(b, i)
+    if x ~= y then return x < y end
+  end
+  return #a < #b
+end
+
+local function unlex(member)
+  return string.sub(member, string.find(member, '\\0', 1, true) + 1)
+end
+
+local function lexin(entry, low, high)
+  if low ~= '-' then
+    local edge, value = string.sub(low, 1, 1), string.sub(low, 2)
+    if before(entry, value) or (edge == '(' and entry == value) then return false end
+  end
+  if high ~= '+' then
+    local edge, value = string.sub(high, 1, 1), string.sub(high, 2)
+    if before(value, entry) or (edge == '(' and entry == value) then return false end
+  end
+  return true
+end
+"""
+
+_LUA_QUERY_WALK = """
+local matches, run, value, done = {}, {}, nil, false
+local want = limit >= 0 and offset + limit + 1 or -1
+local function flush()
+%(order)s  for _, match in ipairs(run) do matches[#matches + 1] = match end
+  run = {}
+  return want >= 0 and #matches >= want
+end
+
+local rank, last = %(first)s, %(last)s
+while not done and (not last or rank <= last) do
+  local stop = last and math.min(rank + 255, last) or rank + 255
+  local chunk = redis.call('%(walk)s', KEYS[%(key)s], rank, stop%(scores)s)
+  for i = 1, #chunk, %(step)s do
+    local %(entry)s
+    if score ~= value then
+      if flush() then done = true break end
+      value = score
+    end
+    if %(check)s then run[#run + 1] = {member, score} end
+  end
+  if #chunk < (stop - rank + 1) * %(step)s then break end
+  rank = stop + 1
+end
+if not done then flush() end
+"""
+
+_LUA_QUERY_PAGE = """
+local page, scores = {}, {}
+local stop = #matches
+if limit >= 0 then stop = math.min(stop, offset + limit) end
+for i = offset + 1, stop do
+  local entry = {}
+  for j = 2, #matches[i] do
+    entry[#entry + 1] = type(matches[i][j]) == 'number' and string.format('%.17g', matches[i][j]) or matches[i][j]
+  end
+  page[#page + 1], scores[#scores + 1] = matches[i][1], entry
+end
+more = more or stop < #matches
+
+local position = {}
+if stop > offset then
+  for i, score in ipairs(scores[#scores]) do position[i] = score end
+  if #position == 0 then position[1] = redis.call('ZSCORE', KEYS[1], page[#page]) end
+  position[#position + 1] = page[#page]
+end
+"""
+
+_LUA_QUERY_FETCH = {
+    'keys': """
+return {page, {}, position, more and 1 or 0, scores}
+""",
+    RedisMode.toplevel_blob: """
+local values = {}
+for i = 1, #page, 1000 do
+  local chunk = redis.call('MGET', unpack(page, i, math.min(i + 999, #page)))
+  for j = 1, #chunk do values[#values + 1] = chunk[j] end
+end
+return {page, values, position, more and 1 or 0, scores}
+""",
+    RedisMode.hashkind_blob: """
+local values = {}
+for i = 1, #page, 1000 do
+  local chunk = redis.call('HMGET', KEYS[%(hash)s], unpack(page, i, math.min(i + 999, #page)))
+  for j = 1, #chunk do values[#values + 1] = chunk[j] end
+end
+return {page, values, position, more and 1 or 0, scores}
+""",
+    RedisMode.hashkey_hash: """
+local values = {}
+for i, member in ipairs(page) do values[i] = redis.call('HGETALL', member) end
+return {page, values, position, more and 1 or 0, scores}
+""",
+    'projection': """
+local fields = {}
+for i = %(fields)s, #ARGV do fields[#fields + 1] = ARGV[i] end
+local values = {}
+for i, member in ipairs(page) do
+  values[i] = redis.call('EXISTS', member) == 1 and redis.call('HMGET', member, unpack(fields))
+end
+return {page, values, position, more and 1 or 0, scores}
+"""
+}
+
+
+_LUA_QUERY_TALLY = {
+    'count': """
+return #matches
+""",
+    'aggregate': """
+local count, total, low, high = 0, 0, nil, nil
+for _, match in ipairs(matches) do
+  local score = redis.call('ZSCORE', KEYS[%(target)s], match[1])
+  if score then
+    score = tonumber(score)
+    count, total = count + 1, total + score
+    if not low or score < low then low = score end
+    if not high or score > high then high = score end
+  end
+end
+return {count, string.format('%%.17g', total), low and string.format('%%.17g', low) or false,
+        high and string.format('%%.17g', high) or false}
+"""
+}
+
+
+## ConnectionPool
+# Blocking connection pool, shared by every kind mapped to the same server profile.
+class ConnectionPool(redis.BlockingConnectionPool if _REDIS else object):
+
+    ''' Blocking pool of connections to one Redis server profile. Extends
+        ``redis.BlockingConnectionPool`` with idle health-checks, warm-up and
+        usage stats, and waits on a ``gevent`` queue when ``gevent`` is present. '''
+
+    max_connections = 50  # default cap on open connections
+    timeout = 20  # default seconds to block for a free connection before raising ``ConnectionError``
+    health_check = 30  # seconds a connection may sit idle before it is ``PING``'d on checkout (``0`` disables)
+    warm = 0  # connections to open up-front when the pool is built
+
+    def __init__(self, profile, max_connections=None, timeout=None, health_check=None, warm=None, **connection_kwargs):
+
+        ''' Initialize this ``ConnectionPool``.
+
+            :param profile: Name of the server profile this pool connects to.
+            :param max_connections: Cap on open connections. Defaults to :py:attr:`max_connections`.
+            :param timeout: Seconds to block waiting for a connection. Defaults to :py:attr:`timeout`.
+            :param health_check: Idle seconds before a checked-out connection is ``PING``'d first.
+            :param warm: Number of connections to open immediately, via :py:meth:`prime`.
+            :param connection_kwargs: Passed to each ``redis.Connection`` (``host``, ``port``,
+            ``db``, ``password``, ``socket_timeout``, ``socket_connect_timeout``, ...). '''
+
+        self.profile = profile
+        self.health_check = self.health_check if health_check is None else health_check
+        self.warm = self.warm if warm is None else warm
+
+        if 'unix_socket_path' in connection_kwargs:
+            connection_kwargs['path'] = connection_kwargs.pop('unix_socket_path')
+            connection_kwargs.setdefault('connection_class', redis.UnixDomainSocketConnection)
+        if _GEVENT:
+            connection_kwargs.setdefault('queue_class', gevent.queue.LifoQueue)
+
+        super(ConnectionPool, self).__init__(max_connections=(max_connections or self.max_connections),
+                                             timeout=(self.timeout if timeout is None else timeout),
+                                             **connection_kwargs)
+
+    def __repr__(self):
+
+        ''' Generate a string representation of this ``ConnectionPool``. '''
+
+        return "<ConnectionPool \"%s\" (%s/%s)>" % (self.profile, len(self._connections), self.max_connections)
+
+    def reset(self):
+
+        ''' Reset pool state (on construction, and after a fork), including stats. '''
+
+        super(ConnectionPool, self).reset()
+        self.counters = dict.fromkeys(('created', 'checkouts', 'timeouts', 'pings', 'reconnects'), 0)
+
+    def make_connection(self):
+
+        ''' Open a new connection, counting it. '''
+
+        self.counters['created'] += 1
+        return super(ConnectionPool, self).make_connection()
+
+    def get_connection(self, command_name, *keys, **options):
+
+        ''' Check out a connection, blocking up to :py:attr:`timeout`. Connections that
+            have been idle longer than :py:attr:`health_check` are ``PING``'d first, and
+            dropped (to reconnect lazily) if the ``PING`` fails.
+
+            :raises redis.ConnectionError: If no connection frees up in time.
+            :returns: A ``redis.Connection``. '''
+
+        try:
+            connection = super(ConnectionPool, self).get_connection(command_name, *keys, **options)
+        except redis.ConnectionError:
+            self.counters['timeouts'] += 1
+            raise
+
+        self.counters['checkouts'] += 1
+        released = getattr(connection, '_released', None)
+        if self.health_check and released and (time.time() - released) > self.health_check:
+            self.counters['pings'] += 1
+            try:
+                connection.send_command('PING')
+                connection.read_response()
+            except (redis.ConnectionError, redis.TimeoutError):
+                self.counters['reconnects'] += 1
+                connection.disconnect()
+        return connection
+
+    def release(self, connection):
+
+        ''' Return a connection to the pool, stamping it for health-checks. '''
+
+        connection._released = time.time()
+        return super(ConnectionPool, self).release(connection)
+
+    def prime(self, count=None):
+
+        ''' Open connections ahead of demand, so the first requests don't pay for them.
+
+            :param count: Number of connections to open. Defaults to :py:attr:`warm`.
+            :raises redis.ConnectionError: If the server cannot be reached.
+            :returns: Number of connections opened. '''
+
+        connections = []
+        try:
+            for i in xrange(min(self.warm if count is None else count, self.max_connections)):
+                connections.append(self.get_connection('PING'))
+                connections[-1].connect()
+        finally:
+            for connection in connections:
+                self.release(connection)
+        return len(connections)
+
+    def stats(self):
+
+        ''' Snapshot this pool's usage. Counters are updated without a lock, so
+            under heavy concurrency they are approximate.
+
+            :returns: ``dict`` of ``max``, ``open``, ``idle`` and ``in_use`` connection
+            counts, plus cumulative ``created``, ``checkouts``, ``timeouts``, ``pings``
+            and ``reconnects`` counters. '''
+
+        idle = len([connection for connection in list(self.pool.queue) if connection is not None])
+        return dict(self.counters, max=self.max_connections, open=len(self._connections),
+                    idle=idle, in_use=(len(self._connections) - idle))
+
+
+## HashRing
+# Consistent-hash ring, placing entity groups across Redis server profiles.
+class HashRing(object):
+
+    ''' Consistent-hash ring over a set of server profiles. Each profile is
+        placed at many points on the ring (``replicas``, scaled by its weight),
+        and a value belongs to the first profile point at or after its own
+        hash - so adding or removing a profile only moves the values nearest
+        to that profile's points. '''
+
+    replicas = 160  # ring points per profile, at a weight of ``1``
+
+    def __init__(self, profiles, replicas=None):
+
+        ''' Initialize this ``HashRing``.
+
+            :param profiles: Iterable of server profile names, or a ``dict`` of
+            server profile names to (numeric) weights.
+            :param replicas: Ring points per profile at a weight of ``1``.
+            Defaults to :py:attr:`replicas`. '''
+
+        weights = profiles if isinstance(profiles, dict) else dict.fromkeys(profiles, 1)
+        replicas = replicas or self.replicas
+
+        self.profiles = sorted(weights)
+        ring = sorted(((self.hash('%s-%s' % (profile, point)), profile)
+                       for profile in self.profiles for point in xrange(int(replicas * weights[profile]))))
+        self.points, self.nodes = [point for point, profile in ring], [profile for point, profile in ring]
+
+    def __repr__(self):
+
+        ''' Generate a string representation of this ``HashRing``. '''
+
+        return "<HashRing (%s)>" % ', '.join(self.profiles)
+
+    @staticmethod
+    def hash(value):
+
+        ''' Hash a value onto the ring.
+
+            :param value: String to hash.
+            :returns: Integer ring position. '''
+
+        return int(hashlib.md5(value).hexdigest()[:8], 16)
+
+    def route(self, value):
+
+        ''' Resolve the server profile a value belongs to.
+
+            :param value: String to place on the ring.
+            :returns: Name of the server profile. '''
+
+        return self.nodes[bisect.bisect(self.points, self.hash(value)) % len(self.points)]
+
+
+## ReplicaSet
+# Read replicas of one Redis server profile.
+class ReplicaSet(object):
+
+    ''' Read replicas of one server profile, picked round-robin or by least
+        latency. Each replica is ``PING``'d every :py:attr:`probe_interval`
+        seconds, which times it and takes it out of rotation (if it failed)
+        until it answers again. Probes ride along with picks, one replica at
+        a time, so no read waits on more than one ``PING``. '''
+
+    round_robin = 'round_robin'  # take turns
+    least_latency = 'latency'  # prefer the replica with the lowest (smoothed) ``PING`` time
+    probe_interval = 10  # seconds between ``PING`` probes
+
+    def __init__(self, clients, strategy=None, probe_interval=None):
+
+        ''' Initialize this ``ReplicaSet``.
+
+            :param clients: ``list`` of ``Redis`` clients, one per replica.
+            :param strategy: :py:attr:`round_robin` (the default) or :py:attr:`least_latency`.
+            :param probe_interval: Seconds between probes. Defaults to :py:attr:`probe_interval`. '''
+
+        if strategy not in (None, self.round_robin, self.least_latency):
+            raise ValueError("Invalid Redis replica strategy \"%s\"." % strategy)
+
+        self.clients, self.strategy = clients, strategy or self.round_robin
+        self.probe_interval = self.probe_interval if probe_interval is None else probe_interval
+        self.latencies, self.probed, self.turns = [0.0] * len(clients), [time.time()] * len(clients), itertools.count()
+
+    def __repr__(self):
+
+        ''' Generate a string representation of this ``ReplicaSet``. '''
+
+        return "<ReplicaSet (%s replicas, %s)>" % (len(self.clients), self.strategy)
+
+    def probe(self, index=None):
+
+        ''' ``PING`` one replica, updating its smoothed latency (or marking it
+            down, as ``None``, if it can't be reached).
+
+            :param index: Position of the replica to probe. Defaults to the one
+            probed longest ago.
+            :returns: The replica's latency, in seconds. '''
+
+        if index is None:
+            index = self.probed.index(min(self.probed))
+
+        self.probed[index] = time.time()  # claim this probe, so concurrent readers don't pile on
+        started = time.time()
+        try:
+            self.clients[index].ping()
+        except (redis.ConnectionError, redis.TimeoutError):
+            self.latencies[index] = None
+        else:
+            elapsed, previous = time.time() - started, self.latencies[index]
+            self.latencies[index] = elapsed if not previous else (previous * 0.7) + (elapsed * 0.3)
+        return self.latencies[index]
+
+    def pick(self):
+
+        ''' Pick a replica to read from, first probing the replica probed
+            longest ago if it's due.
+
+            :returns: A ``Redis`` client, or ``None`` if every replica is down. '''
+
+        stale = min(self.probed)
+        if time.time() - stale > self.probe_interval:
+            self.probe(self.probed.index(stale))
+
+        if self.strategy == self.least_latency:
+            live = [(latency, index) for index, latency in enumerate(self.latencies) if latency is not None]
+            return self.clients[min(live)[1]] if live else None
+
+        for attempt in xrange(len(self.clients)):
+            index = next(self.turns) % len(self.clients)
+            if self.latencies[index] is not None:
+                return self.clients[index]
+        return None
+
+
+## QueryPlan
+# Strategy chosen to run a query against Redis indexes.
+class QueryPlan(object):
+
+    ''' Strategy chosen to run a query (see :py:meth:`RedisAdapter.plan_query`):
+        the ``driver`` gathering candidates - ``intersect`` (every set index),
+        ``set``, ``range``, ``group``, ``sort`` (walking the index of a single
+        sort in order, within the range at ``position`` if one filters the same
+        index) or ``kind`` - with the position of its index where there are
+        several, along with the cardinalities and costs estimated for each
+        candidate driver (if any were). Passing a plan back in as the ``plan``
+        query option runs later queries the same way. '''
+
+    __slots__ = ('driver', 'index', 'sources', 'estimates', 'costs')
+
+    def __init__(self, driver, index, sources, estimates=None, costs=None):
+
+        ''' Initialize this ``QueryPlan``.
+
+            :param driver: Tupled ``(<driver>, <position>)``.
+            :param index: Name of the index driving the query (``None`` if it's
+            driven by set intersection).
+            :param sources: Query indexes (see :py:meth:`RedisAdapter._query_sources`).
+            :param estimates: Index cardinalities, if estimated.
+            :param costs: ``dict`` of estimated costs, by driver, if estimated. '''
+
+        self.driver, self.index, self.sources, self.estimates, self.costs = driver, index, sources, estimates, costs
+
+    def __repr__(self):
+
+        ''' Generate a string representation of this ``QueryPlan``. '''
+
+        return "<QueryPlan (%s %s, cost: %s)>" % (self.driver[0], self.index or '', self.cost)
+
+    @property
+    def cost(self):
+
+        ''' Estimated cost of the plan, or ``None`` if it wasn't estimated. '''
+
+        return self.costs.get(self.driver) if self.costs else None
+
+
 ## RedisAdapter
 # Adapt apptools models to Redis.
 class RedisAdapter(IndexedModelAdapter):
@@ -94,8 +660,12 @@ class RedisAdapter(IndexedModelAdapter):
 
     # magic string identifiers
     _id_prefix = '__id__'
+    _hash_prefix = '__hash__'
     _meta_prefix = '__meta__'
     _kind_prefix = '__kind__'
+    _kinds_prefix = '__kinds__'
+    _lex_prefix = '__lex__'
+    _temp_prefix = '__temp__'
     _magic_separator = '::'
     _path_separator = '.'
     _chunk_separator = ':'
@@ -107,8 +677,14 @@ class RedisAdapter(IndexedModelAdapter):
         ''' Configuration for the `RedisAdapter` engine. '''
 
         encoding = True  # encoding for keys and special values
+        compact_keys = False  # store keys packed by `abstract.KeyCodec`, not `base64` (`urlsafe` is unchanged)
         compression = False  # compression for serialized data values
         mode = RedisMode.toplevel_blob  # internal mode of operation
+        transactional = True  # wrap entity + index writes in `MULTI`/`EXEC` (`False` pipelines without a transaction)
+        consistency = RedisConsistency.eventual  # default read consistency, for profiles with replicas
+        session_window = 5.0  # seconds reads stay on the primary after a write, under `session` consistency
+        temp_ttl = 30  # seconds temporary query sets (for `IN` and `!=` filters) live in `Redis`
+        count_ttl = 5  # seconds intersections counted by `Query.count` are cached for (`0` to always recount)
 
     ## Operations
     # Holds bound names for available Redis operations.
@@ -119,9 +695,11 @@ class RedisAdapter(IndexedModelAdapter):
         ## Key Operations
         SET = 'SET'  # set a value at a key directly
         GET = 'GET'  # get a value by key directly
+        MULTI_GET = 'MGET'  # get the values of multiple keys directly
         KEYS = 'KEYS'  # get a list of all keys matching a regex
         DUMP = 'DUMP'  # dump serialized information about a key
         DELETE = 'DELETE'  # delete a key=> value pair, by key
+        EXPIRE = 'EXPIRE'  # set a key's time to live, in seconds
         GETBIT = 'GETBIT'  # retrieve a specific bit from a key value
         GETSET = 'GETSET'  # set a value by key, and return the existing value at that key
         GETRANGE = 'GETRANGE'  # return the substring of str value at given key, determined by offsets
@@ -190,6 +768,7 @@ class RedisAdapter(IndexedModelAdapter):
         SORTED_RANGE = 'ZRANGE'  # return a range of members in a sorted set, by index
         SORTED_SCORE = 'ZSCORE'  # get the score associated with the given member in a sorted set
         SORTED_COUNT = 'ZCOUNT'  # count the members in a sorted set with scores within a given range
+        SORTED_LEX_COUNT = 'ZLEXCOUNT'  # count the members in a sorted set within a given lexicographical range
         SORTED_REMOVE = 'ZREM'  # remove one or more members from a sorted set
         SORTED_CARDINALITY = 'ZCARD'  # get the number of members in a sorted set (cardinality)
         SORTED_UNION_STORE = 'ZUNIONSTORE'  # compute the union of two sorted sets, storing the result at a new key
@@ -304,6 +883,7 @@ class RedisAdapter(IndexedModelAdapter):
 
         global _server_profiles
         global _default_profile
+        global _modes_by_model
         global _profiles_by_model
 
         ## Resolve default
@@ -322,30 +902,114 @@ class RedisAdapter(IndexedModelAdapter):
                     _default_profile = name
                 _server_profiles[name] = config
 
+        # Resolve sharded models, spread across several profiles
+        if isinstance(properties.get('__redis__'), (list, tuple, dict)):
+            for profile in properties['__redis__']:
+                if profile not in (servers or _server_profiles):
+                    error = "Model \"%s\" sharded to non-existent Redis profile \"%s\"." % (name, profile)
+                    raise ValueError(error)
+            _shards_by_model[name] = HashRing(properties['__redis__'])
+
         # Resolve specific adapter, if listed explicitly
         if '__redis__' in properties and isinstance(properties.get('__redis__'), basestring):
-            if properties['__redis__'] not in servers:
+            if properties['__redis__'] not in (servers or _server_profiles):
                 error = "Model \"%s\" mapped to non-existent Redis profile \"%s\"." % (name, properties['__redis__'])
                 raise ValueError(error)
             else:
-                _profiles_by_model['index'].add(name)
-                _profiles_by_model['map'][name] = servers.get(properties['__redis__'], _default_profile)
+                _profiles_by_model.setdefault('index', set()).add(name)
+                _profiles_by_model.setdefault('map', {})[name] = properties['__redis__']
+
+        # Resolve specific storage mode, if listed explicitly
+        if '__redis_mode__' in properties:
+            if properties['__redis_mode__'] not in frozenset((RedisMode.toplevel_blob, RedisMode.hashkind_blob,
+                                                              RedisMode.hashkey_blob, RedisMode.hashkey_hash)):
+                error = "Model \"%s\" mapped to invalid Redis mode \"%s\"." % (name, properties['__redis_mode__'])
+                raise ValueError(error)
+            _modes_by_model[name] = properties['__redis_mode__']
+
+        # Resolve specific read consistency, if listed explicitly
+        if '__redis_consistency__' in properties:
+            if properties['__redis_consistency__'] not in frozenset((RedisConsistency.eventual,
+                                                                     RedisConsistency.session,
+                                                                     RedisConsistency.strong)):
+                error = "Model \"%s\" mapped to invalid Redis consistency \"%s\"." % (
+                    name, properties['__redis_consistency__'])
+                raise ValueError(error)
+            _consistency_by_model[name] = properties['__redis_consistency__']
+
+        # Build (and warm) the connection pools for this model's profile(s)
+        try:
+            if name in _shards_by_model:
+                map(cls.pool, _shards_by_model[name].profiles)
+            else:
+                cls.pool(_profiles_by_model.get('map', {}).get(name, _default_profile))
+        except cls.adapter.ConnectionError as e:  # pragma: no cover
+            cls.logging.warning("Failed to warm Redis connection pool: \"%s\"." % e)
 
         return super(RedisAdapter, cls).acquire(name, bases, properties)
 
     @classmethod
-    def channel(cls, kind):
+    def pool(cls, profile=None):
+
+        ''' Resolve the shared :py:class:`ConnectionPool` for a server profile,
+            building it on first use. Profiles that point to another profile by
+            name share that profile's pool.
+
+            Pool options (``max_connections``, ``timeout``, ``health_check`` and
+            ``warm``) may sit at the top level of the profile or under a ``pool``
+            key; everything else (except replica options, see :py:meth:`replicas`)
+            is passed through to the connections.
+
+            :param profile: Name of the server profile. Defaults to the default profile.
+            :raises redis.ConnectionError: If the pool asks to be warmed and the
+            server cannot be reached. The pool is still registered.
+            :returns: The profile's :py:class:`ConnectionPool`. '''
+
+        profile = profile or _default_profile
+        while isinstance(_server_profiles.get(profile), basestring):
+            profile = _server_profiles[profile]  # if it's a string, it's a pointer to a profile
+
+        if profile not in _connection_pools:
+            config = dict(_server_profiles[profile])
+            for option in ('default', 'replicas', 'replica_strategy', 'replica_probe'):
+                config.pop(option, None)
+            config.update(config.pop('pool', {}))
+            pool = _connection_pools[profile] = ConnectionPool(profile, **config)
+            if pool.warm:
+                pool.prime()
+        return _connection_pools[profile]
+
+    @classmethod
+    def pool_stats(cls):
+
+        ''' Report usage for every connection pool built so far.
+
+            :returns: ``dict`` of server profile names to
+            :py:meth:`ConnectionPool.stats` snapshots. '''
+
+        return dict((profile, pool.stats()) for profile, pool in _connection_pools.items())
+
+    @classmethod
+    def channel(cls, kind, key=None):
 
         ''' Retrieve a write channel to Redis.
 
             :param kind: String :py:class:`model.Model` kind to retrieve a channel for.
+            :param key: Optional key the channel is for, as a :py:class:`model.Key`, a
+            ``(<joined>, <flattened>)`` tuple or an encoded key. Entities of sharded
+            kinds are routed by key - without one, the kind's home shard is returned
+            (use :py:meth:`channels` for operations spanning the whole kind).
             :returns: Acquired ``Redis`` client connection, potentially specific to the
-            handed-in ``kind``. '''
+            handed-in ``kind`` (and ``key``). '''
 
         # convert to string kind if we got a model class
         if not isinstance(kind, basestring) and kind is not None:
             kind = kind.kind()
 
+        # sharded kinds are routed by entity group, on a consistent-hash ring
+        if kind in _shards_by_model:
+            return cls.client(_shards_by_model[kind].route(cls.shard_key(key) if key is not None else kind))
+
         # check for existing connection
         if kind in _client_connections:
 
@@ -354,24 +1018,191 @@ class RedisAdapter(IndexedModelAdapter):
 
         # check kind-specific profiles
         if kind in _profiles_by_model.get('index', set()):
-            client = _client_connections[kind] = cls.adapter.StrictRedis(**_profiles_by_model['map'].get(kind))
-            ## @TODO: patch client with connection/workerpool (if gevent)
+            pool = cls.pool(_profiles_by_model['map'][kind])
+            client = _client_connections[kind] = cls.adapter.StrictRedis(connection_pool=pool)
             return client
 
-        ## @TODO: patch client with connection/workerpool (if gevent)
-
         # check for cached default connection
         if '__default__' in _client_connections:
             return _client_connections['__default__']
 
         # otherwise, build new default
-        default_profile = _server_profiles[_default_profile]
-        if isinstance(default_profile, basestring):
-            profile = _server_profiles[default_profile]  # if it's a string, it's a pointer to a profile
-
-        client = _client_connections['__default__'] = cls.adapter.StrictRedis(**profile)
+        client = _client_connections['__default__'] = cls.adapter.StrictRedis(connection_pool=cls.pool())
         return client
 
+    @classmethod
+    def channels(cls, kind):
+
+        ''' Retrieve every channel holding entities of a kind.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :returns: ``list`` of ``Redis`` clients - one per shard for sharded
+            kinds, otherwise just the kind's :py:meth:`channel`. '''
+
+        if kind in _shards_by_model:
+            return [cls.client(profile) for profile in _shards_by_model[kind].profiles]
+        return [cls.channel(kind)]
+
+    @classmethod
+    def client(cls, profile):
+
+        ''' Retrieve a client for a specific server profile, over its shared
+            connection pool (see :py:meth:`pool`).
+
+            :param profile: Name of the server profile.
+            :returns: ``Redis`` client connection. '''
+
+        if ('__profile__', profile) not in _client_connections:
+            _client_connections[('__profile__', profile)] = cls.adapter.StrictRedis(connection_pool=cls.pool(profile))
+        return _client_connections[('__profile__', profile)]
+
+    @classmethod
+    def shard_key(cls, key):
+
+        ''' Resolve the value a key is placed on a sharded kind's hash ring
+            by: its encoded *root* key, so every entity in an entity group
+            lands on the same shard (and group writes stay transactional).
+
+            :param key: :py:class:`model.Key`, ``(<joined>, <flattened>)`` tuple or encoded key.
+            :returns: Encoded root key. '''
+
+        if isinstance(key, basestring):
+            key = cls.decode_key(key)
+        flattened = key[1] if isinstance(key, tuple) else key.flatten(True)[1]
+
+        while flattened[0]:  # decoded root keys have an empty (rather than `None`) parent
+            flattened = flattened[0][1]
+        return cls.encode_key(cls._chunk_separator.join((u'' if i is None else unicode(i) for i in flattened)), flattened)
+
+    @classmethod
+    def resolve_profile(cls, kind, key=None):
+
+        ''' Resolve the name of the server profile holding a kind (and, for
+            sharded kinds, a key). See :py:meth:`channel`.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param key: Optional key, in any form :py:meth:`shard_key` accepts.
+            :returns: Server profile name. '''
+
+        if kind in _shards_by_model:
+            profile = _shards_by_model[kind].route(cls.shard_key(key) if key is not None else kind)
+        else:
+            profile = _profiles_by_model.get('map', {}).get(kind, _default_profile)
+
+        while isinstance(_server_profiles.get(profile), basestring):
+            profile = _server_profiles[profile]  # if it's a string, it's a pointer to a profile
+        return profile
+
+    @classmethod
+    def replicas(cls, profile):
+
+        ''' Resolve the :py:class:`ReplicaSet` for a server profile, if it
+            declares any replicas. Profiles list them under ``replicas``, as
+            names of other profiles or as inline profile ``dict``s, and may
+            set a ``replica_strategy`` (``round_robin`` or ``latency``) and a
+            ``replica_probe`` interval, in seconds.
+
+            :param profile: Name of the server profile.
+            :returns: :py:class:`ReplicaSet`, or ``None`` for profiles without replicas. '''
+
+        if profile not in _replica_sets:
+            config, names = _server_profiles.get(profile) or {}, []
+            for index, replica in enumerate(config.get('replicas') or []):
+                if isinstance(replica, dict):
+                    name = cls._magic_separator.join((profile, 'replica', str(index)))
+                    _server_profiles.setdefault(name, replica)  # inline replicas become profiles of their own
+                    replica = name
+                names.append(replica)
+
+            _replica_sets[profile] = ReplicaSet([cls.client(name) for name in names], config.get('replica_strategy'),
+                                                config.get('replica_probe')) if names else None
+        return _replica_sets[profile]
+
+    @classmethod
+    def reader(cls, kind, key=None, consistency=None):
+
+        ''' Retrieve a read channel to Redis: a replica of the profile holding
+            ``kind`` (and ``key``), if it has any and the read's consistency
+            allows, otherwise the primary (see :py:meth:`channel`). Writes and
+            ID allocation always go through :py:meth:`channel`.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param key: Optional key, for sharded kinds.
+            :param consistency: Optional :py:class:`RedisConsistency` level for this
+            read. Defaults to the model's ``__redis_consistency__``, then
+            :py:attr:`EngineConfig.consistency`.
+            :returns: ``Redis`` client connection. Replicas are read-only, so reads
+            that have to write go to the primary instead (see :py:meth:`_primary_of`). '''
+
+        if not isinstance(kind, basestring) and kind is not None:
+            kind = kind.kind()
+
+        return cls._replica_for(cls.resolve_profile(kind, key), kind, consistency) or cls.channel(kind, key)
+
+    @classmethod
+    def readers(cls, kind, consistency=None):
+
+        ''' Retrieve read channels covering every entity of a kind: one per
+            shard for sharded kinds (see :py:meth:`channels`), each a replica
+            where :py:meth:`reader` would pick one.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param consistency: Optional :py:class:`RedisConsistency` level.
+            :returns: ``list`` of ``Redis`` clients. '''
+
+        if kind in _shards_by_model:
+            return [cls._replica_for(profile, kind, consistency) or cls.client(profile)
+                    for profile in _shards_by_model[kind].profiles]
+        return [cls.reader(kind, None, consistency)]
+
+    @classmethod
+    def _replica_for(cls, profile, kind, consistency=None):
+
+        ''' Pick a replica of ``profile`` to serve a read of ``kind``, if the
+            read's consistency allows it.
+
+            :returns: A replica's ``Redis`` client, or ``None`` to read from the primary. '''
+
+        replicas = cls.replicas(profile)
+        if replicas is None:
+            return None
+
+        consistency = consistency or _consistency_by_model.get(kind) or cls.EngineConfig.consistency
+        if consistency == RedisConsistency.strong:
+            return None
+        if consistency == RedisConsistency.session and (
+                (time.time() - _last_writes.get(profile, 0)) < cls.EngineConfig.session_window):
+            return None  # we wrote here recently: read our own writes from the primary
+        return replicas.pick()
+
+    @classmethod
+    def _primary_of(cls, channel):
+
+        ''' Resolve the primary behind a read channel, for reads that have to
+            write (such as queries building temporary sets), as replicas are
+            read-only.
+
+            :param channel: ``Redis`` client, as returned by :py:meth:`reader`.
+            :returns: The primary's ``Redis`` client, or ``channel`` itself if it
+            isn't a replica. '''
+
+        for profile, replicas in _replica_sets.items():
+            if replicas is not None and channel in replicas.clients:
+                return cls.client(profile)
+        return channel
+
+    @classmethod
+    def _wrote(cls, kind, key=None):
+
+        ''' Note a write to the profile holding ``kind`` (and ``key``), for
+            ``session`` consistency (see :py:meth:`reader`).
+
+            :returns: Nothing. '''
+
+        profile = cls.resolve_profile(kind, key)
+        if cls.replicas(profile) is not None:
+            _last_writes[profile] = time.time()
+
     @classmethod
     def execute(cls, operation, kind, *args, **kwargs):
 
@@ -392,274 +1223,903 @@ class RedisAdapter(IndexedModelAdapter):
 
         try:
             if isinstance(operation, tuple):
-                operation = '_'.join([operation])  # reduce (CLIENT, KILL) to 'client_kill' (for example)
+                operation = '_'.join(operation)  # reduce (CLIENT, KILL) to 'client_kill' (for example)
             if isinstance(target, (_redis_client.client.Pipeline, _redis_client.client.StrictPipeline)):
                 getattr(target, operation.lower())(*args, **kwargs)
                 return target
             return getattr(target, operation.lower())(*args, **kwargs)
         except Exception as e:
-            import pdb; pdb.set_trace()
+            if cls.config.get('debug', False):  # pragma: no cover
+                cls.logging.error("Redis operation \"%s\" failed: \"%s\"." % (operation, e))
             raise
 
-    @classmethod
-    def get(cls, key, pipeline=None, _entity=None):
+    def _put(self, entity, **kwargs):
 
-        ''' Retrieve an entity by Key from Redis.
+        ''' Persist an entity and its indexes to Redis in one round-trip.
+            Buffers the entity write, meta indexes and property indexes
+            in a single pipeline, which is wrapped in ``MULTI``/``EXEC``
+            unless :py:attr:`EngineConfig.transactional` is disabled (or
+            ``transactional=False`` is passed in).
 
-            :param key: Target :py:class:`model.Key` to retrieve from storage.
-            :returns: The deserialized and decompressed entity associated with
-            the target ``key``. '''
+            :param entity: Entity :py:class:`model.Model` to persist.
+            :param pipeline: Optional existing pipeline to buffer writes in,
+            in which case the caller is responsible for executing it.
+            :returns: Resulting :py:class:`model.Key` from write operation. '''
 
-        if key:
-            joined, flattened = key
-        if cls.EngineConfig.mode == RedisMode.toplevel_blob:
+        transactional = kwargs.pop('transactional', self.EngineConfig.transactional)
 
-            if _entity:
-                result = _entity
-            else:
-                # execute query
-                result = cls.execute(cls.Operations.GET, flattened[1], joined, target=pipeline)
+        # caller-managed pipeline: just buffer
+        if kwargs.get('pipeline') is not None:
+            self._wrote(entity.kind(), entity.key)
+            return super(RedisAdapter, self)._put(entity, **kwargs)
 
-            if isinstance(result, basestring):
+        self._allocate_sharded([entity])
+        with self.channel(entity.kind(), entity.key).pipeline(transaction=transactional) as pipeline:
+            super(RedisAdapter, self)._put(entity, pipeline=pipeline, **kwargs)
+            pipeline.execute()
+        self._wrote(entity.kind(), entity.key)
+        self._evict([entity.key])
+        return entity.key
 
-                # account for none, optionally decompress
-                if cls.EngineConfig.compression:
-                    result = cls.compressor.decompress(result)
+    def _put_multi(self, entities, **kwargs):
 
-                # deserialize structures
-                return cls.serializer.loads(result)
+        ''' Persist a batch of entities and their indexes to Redis, with one
+            pipeline (and, by default, one ``MULTI``/``EXEC`` transaction)
+            per server.
 
-        elif cls.EngineConfig.mode == RedisMode.hashkind_blob:
+            :param entities: Iterable of :py:class:`model.Model` entities to persist.
+            :param pipeline: Optional existing pipeline to buffer writes in,
+            in which case the caller is responsible for executing it.
+            :returns: ``list`` of resulting :py:class:`model.Key` objects. '''
 
-            if _entity:
-                result = _entity
+        transactional = kwargs.pop('transactional', self.EngineConfig.transactional)
 
-            ## @TODO: `get` for `hashkind_blob` mode
-            pass
+        # caller-managed pipeline: just buffer
+        if kwargs.get('pipeline') is not None:
+            for entity in entities:
+                self._wrote(entity.kind(), entity.key)
+            return super(RedisAdapter, self)._put_multi(entities, **kwargs)
 
-        elif cls.EngineConfig.mode == RedisMode.hashkey_blob:
+        # group entities by channel, so each server gets one pipeline
+        batches = {}
+        self._allocate_sharded(entities)
+        for entity in entities:
+            batches.setdefault(self.channel(entity.kind(), entity.key), []).append(entity)
 
-            if _entity:
-                result = _entity
+        for channel, batch in batches.iteritems():
+            with channel.pipeline(transaction=transactional) as pipeline:
+                super(RedisAdapter, self)._put_multi(batch, pipeline=pipeline, **kwargs)
+                pipeline.execute()
+            self._wrote(batch[0].kind(), batch[0].key)
+        self._evict([entity.key for entity in entities])
+        return [entity.key for entity in entities]
 
-            ## @TODO: `get` for `hashkey_blob`
-            pass
+    def _delete(self, key, **kwargs):
 
-        elif cls.EngineConfig.mode == RedisMode.hashkey_hash:
+        ''' Delete an entity and clean its index entries in one round-trip,
+            wrapped in ``MULTI``/``EXEC`` unless :py:attr:`EngineConfig.transactional`
+            is disabled (or ``transactional=False`` is passed in).
 
-            if _entity:
-                result = _entity
+            :param key: Target :py:class:`model.Key` to delete.
+            :param pipeline: Optional existing pipeline to buffer commands in,
+            in which case the caller is responsible for executing it.
+            :returns: Result of the low-level delete operation. '''
 
-            ## @TODO: `get` for `hashkey_hash`
-            pass
+        transactional = kwargs.pop('transactional', self.EngineConfig.transactional)
 
-        # @TODO: different storage internal modes
+        self._wrote(key.kind, key)
 
-    @classmethod
-    def put(cls, key, entity, model, pipeline=None):
+        # caller-managed pipeline: just buffer
+        if kwargs.get('pipeline') is not None:
+            return super(RedisAdapter, self)._delete(key, **kwargs)
 
-        ''' Persist an entity to storage in Redis.
+        with self.channel(key.kind, key).pipeline(transaction=transactional) as pipeline:
+            super(RedisAdapter, self)._delete(key, pipeline=pipeline, **kwargs)
+            result = pipeline.execute()[-1]  # entity delete is buffered last
+        self._evict([key])
+        return result
 
-            :param key: New (and potentially empty) :py:class:`model.Key` for
-            ``entity``. Must be assigned an ``ID`` by the driver
-            through :py:meth:`RedisAdapter.allocate_ids` in the case
-            of an empty (non-deterministic) :py:class:`model.Key`.
+    def _delete_multi(self, keys, **kwargs):
 
-            :param entity: Object entity :py:class:`model.Model` to persist in
-            ``Redis``.
+        ''' Delete a batch of entities and clean their index entries, with one
+            pipeline (and, by default, one ``MULTI``/``EXEC`` transaction) per server.
 
-            :param model: Schema :py:class:`model.Model` associated with the
-            target ``entity`` being persisted.
+            :param keys: Iterable of :py:class:`model.Key` objects to delete.
+            :param pipeline: Optional existing pipeline to buffer commands in,
+            in which case the caller is responsible for executing it.
+            :returns: ``list`` of low-level delete results, in the same order as ``keys``. '''
 
-            :returns: Result of the lower-level write operation. '''
+        transactional = kwargs.pop('transactional', self.EngineConfig.transactional)
 
-        # reduce entity to dictionary
-        serialized = entity.to_dict()
-        joined, flattened = key
+        for key in keys:
+            self._wrote(key.kind, key)
 
-        if cls.EngineConfig.mode == RedisMode.toplevel_blob:
+        # caller-managed pipeline: just buffer
+        if kwargs.get('pipeline') is not None:
+            return super(RedisAdapter, self)._delete_multi(keys, **kwargs)
 
-            # serialize + optionally compress
-            serialized = cls.serializer.dumps(serialized)
-            if cls.EngineConfig.compression:
-                serialized = cls.compressor.compress(serialized)
+        # group keys by channel, so each server gets one pipeline
+        results, batches = [None] * len(keys), {}
+        for index, key in enumerate(keys):
+            batches.setdefault(self.channel(key.kind, key), []).append((index, key))
+
+        for channel, batch in batches.iteritems():
+            with channel.pipeline(transaction=transactional) as pipeline:
+                super(RedisAdapter, self)._delete_multi([key for index, key in batch], pipeline=pipeline, **kwargs)
 
-            # delegate to redis client
-            return cls.execute(cls.Operations.SET, flattened[1], joined, serialized, target=pipeline)
+                # entity deletes are buffered last, one per key
+                for (index, key), result in zip(batch, pipeline.execute()[-len(batch):]):
+                    results[index] = result
+        self._evict(keys)
+        return results
 
-        elif cls.EngineConfig.mode == RedisMode.hashkind_blob:
-            ## @TODO: `put` for `hashkind_blob` mode
-            pass
+    def _evict(self, keys):
 
-        elif cls.EngineConfig.mode == RedisMode.hashkey_blob:
-            ## @TODO: `put` for `hashkey_blob`
-            pass
+        ''' Drop keys from their models' entity caches once pipelined writes
+            have executed. :py:class:`ModelAdapter` invalidates as commands are
+            buffered, and a read in between could cache what it saw.
 
-        elif cls.EngineConfig.mode == RedisMode.hashkey_hash:
-            ## @TODO: `put` for `hashkey_hash`
-            pass
+            :param keys: Iterable of written (or deleted) :py:class:`model.Key` objects.
+            :returns: Nothing. '''
 
-        # @TODO: different storage internal modes
+        self._invalidate(((key.kind, self._encode(key))
+                          for key in keys if self._cache(key.kind) is not None))
+
+    def _allocate_sharded(self, entities):
+
+        ''' Assign IDs to keyless entities of sharded kinds up-front, since
+            they are routed to a shard by key before they are written.
+
+            :param entities: Iterable of :py:class:`model.Model` entities.
+            :returns: Nothing. '''
+
+        keyless = {}
+        for entity in entities:
+            if entity.kind() in _shards_by_model and not entity.key and entity.kind() in self.registry:
+                keyless.setdefault(entity.kind(), []).append(entity)
+
+        for kind, batch in keyless.iteritems():
+            keyclass = self.registry[kind].__keyclass__
+            for entity, id in zip(batch, self.allocator.allocate(keyclass, kind, len(batch))):
+                entity._set_key(keyclass(kind, id))
 
     @classmethod
-    def delete(cls, key, pipeline=None):
+    def storage_mode(cls, kind):
 
-        ''' Delete an entity by Key from Redis.
+        ''' Resolve the storage mode for a given kind. Models may select a
+            mode explicitly via the ``__redis_mode__`` class property,
+            otherwise :py:attr:`EngineConfig.mode` is used.
 
-            :param key: Target :py:class:`model.Key`, whose associated
-            :py:class:`model.Model` is being deleted.
+            :param kind: String :py:class:`model.Model` kind (or model class).
+            :returns: One of the modes enumerated in :py:class:`RedisMode`. '''
 
-            :returns: The result of the low-level delete operation. '''
+        if not isinstance(kind, basestring) and kind is not None:
+            kind = kind.kind()
+        return _modes_by_model.get(kind, cls.EngineConfig.mode)
 
-        joined, flattened = key.flatten(True)
+    @classmethod
+    def _storage_address(cls, joined, flattened, mode):
+
+        ''' Resolve where an entity lives in Redis under a given storage mode.
 
-        if cls.EngineConfig.mode == RedisMode.toplevel_blob:
+            :param joined: Encoded :py:class:`model.Key` for the entity.
+            :param flattened: Flattened (raw) :py:class:`model.Key` for the entity.
+            :param mode: Storage mode, from :py:class:`RedisMode`.
+            :returns: Tupled ``(<redis key>, <hash field>)``, where the hash
+            field is ``None`` for modes that store at the top level. '''
 
-            # delegate to redis client with encoded key
-            return cls.execute(cls.Operations.DELETE, key.kind, cls.encode_key(joined, flattened), target=pipeline)
+        if mode in (RedisMode.toplevel_blob, RedisMode.hashkey_hash):
+            return joined, None  # stored directly at the encoded key
 
-        elif cls.EngineConfig.mode == RedisMode.hashkind_blob:
-            ## @TODO: `delete` for `hashkind_blob` mode
-            pass
+        if mode == RedisMode.hashkind_blob:
+            return cls._magic_separator.join([cls._hash_prefix, cls._kind_prefix, flattened[1]]), joined
 
-        elif cls.EngineConfig.mode == RedisMode.hashkey_blob:
-            ## @TODO: `delete` for `hashkey_blob`
-            pass
+        if mode == RedisMode.hashkey_blob:
 
-        elif cls.EngineConfig.mode == RedisMode.hashkey_hash:
-            ## @TODO: `delete` for `hashkey_hash`
-            pass
+            # walk up to the root key of the entity group
+            root_joined, root_flattened = joined, flattened
+            while root_flattened[0]:
+                root_joined, root_flattened = root_flattened[0]
+                root_joined = cls.encode_key(root_joined, root_flattened)
+            return cls._magic_separator.join([cls._hash_prefix, cls._group_prefix, root_joined]), joined
 
-        # @TODO: different storage internal modes
+        raise ValueError('Unknown `RedisAdapter` storage mode: "%s".' % mode)
 
     @classmethod
-    def allocate_ids(cls, key_class, kind, count=1, pipeline=None):
+    def _serialize(cls, data, mode):
 
-        ''' Allocate new :py:class:`model.Key` IDs up to ``count``. Allocated
-            IDs are guaranteed not to be provisioned or otherwise used by the
-            underlying persistence engine, and thus can be used for uniquely
-            identifying non-deterministic data.
+        ''' Serialize an entity's ``dict`` for storage under a given mode.
 
-            :param key_class: Descendent of :py:class:`model.Key`
-            to allocate IDs for.
+            :param data: Property ``dict`` from :py:meth:`model.Model.to_dict`.
+            :param mode: Storage mode, from :py:class:`RedisMode`.
+            :returns: Blob (``str``) for blob modes, or a ``dict`` of
+            serialized property values for :py:attr:`RedisMode.hashkey_hash`. '''
 
-            :param kind: String :py:class:`model.Model` kind name.
+        if mode == RedisMode.hashkey_hash:
 
-            :param count: The number of IDs to generate, which **must**
-            be greater than 1. Defaults to ``1``.
+            # serialize each property individually, flag empty entities so they still exist
+            fields = dict(((name, cls.serializer.dumps(value)) for name, value in data.iteritems()))
+            return fields or {cls._meta_prefix: ''}
 
-            :raises ValueError: In the case the ``count`` is less than ``1``.
-            :returns: If **only one** ID is requested, an **integer ID**
-            suitable for use in a :py:class:`model.Key` directly.
-            If **more than one** ID is requested, a **generator**
-            is returned, which ``yields`` a set of provisioned
-            integer IDs, each suitable for use in a
-            :py:class:`model.Key` directly. '''
+        # serialize + optionally compress
+        serialized = cls.serializer.dumps(data)
+        if cls.EngineConfig.compression:
+            serialized = cls.compressor.compress(serialized)
+        return serialized
 
-        if not count:
-            raise ValueError("Cannot allocate less than 1 ID's.")
+    @classmethod
+    def _deserialize(cls, raw, mode):
 
-        # generate kinded key to resolve ID pointer
-        kinded_key = key_class(kind)
-        joined, flattened = kinded_key.flatten(True)
+        ''' Inflate a raw value stored under a given mode.
 
-        if cls.EngineConfig.mode == RedisMode.toplevel_blob:
-            key_root_id = cls._magic_separator.join([cls._meta_prefix, cls.encode_key(joined, flattened)])
+            :param raw: Raw blob (or ``dict``, for :py:attr:`RedisMode.hashkey_hash`).
+            :param mode: Storage mode, from :py:class:`RedisMode`.
+            :returns: The deserialized entity ``dict``, or ``None`` if ``raw``
+            is empty (i.e. the entity was not found). '''
 
-            # increment by the amount desired
-            value = cls.execute(*(
-                cls.Operations.HASH_INCREMENT,
-                kinded_key.kind,
-                key_root_id,
-                cls._id_prefix,
-                count), target=pipeline)
+        if mode == RedisMode.hashkey_hash:
+            if not raw:
+                return None  # not found
+            return dict(((name, cls.serializer.loads(value)) for name, value in raw.iteritems()
+                         if name != cls._meta_prefix))
 
-        elif cls.EngineConfig.mode == RedisMode.hashkind_blob:
-            ## @TODO: `allocate_ids` for `hashkind_blob` mode
-            pass
+        if isinstance(raw, basestring):
 
-        elif cls.EngineConfig.mode == RedisMode.hashkey_blob:
-            ## @TODO: `allocate_ids` for `hashkey_blob`
-            pass
+            # account for none, optionally decompress
+            if cls.EngineConfig.compression:
+                raw = cls.compressor.decompress(raw)
 
-        elif cls.EngineConfig.mode == RedisMode.hashkey_hash:
-            ## @TODO: `allocate_ids` for `hashkey_hash`
-            pass
+            # deserialize structures
+            return cls.serializer.loads(raw)
 
-        if count > 1:
-            def _generate_range():
+    @classmethod
+    def _read(cls, joined, flattened, mode, pipeline=None):
 
-                ''' Generate a range of requested ID's.
+        ''' Issue the low-level read for an entity under a given mode.
 
-                    :yields: Each item in a set of provisioned integer IDs,
-                             suitable for use in a :py:class:`model.Key`. '''
+            :param pipeline: Optional pipeline to buffer the read in, or client to read from.
+            :returns: The raw stored value, or the ``pipeline`` if one was passed in. '''
 
-                bottom_range = (value - count)
-                for i in xrange(bottom_range, value):
-                    yield i
+        name, field = cls._storage_address(joined, flattened, mode)
+        target = pipeline if pipeline is not None else cls.channel(flattened[1], (joined, flattened))
 
-            return _generate_range
-        return value
+        if mode == RedisMode.toplevel_blob:
+            return cls.execute(cls.Operations.GET, flattened[1], name, target=target)
+        if mode == RedisMode.hashkey_hash:
+            return cls.execute(cls.Operations.HASH_GET_ALL, flattened[1], name, target=target)
+        return cls.execute(cls.Operations.HASH_GET, flattened[1], name, field, target=target)
 
     @classmethod
-    def encode_key(cls, joined, flattened):
+    def _write(cls, joined, flattened, data, mode, pipeline=None):
 
-        ''' Encode a Key for storage in ``Redis``. Since we don't need to
-            do anything fancy, just delegate this to the abstract (default)
-            encoder, which is ``base64``.
+        ''' Issue the low-level write for an entity under a given mode.
 
-            If :py:attr:`RedisEngine.EngineConfig.encoding` is disabled, this
-            simply returns the ``joined`` :py:class:`model.Key` (for reference,
-            see :py:meth:`model.Key.flatten`).
+            :returns: Result of the low-level write, or the ``pipeline`` if one was passed in. '''
 
-            :param joined: String-joined :py:class:`model.Key`.
+        name, field = cls._storage_address(joined, flattened, mode)
+        serialized = cls._serialize(data, mode)
+        target = pipeline if pipeline is not None else cls.channel(flattened[1], (joined, flattened))
 
-            :param flattened: Tupled ("raw format") :py:class:`model.Key`.
+        if mode == RedisMode.toplevel_blob:
+            return cls.execute(cls.Operations.SET, flattened[1], name, serialized, target=target)
 
-            :returns: In the case that ``encoding`` is *on*, the encoded string
-            :py:class:`model.Key`, suitable for storage in ``Redis``.
-            Otherwise (``encoding`` is *off*), the cleartext ``joined``
-            key. '''
+        if mode == RedisMode.hashkey_hash:
 
-        if cls.EngineConfig.encoding:
-            return abstract._encoder(joined)
-        return joined
+            # replace the whole hash, so properties that were unset don't linger
+            target = pipeline if pipeline is not None else target.pipeline()
+            cls.execute(cls.Operations.DELETE, flattened[1], name, target=target)
+            cls.execute(cls.Operations.HASH_MULTI_SET, flattened[1], name, serialized, target=target)
+            return target if pipeline is not None else target.execute()
+
+        return cls.execute(cls.Operations.HASH_SET, flattened[1], name, field, serialized, target=target)
 
     @classmethod
-    def write_indexes(cls, writes, pipeline=None, execute=True):  # pragma: no cover
+    def _remove(cls, joined, flattened, mode, pipeline=None):
 
-        ''' Write a batch of index updates generated earlier via
-            :py:meth:`RedisAdapter.generate_indexes`.
+        ''' Issue the low-level delete for an entity under a given mode.
 
-            :param writes: Batch of writes to commit to ``Redis``.
+            :returns: Result of the low-level delete, or the ``pipeline`` if one was passed in. '''
 
-            :param pipeline:
+        name, field = cls._storage_address(joined, flattened, mode)
+        target = pipeline if pipeline is not None else cls.channel(flattened[1], (joined, flattened))
 
-            :param execute:
+        if field is None:
+            return cls.execute(cls.Operations.DELETE, flattened[1], name, target=target)
+        return cls.execute(cls.Operations.HASH_DELETE, flattened[1], name, field, target=target)
 
-            :raises: :py:exc:`NotImplementedError`, as this method is not yet implemented.
+    @classmethod
+    def get(cls, key, pipeline=None, _entity=None, consistency=None):
 
-            :returns: '''
+        ''' Retrieve an entity by Key from Redis.
 
-        origin, meta, property_map = writes
+            :param key: Target :py:class:`model.Key` to retrieve from storage.
+            :param consistency: Optional :py:class:`RedisConsistency` level, for
+            profiles with replicas (see :py:meth:`reader`).
+            :returns: The deserialized and decompressed entity associated with
+            the target ``key``. '''
 
-        results, indexer_calls = [], []
+        mode = cls.storage_mode(key[1][1]) if key else cls.EngineConfig.mode
 
-        # resolve target (perhaps a pipeline?)
-        if pipeline:
-            target = pipeline
-        else:
-            target = cls.channel(cls._meta_prefix)
+        if _entity is not None:
+            return cls._deserialize(_entity, mode)  # decode a raw value we already have
 
-        for btype, bundle in (('meta', meta), ('property', property_map)):
+        joined, flattened = key
+        if pipeline is not None:
+            return cls._read(joined, flattened, mode, pipeline=pipeline)  # buffered
+        return cls._deserialize(cls._read(joined, flattened, mode, pipeline=cls.reader(flattened[1], key, consistency)),
+                                mode)
 
-            # add meta indexes first
-            for element in bundle:
+    @classmethod
+    def put(cls, key, entity, model, pipeline=None):
 
-                # provision args, kwargs, and hash components containers
-                args, kwargs, hash_c = [], {}, []
+        ''' Persist an entity to storage in Redis.
 
-                if btype is 'meta':
+            :param key: New (and potentially empty) :py:class:`model.Key` for
+            ``entity``. Must be assigned an ``ID`` by the driver
+            through :py:meth:`RedisAdapter.allocate_ids` in the case
+            of an empty (non-deterministic) :py:class:`model.Key`.
+
+            :param entity: Object entity :py:class:`model.Model` to persist in
+            ``Redis``.
+
+            :param model: Schema :py:class:`model.Model` associated with the
+            target ``entity`` being persisted.
+
+            :returns: Result of the lower-level write operation. '''
+
+        joined, flattened = key
+        return cls._write(joined, flattened, entity.to_dict(), cls.storage_mode(flattened[1]), pipeline=pipeline)
+
+    @classmethod
+    def delete(cls, key, pipeline=None):
+
+        ''' Delete an entity by Key from Redis.
+
+            :param key: Target :py:class:`model.Key`, whose associated
+            :py:class:`model.Model` is being deleted.
+
+            :returns: The result of the low-level delete operation. '''
+
+        joined, flattened = key
+        return cls._remove(joined, flattened, cls.storage_mode(flattened[1]), pipeline=pipeline)
+
+    @classmethod
+    def get_multi(cls, keys, pipeline=None, consistency=None):
+
+        ''' Retrieve a batch of entities by Key from Redis, with one
+            round-trip per server: an ``MGET`` for keys stored at the
+            top level, and a pipeline for everything else.
+
+            :param keys: List of ``(<joined Key repr>, <flattened key>)`` tuples.
+            :param consistency: Optional :py:class:`RedisConsistency` level, for
+            profiles with replicas (see :py:meth:`reader`).
+            :returns: ``list`` of deserialized entities, in the same order as
+            ``keys``, with ``None`` in place of entities that weren't found. '''
+
+        # group keys by channel, so we make one round-trip per server
+        results, batches = [None] * len(keys), {}
+        for index, (joined, flattened) in enumerate(keys):
+            batches.setdefault(cls.reader(flattened[1], (joined, flattened), consistency), []).append(
+                (index, joined, flattened))
+
+        for channel, batch in batches.iteritems():
+            modes = [cls.storage_mode(flattened[1]) for index, joined, flattened in batch]
+
+            if all((mode == RedisMode.toplevel_blob for mode in modes)):
+                raw = cls.execute(cls.Operations.MULTI_GET, None, [joined for index, joined, f in batch], target=channel)
+
+            else:
+                target = channel.pipeline(transaction=False)
+                for (index, joined, flattened), mode in zip(batch, modes):
+                    cls._read(joined, flattened, mode, pipeline=target)
+                raw = target.execute()
+
+            for (index, joined, flattened), mode, value in zip(batch, modes, raw):
+                results[index] = cls._deserialize(value, mode)
+        return results
+
+    @classmethod
+    def put_multi(cls, writes, pipeline=None):
+
+        ''' Persist a batch of entities to storage in Redis, with one
+            pipelined round-trip per server.
+
+            :param writes: List of ``(key, entity, model)`` tuples, in the
+            same format as the arguments to :py:meth:`put`.
+
+            :returns: ``list`` of results from the low-level write operations,
+            or the ``pipeline`` passed in (if any). '''
+
+        if pipeline is not None:
+            for key, entity, model in writes:
+                cls.put(key, entity, model, pipeline=pipeline)
+            return pipeline
+
+        # buffer writes in one pipeline per server
+        pipelines = {}
+        for key, entity, model in writes:
+            channel = cls.channel(key[1][1], key)
+            if channel not in pipelines:
+                pipelines[channel] = channel.pipeline()
+            cls.put(key, entity, model, pipeline=pipelines[channel])
+
+        return reduce(lambda left, right: left + right, [p.execute() for p in pipelines.itervalues()], [])
+
+    @classmethod
+    def delete_multi(cls, keys, pipeline=None):
+
+        ''' Delete a batch of entities by Key from Redis, with one
+            pipelined round-trip per server.
+
+            :param keys: List of ``(<joined Key repr>, <flattened key>)`` tuples.
+            :returns: ``list`` of results from the low-level delete operations,
+            in the same order as ``keys``, or the ``pipeline`` passed in (if any). '''
+
+        if pipeline is not None:
+            for key in keys:
+                cls.delete(key, pipeline=pipeline)
+            return pipeline
+
+        # buffer deletes in one pipeline per server
+        results, batches = [None] * len(keys), {}
+        for index, key in enumerate(keys):
+            batches.setdefault(cls.channel(key[1][1], key), []).append((index, key))
+
+        for channel, batch in batches.iteritems():
+            target = channel.pipeline()
+            for index, key in batch:
+                cls.delete(key, pipeline=target)
+            for (index, key), result in zip(batch, target.execute()):
+                results[index] = result
+        return results
+
+    @classmethod
+    def migrate(cls, model, source, target=None, batch_size=500):
+
+        ''' Migrate every entity of a kind from one storage mode to another.
+            Walks the kind index in batches - each batch is read with one
+            pipeline, and rewritten (new layout written, old layout removed)
+            in one ``MULTI``/``EXEC`` transaction.
+
+            Entities that can't be read in the ``source`` layout (because they
+            were already migrated, for instance) are skipped, so an interrupted
+            migration can safely be re-run.
+
+            :param model: :py:class:`model.Model` class (or string kind) to migrate.
+            :param source: Storage mode entities are currently stored in.
+            :param target: Storage mode to migrate to. Defaults to the model's
+            configured mode (see :py:meth:`storage_mode`).
+            :param batch_size: Number of entities to migrate per round-trip.
+            :returns: Count of entities that were migrated. '''
+
+        kind = model if isinstance(model, basestring) else model.kind()
+        target = target or cls.storage_mode(kind)
+
+        if source == target:
+            return 0
+
+        migrated = 0
+        for channel in cls.channels(kind):
+            for batch in cls._iter_kind(kind, batch_size, channel):
+                keys = [(encoded, cls.decode_key(encoded).flatten(True)[1]) for encoded in batch]
+
+                # read the batch in its old layout
+                reader = channel.pipeline(transaction=False)
+                for joined, flattened in keys:
+                    cls._read(joined, flattened, source, pipeline=reader)
+
+                # write the new layout and drop the old one atomically
+                writer = channel.pipeline(transaction=True)
+                for (joined, flattened), raw in zip(keys, reader.execute(raise_on_error=False)):
+                    data = None if isinstance(raw, Exception) else cls._deserialize(raw, source)
+                    if data is None:
+                        continue  # missing, or already migrated
+
+                    cls._remove(joined, flattened, source, pipeline=writer)
+                    cls._write(joined, flattened, data, target, pipeline=writer)
+                    migrated += 1
+                writer.execute()
+
+        # start using the new layout immediately
+        _modes_by_model[kind] = target
+        return migrated
+
+    @classmethod
+    def kind_index(cls, kind):
+
+        ''' Resolve the name of the ``kind`` meta index, which is a sorted
+            set of every encoded key of ``kind``, scored by key ID (see
+            :py:meth:`kind_score`).
+
+            :param kind: String :py:class:`model.Model` kind.
+            :returns: Name of the kind index in ``Redis``. '''
+
+        return cls._magic_separator.join([cls._kind_prefix, kind])
+
+    @classmethod
+    def kind_score(cls, key):
+
+        ''' Calculate the score for a :py:class:`model.Key` in its kind index.
+            Integer IDs sort numerically, while named keys share a score of
+            ``0`` (so ``Redis`` orders them lexically, by encoded key).
+
+            :param key: :py:class:`model.Key` to score.
+            :returns: Numeric score for ``key``. '''
+
+        if isinstance(key.id, (int, long)) and not isinstance(key.id, bool):
+            return key.id
+        return 0
+
+    @classmethod
+    def scan_kind(cls, kind, offset=0, limit=-1, ancestor=None, channel=None):
+
+        ''' Page through every encoded key of a kind, in key ID order, via
+            the kind index. Offset and limit are applied server-side with
+            ``ZRANGE``. Kind indexes written as plain sets by earlier
+            versions are walked with ``SSCAN`` cursors instead, and paged
+            client-side - no path ever falls back to ``KEYS``.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param offset: Number of keys to skip. Defaults to ``0``.
+            :param limit: Maximum number of keys to return, or ``-1`` (the default)
+            for no limit.
+            :param ancestor: Optional :py:class:`model.Key`, restricting results
+            to its descendants.
+            :param channel: Channel to scan. Defaults to the kind's :py:meth:`channel`
+            (or the ancestor's shard). Unrestricted scans of sharded kinds page
+            through every shard, and merge the results.
+            :returns: ``list`` of encoded keys. '''
+
+        offset = offset or 0
+        stop = -1 if (limit is None or limit < 0) else offset + limit - 1
+
+        index = cls.kind_index(kind)
+
+        # scatter across shards: take the first `offset + limit` keys from each, with their scores, then merge and page
+        if channel is None and ancestor is None and kind in _shards_by_model:
+            scored = []
+            for shard in cls.channels(kind):
+                try:
+                    scored.extend(cls.execute(cls.Operations.SORTED_RANGE, kind, index, 0, stop, withscores=True,
+                                              target=shard))
+                except _redis_client.exceptions.ResponseError:
+                    scored.extend(((encoded, cls._kind_order(encoded)[0])
+                                   for encoded in cls.scan_kind(kind, 0, stop + 1 or -1, None, shard)))
+            scored.sort(key=lambda (encoded, score): (score, encoded))
+            return [encoded for encoded, score in scored][offset:(None if stop < 0 else stop + 1)]
+
+        channel = channel or cls.channel(kind, ancestor)
+
+        # descendants of a non-root ancestor can't be picked from the group index alone, so filter client-side
+        client_side = ancestor is not None and bool(ancestor.parent)
+
+        try:
+            if ancestor is None:
+                matching_keys = cls.execute(cls.Operations.SORTED_RANGE, kind, index, offset, stop, target=channel)
+
+            else:
+                # intersect the kind index with the ancestor's entity group, keeping kind scores
+                root_key = [i for i in ancestor.ancestry][0]
+                group = cls._magic_separator.join([cls._group_prefix, cls._encode(root_key)])
+                temp = cls._magic_separator.join([cls._temp_prefix, uuid.uuid4().hex])
+
+                with channel.pipeline(transaction=True) as pipeline:
+                    pipeline.zinterstore(temp, {index: 1, group: 0})
+                    pipeline.zrange(temp, 0 if client_side else offset, -1 if client_side else stop)
+                    pipeline.delete(temp)
+                    matching_keys = pipeline.execute()[1]
+
+        except _redis_client.exceptions.ResponseError:
+
+            # legacy kind index (a plain set): walk it with cursors
+            matching_keys = [encoded for batch in cls._iter_kind(kind, channel=channel) for encoded in batch]
+            client_side = True
+
+        if not client_side:
+            return matching_keys
+
+        if ancestor is not None:
+            matching_keys = cls._filter_ancestry(matching_keys, ancestor)
+        return matching_keys[offset:(None if stop < 0 else stop + 1)]
+
+    @classmethod
+    def _iter_kind(cls, kind, batch_size=500, channel=None):
+
+        ''' Iterate over every entity of a kind, via the kind index, with
+            ``ZSCAN`` (or ``SSCAN``, for legacy set-based kind indexes) cursors.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param batch_size: Number of encoded keys to yield at a time.
+            :param channel: Channel to scan. Defaults to the kind's :py:meth:`channel`
+            (for sharded kinds, pass each of :py:meth:`channels` in turn).
+            :yields: Lists of encoded keys, at most ``batch_size`` long. '''
+
+        index, channel = cls.kind_index(kind), channel or cls.channel(kind)
+
+        if channel.type(index) == 'set':
+            members = channel.sscan_iter(index, count=batch_size)
+        else:
+            members = (encoded for encoded, score in channel.zscan_iter(index, count=batch_size))
+
+        batch = []
+        for encoded in members:
+            batch.append(encoded)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @classmethod
+    def allocate_ids(cls, key_class, kind, count=1, pipeline=None):
+
+        ''' Allocate new :py:class:`model.Key` IDs up to ``count``. Allocated
+            IDs are guaranteed not to be provisioned or otherwise used by the
+            underlying persistence engine, and thus can be used for uniquely
+            identifying non-deterministic data.
+
+            :param key_class: Descendent of :py:class:`model.Key`
+            to allocate IDs for.
+
+            :param kind: String :py:class:`model.Model` kind name.
+
+            :param count: The number of IDs to generate, which **must**
+            be greater than 1. Defaults to ``1``.
+
+            :raises ValueError: In the case the ``count`` is less than ``1``.
+            :returns: If **only one** ID is requested, an **integer ID**
+            suitable for use in a :py:class:`model.Key` directly.
+            If **more than one** ID is requested, a **generator**
+            is returned, which ``yields`` a set of provisioned
+            integer IDs, each suitable for use in a
+            :py:class:`model.Key` directly. '''
+
+        if not count:
+            raise ValueError("Cannot allocate less than 1 ID's.")
+
+        # generate kinded key to resolve ID pointer
+        kinded_key = key_class(kind)
+        joined, flattened = kinded_key.flatten(True)
+
+        # ID pointers live in a meta hash independent of storage mode and key packing, so they survive migrations
+        key_root_id = cls._magic_separator.join([cls._meta_prefix, abstract._encoder(joined) if (
+            cls.EngineConfig.encoding) else joined])
+
+        # increment by the amount desired
+        value = cls.execute(*(
+            cls.Operations.HASH_INCREMENT,
+            kinded_key.kind,
+            key_root_id,
+            cls._id_prefix,
+            count), target=pipeline)
+
+        if count > 1:
+            def _generate_range():
+
+                ''' Generate a range of requested ID's.
+
+                    :yields: Each item in a set of provisioned integer IDs,
+                             suitable for use in a :py:class:`model.Key`. '''
+
+                bottom_range = (value - count) + 1
+                for i in xrange(bottom_range, value + 1):
+                    yield i
+
+            return _generate_range
+        return value
+
+    @classmethod
+    def encode_key(cls, joined, flattened):
+
+        ''' Encode a Key for storage in ``Redis``. Since we don't need to
+            do anything fancy, just delegate this to the abstract (default)
+            encoder, which is ``base64``.
+
+            If :py:attr:`RedisEngine.EngineConfig.encoding` is disabled, this
+            simply returns the ``joined`` :py:class:`model.Key` (for reference,
+            see :py:meth:`model.Key.flatten`). If ``compact_keys`` is enabled,
+            either way, keys are packed by :py:attr:`codec` instead - which stores
+            far fewer bytes per key, in entity keys and every index member.
+
+            :param joined: String-joined :py:class:`model.Key`.
+
+            :param flattened: Tupled ("raw format") :py:class:`model.Key`.
+
+            :returns: In the case that ``encoding`` is *on*, the encoded string
+            :py:class:`model.Key`, suitable for storage in ``Redis``.
+            Otherwise (``encoding`` is *off*), the cleartext ``joined``
+            key. '''
+
+        if cls.EngineConfig.compact_keys:
+            packed = cls.codec.encode(flattened)
+            if packed is not None:
+                return packed
+        if cls.EngineConfig.encoding:
+            return abstract._encoder(joined)
+        return joined
+
+    @classmethod
+    def decode_key(cls, encoded, key_class=None):
+
+        ''' Inflate a :py:class:`model.Key` previously encoded for storage
+            via :py:meth:`encode_key`. Packed keys are recognized whether or not
+            ``compact_keys`` is (still) enabled.
+
+            :param encoded: Encoded (or, with ``encoding`` off, joined) key.
+            :param key_class: :py:class:`model.Key` class to inflate. Defaults
+            to :py:class:`model.Key`.
+            :returns: Inflated (and persisted) :py:class:`model.Key`. '''
+
+        if key_class is None:
+            from apptools import model
+            key_class = model.Key
+
+        if abstract.KeyCodec.compact(encoded):
+            def _decode():
+
+                ''' Unpack ``encoded``, remembering it as the key's encoded form. '''
+
+                key = cls.codec.decode(encoded, key_class)
+                key.__dict__['__encoded__'] = {cls.__name__: encoded}
+                return key
+            return key_class._intern(encoded, _decode)
+
+        if cls.EngineConfig.encoding:
+            return key_class.from_urlsafe(encoded, _persisted=True)
+        return key_class.from_raw(encoded, _persisted=True)
+
+    @classmethod
+    def kind_code(cls, kind):
+
+        ''' Assign (or look up) the :py:class:`abstract.KeyCodec` dictionary code for
+            ``kind``. The dictionary is a meta hash on the default server, mapping kinds
+            to codes and back, and codes are assigned atomically by a script.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :returns: Integer code. '''
+
+        return int(cls.execute(cls.Operations.EVALUATE, None, _LUA_KIND_CODE, 1,
+                               cls._magic_separator.join([cls._meta_prefix, cls._kinds_prefix]), kind))
+
+    @classmethod
+    def code_kind(cls, code):
+
+        ''' Look up the kind assigned a :py:class:`abstract.KeyCodec` dictionary code.
+
+            :param code: Integer code.
+            :returns: String :py:class:`model.Model` kind, or ``None``. '''
+
+        return cls.execute(cls.Operations.HASH_GET, None,
+                           cls._magic_separator.join([cls._meta_prefix, cls._kinds_prefix]), str(code))
+
+    @classmethod
+    def generate_indexes(cls, key, properties=None):
+
+        ''' Generate index writes for a :py:class:`model.Key` (and, optionally,
+            its indexed properties) via :py:meth:`IndexedModelAdapter.generate_indexes`.
+            The ``kind`` meta index is kept as a sorted set in ``Redis``, so its
+            entry is extended to ``(index, kind, score)`` (see :py:meth:`kind_score`).
+
+            Non-repeated string properties additionally get an entry in a
+            lexicographic sorted set (see :py:meth:`lex_index`), which serves
+            string sorts and range filters.
+
+            :param key: Target :py:class:`model.Key` to index.
+            :param properties: Entity :py:class:`model.Model` property values to index.
+            :returns: Tupled set of ``(encoded_key, meta_indexes[, property_indexes])``. '''
+
+        generated = super(RedisAdapter, cls).generate_indexes(key, properties)
+
+        if key is not None:
+            meta = generated[1]
+            for i, index in enumerate(meta):
+                if index == (cls._kind_prefix, key.kind):
+                    meta[i] = (cls._kind_prefix, key.kind, cls.kind_score(key))
+
+        if properties:
+            for name, (prop, value) in properties.items():
+                if cls._lexical(prop) and isinstance(value, basestring):
+                    generated[2].append((None, (cls._lex_prefix, key.kind, name, value)))
+        return generated
+
+    @classmethod
+    def lex_index(cls, kind, name):
+
+        ''' Resolve the name of the lexicographic index for a string property.
+            Members are the property value and encoded key, joined by a ``NUL``
+            byte, all at score ``0`` - so the set orders by value (then key), and
+            ``ZRANGEBYLEX`` can select value ranges.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param name: Property name.
+            :returns: Name of the lexicographic index in ``Redis``. '''
+
+        return cls._magic_separator.join([cls._lex_prefix, kind, name])
+
+    @classmethod
+    def _lexical(cls, prop):
+
+        ''' Determine whether a property is indexed lexicographically (see
+            :py:meth:`lex_index`). Repeated properties are not, as a sort or
+            range across several values per entity would be ambiguous.
+
+            :param prop: :py:class:`model.Property` descriptor.
+            :returns: ``bool``. '''
+
+        return prop._basetype in _LEXICAL_BASETYPES and not prop._repeated
+
+    @classmethod
+    def _reverse_entry(cls, handler, args):
+
+        ''' Resolve the reverse index entry (see :py:meth:`reverse_index`)
+            for an index write generated by :py:meth:`write_indexes`.
+
+            :param handler: Write operation.
+            :param args: Arguments to the write operation.
+            :returns: Tupled ``(<index name>, <index type>)``. Lexicographic
+            indexes are recorded as ``L`` followed by the indexed value, so the
+            member can be rebuilt for cleanup and read back for sorting. '''
+
+        if handler != cls.Operations.SORTED_ADD:
+            return args[1], 'S'
+        if args[1].startswith(cls._lex_prefix):
+            return args[1], u'L' + args[3].rsplit(u'\x00', 1)[0]
+        return args[1], 'Z'
+
+    @classmethod
+    def write_indexes(cls, writes, pipeline=None, execute=True):  # pragma: no cover
+
+        ''' Write a batch of index updates generated earlier via
+            :py:meth:`RedisAdapter.generate_indexes`.
+
+            Any index entries left over from a previous version of the entity
+            are cleaned first (see :py:meth:`clean_indexes`), and the new
+            entries are recorded in the entity's reverse index.
+
+            :param writes: Batch of writes to commit to ``Redis``.
+
+            :param pipeline: Optional pipeline to buffer index writes in.
+
+            :param execute: Whether to issue the writes. If falsy, the calls
+            that would be made are returned instead, as tupled
+            ``(<operation>, <args>, <kwargs>)``.
+
+            :returns: The ``pipeline`` if one was passed in, otherwise a
+            ``list`` of write results (or calls, if ``execute`` is falsy). '''
+
+        origin, meta, property_map = writes
+
+        results, indexer_calls = [], []
+
+        # resolve target (perhaps a pipeline?)
+        if pipeline:
+            target = pipeline
+        else:
+            target = cls.channel(cls.decode_key(origin).kind, origin)
+
+        for btype, bundle in (('meta', meta), ('property', property_map)):
+
+            # add meta indexes first
+            for element in bundle:
+
+                # kind indexes are sorted sets scored by key ID, so unfiltered queries can page server-side
+                if btype is 'meta' and element[0] == cls._kind_prefix and len(element) == 3:
+                    index, kind, score = element
+                    indexer_calls.append((cls.Operations.SORTED_ADD, (None, cls.kind_index(kind), score, origin),
+                                          {'target': target}))
+                    continue
+
+                # string values are also ordered in a lexicographic index, as `<value>\0<key>` members at score 0
+                if btype is 'property' and element[1][0] == cls._lex_prefix:
+                    index, kind, name, value = element[1]
+                    indexer_calls.append((cls.Operations.SORTED_ADD, (None, cls.lex_index(kind, name), 0,
+                                                                      u'%s\x00%s' % (value, origin)), {'target': target}))
+                    continue
+
+                # provision args, kwargs, and hash components containers
+                args, kwargs, hash_c = [], {}, []
+
+                if btype is 'meta':
                     # meta indexes are always unicode
                     converter, write = unicode, element
                 else:
@@ -749,31 +2209,990 @@ class RedisAdapter(IndexedModelAdapter):
                 indexer_calls.append((handler, tuple([None, cls._magic_separator.join(map(unicode, hash_c))] + args), {'target': target}))
 
         if execute:
+
+            # drop entries from any previous version of this entity, so overwrites don't leave stale members
+            results.append(cls.clean_indexes((origin, []), pipeline=pipeline))
+
             for handler, hargs, hkwargs in indexer_calls:
                 results.append(cls.execute(handler, *hargs, **hkwargs))
 
+            # record where this entity is indexed, so it can be cleaned exactly
+            results.append(cls.execute(cls.Operations.HASH_MULTI_SET, None, cls.reverse_index(origin), dict((
+                cls._reverse_entry(handler, hargs) for handler, hargs, hkwargs in indexer_calls)), target=target))
+
             if pipeline:
                 return pipeline
             return results
         return indexer_calls  # return calls only
 
     @classmethod
-    def clean_indexes(cls, key, pipeline=None):  # pragma: no cover
+    def update_indexes(cls, writes, pipeline=None):
+
+        ''' Incrementally update the indexes of a persisted entity: entries
+            for stored property values are removed, entries for new values are
+            added, and the entity's reverse index is updated to match. Nothing
+            is touched for properties that didn't change.
+
+            Every entry the reverse index holds under a changed property is
+            dropped as well (by a small Lua script, in the same round-trip), so
+            a concurrent write from another copy of the entity, whose stored
+            values differ from this copy's, can't leave entries behind.
+
+            :param writes: Tupled ``(<encoded key>, <removals>, <additions>)``,
+            from :py:meth:`IndexedModelAdapter._diff_indexed`.
+            :param pipeline: Optional pipeline to buffer commands in.
+            :returns: The ``pipeline`` if one was passed in, otherwise a
+            ``list`` of low-level results. '''
+
+        origin, removals, additions = writes
+        target = pipeline if pipeline is not None else cls.channel(cls.decode_key(origin).kind, origin).pipeline()
+        reverse = cls.reverse_index(origin)
+
+        # drop every entry recorded under a changed property, whichever copy of the entity wrote it
+        properties = sorted(set(((cls.lex_index(write[1], write[2]) if write[0] == cls._lex_prefix else
+                                  cls._magic_separator.join((write[0], cls._path_separator.join(write[1:-1]))))
+                                 for converter, write in removals + additions)))
+        if properties:
+            cls.execute(cls.Operations.EVALUATE, None, _LUA_CLEAN_PROPERTIES, 1, reverse, origin,
+                        cls._magic_separator, *properties, target=target)
+
+        # then stored values (for entities written before reverse indexes were kept) - a changed
+        # numeric value is removed and re-added to the same sorted set
+        if removals:
+            for handler, args, config in cls.write_indexes((origin, [], removals), None, False):
+                if handler == cls.Operations.SORTED_ADD:
+                    cls.execute(cls.Operations.SORTED_REMOVE, None, args[1], args[-1], target=target)
+                else:
+                    cls.execute(cls.Operations.SET_REMOVE, None, args[1], origin, target=target)
+                cls.execute(cls.Operations.HASH_DELETE, None, reverse, args[1], target=target)
 
-        ''' Clean indexes and index entries matching a particular
-            :py:class:`model.Key`, and generated via the adapter method
-            :py:meth:`RedisAdapter.generate_indexes`.
+        if additions:
+            calls = cls.write_indexes((origin, [], additions), None, False)
+            for handler, args, config in calls:
+                cls.execute(handler, *args, target=target)
+            cls.execute(cls.Operations.HASH_MULTI_SET, None, reverse, dict((
+                cls._reverse_entry(handler, args) for handler, args, config in calls)), target=target)
+
+        if pipeline is not None:
+            return pipeline
+        return target.execute()
+
+    @classmethod
+    def reverse_index(cls, encoded):
+
+        ''' Resolve the name of the reverse index for an encoded key. Reverse
+            indexes are hashes, mapping each index an entity is present in to
+            the type of that index (``Z`` for sorted sets, ``S`` for sets).
+
+            :param encoded: Encoded :py:class:`model.Key`.
+            :returns: Name of the reverse index in ``Redis``. '''
+
+        return cls._magic_separator.join([cls._reverse_prefix, encoded])
 
-            :param key: Target :py:class:`model.Key` to clean from ``Redis`` indexes.
-            :raises: :py:exc:`NotImplementedError`, as this method is not yet implemented. '''
+    @classmethod
+    def clean_indexes(cls, writes, pipeline=None):
+
+        ''' Clean index entries for a :py:class:`model.Key`, as generated
+            via :py:meth:`RedisAdapter.generate_indexes`. Entries are found
+            through the key's reverse index (see :py:meth:`reverse_index`)
+            and removed by a small Lua script, in the same round-trip (and
+            transaction, if ``pipeline`` is transactional) as the delete or
+            overwrite that triggered them.
+
+            Meta indexes passed in ``writes`` are also removed directly, which
+            covers entities written before reverse indexes were kept.
+
+            :param writes: Tupled ``(<encoded key>, <meta indexes>)``.
+            :param pipeline: Optional pipeline to buffer commands in.
+            :returns: Count of index entries cleaned via the reverse index, or
+            the ``pipeline`` if one was passed in. '''
+
+        origin, meta = writes[0], writes[1]
+        target = pipeline if pipeline is not None else cls.channel(cls.decode_key(origin).kind, origin).pipeline()
+
+        for element in meta:
+            if element[0] == cls._kind_prefix:
+                cls.execute(cls.Operations.SORTED_REMOVE, None, cls.kind_index(element[1]), origin, target=target)
+            else:
+                cls.execute(cls.Operations.SET_REMOVE, None, cls._magic_separator.join(element), origin, target=target)
 
-        raise NotImplementedError()
+        # `EVAL` rather than `EVALSHA`: Redis caches the compiled script, and pipelines can't check for it up front
+        cls.execute(cls.Operations.EVALUATE, None, _LUA_CLEAN_INDEXES, 1, cls.reverse_index(origin), origin,
+                    target=target)
+
+        if pipeline is not None:
+            return pipeline
+        return target.execute()[-1]
 
     @classmethod
-    def execute_query(cls, kind, spec, options, **kwargs):  # pragma: no cover
+    def _index_for(cls, kind, prop, value):
+
+        ''' Resolve the index a property value is written to, by running it
+            through :py:meth:`generate_indexes` and :py:meth:`write_indexes`
+            without executing anything.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param prop: :py:class:`model.Property` descriptor.
+            :param value: Property value to resolve the index for.
+            :returns: Tupled ``(<operation>, <index name>, <score>)``, where
+            ``score`` is ``None`` for unsorted (set) indexes. '''
+
+        from apptools import model
+
+        origin, meta, property_map = cls.generate_indexes(model.Key(kind), {
+            prop.name: (prop, [value] if prop._repeated else value)})
+        operation, args, config = cls.write_indexes((origin, [], property_map), None, False)[0]
+
+        if operation == cls.Operations.SORTED_ADD:
+            return operation, args[1], args[2]
+        return operation, args[1], None
+
+    @classmethod
+    def explain_query(cls, kind, spec, options, **kwargs):
+
+        ''' Plan a :py:class:`model.Query` without running it, estimating the
+            cost of every strategy it could be run with (see :py:meth:`plan_query`).
+
+            :param kind: :py:class:`model.Model` class being queried.
+            :param spec: Tupled ``(<filters>, <sorts>)``.
+            :param options: :py:class:`query.QueryOptions` for the query.
+            :returns: The :py:class:`QueryPlan` chosen for the query or, for
+            kinds sharded across several profiles, a ``list`` of the plans
+            chosen on each shard. '''
+
+        ancestor = options.ancestor or None
+        if isinstance(ancestor, basestring):
+            ancestor = cls.decode_key(ancestor)
+
+        if ancestor is None and kind.kind() in _shards_by_model:
+            channels = [cls._query_channel(kind.kind(), spec, reader)
+                        for reader in cls.readers(kind.kind(), options.consistency)]
+            return [cls.plan_query(kind.kind(), spec, options, None, channel, True) for channel in channels]
+        return cls.plan_query(kind.kind(), spec, options, ancestor, cls._query_channel(
+            kind.kind(), spec, cls.reader(kind, ancestor, options.consistency)), True)
+
+    @classmethod
+    def count_query(cls, kind, spec, options, **kwargs):
+
+        ''' Count the entities matching a :py:class:`model.Query`, from
+            indexes alone: ``ZCARD``, ``SCARD``, ``ZCOUNT`` or ``ZLEXCOUNT``
+            where one index answers the query, a cached ``SINTERSTORE``
+            (see :py:attr:`EngineConfig.count_ttl`) for several equality
+            filters on a primary, and a compiled query script counting
+            matches otherwise (replicas being read-only).
+
+            :param kind: :py:class:`model.Model` class being queried.
+            :param spec: Tupled ``(<filters>, <sorts>)``.
+            :param options: :py:class:`query.QueryOptions` for the query. The
+            ``offset`` and ``limit`` apply to the count.
+            :returns: Count of matching entities (``int``). '''
+
+        ancestor = options.ancestor or None
+        if isinstance(ancestor, basestring):
+            ancestor = cls.decode_key(ancestor)
+
+        # descendants of a non-root ancestor are only known client-side
+        if ancestor is not None and ancestor.parent:
+            return super(RedisAdapter, cls).count_query(kind, spec, options, **kwargs)
+
+        if ancestor is None and kind.kind() in _shards_by_model:
+            channels = cls.readers(kind.kind(), options.consistency)
+        else:
+            channels = [cls.reader(kind, ancestor, options.consistency)]
+
+        count = max(0, sum((int(cls._tally(kind.kind(), spec[0], options, ancestor, channel))
+                            for channel in channels)) - (options.offset or 0))
+        return count if (options.limit is None or options.limit < 0) else min(count, options.limit)
+
+    @classmethod
+    def aggregate_query(cls, kind, spec, options, prop, function, **kwargs):
+
+        ''' Aggregate a numeric property over the entities matching a
+            :py:class:`model.Query`, from its sorted index alone: ``min`` and
+            ``max`` of an unfiltered (or range-filtered) property read one end
+            of its index, and everything else runs in a query script.
+
+            :param kind: :py:class:`model.Model` class being queried.
+            :param spec: Tupled ``(<filters>, <sorts>)``.
+            :param options: :py:class:`query.QueryOptions` for the query.
+            :param prop: :py:class:`model.Property` to aggregate.
+            :param function: ``'sum'``, ``'min'``, ``'max'`` or ``'avg'``.
+
+            :raises NotImplementedError: For repeated properties, which have no
+            single value to aggregate per entity in ``Redis`` indexes.
+
+            :returns: Aggregated value, or ``None`` if nothing matched (except
+            for ``sum``, which is then ``0``). '''
+
+        if prop._repeated:
+            raise NotImplementedError('Aggregates are only supported in `Redis` for non-repeated properties.')
+
+        ancestor = options.ancestor or None
+        if isinstance(ancestor, basestring):
+            ancestor = cls.decode_key(ancestor)
+
+        if ancestor is not None and ancestor.parent:
+            return super(RedisAdapter, cls).aggregate_query(kind, spec, options, prop, function, **kwargs)
+
+        if ancestor is None and kind.kind() in _shards_by_model:
+            channels = cls.readers(kind.kind(), options.consistency)
+        else:
+            channels = [cls.reader(kind, ancestor, options.consistency)]
+
+        # combine each shard's `(<count>, <sum>, <min>, <max>)`
+        tallies = [cls._tally(kind.kind(), spec[0], options, ancestor, channel, prop, function) for channel in channels]
+        count, total = sum((int(t[0] or 0) for t in tallies)), sum((float(t[1] or 0) for t in tallies))
+        lows, highs = [float(t[2]) for t in tallies if t[2] is not None], [float(t[3]) for t in tallies if t[3] is not None]
+
+        value = {
+            'sum': lambda: total,
+            'min': lambda: min(lows) if lows else None,
+            'max': lambda: max(highs) if highs else None,
+            'avg': lambda: (total / count) if count else None
+        }[function]()
+
+        if value is None or function == 'avg' or prop._basetype is float:
+            return value
+        return prop._basetype(value)
+
+    @classmethod
+    def plan_query(cls, kind, spec, options, ancestor=None, channel=None, estimate=False):
+
+        ''' Choose how to run a query. Candidates are intersecting every set
+            index, or scanning one range index (or the ancestor's entity group)
+            and checking each candidate against the other filters - or walking
+            the index of a single sort (or, for unsorted queries with a limit,
+            the kind index) in order, checking every filter and stopping once
+            the page is full. Where there is a choice to make, cardinalities are
+            read from ``Redis`` (``SCARD``, ``ZCARD``, ``ZCOUNT`` and ``ZLEXCOUNT``,
+            in one round-trip) and the cheapest candidate is picked.
+
+            A ``hint`` in ``options`` (a property name, ``query.KEY_KIND`` or
+            ``query.KEY_ANCESTOR``) forces scanning that index instead, as does
+            a :py:class:`QueryPlan` passed back in as the ``plan`` option.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param spec: Tupled ``(<filters>, <sorts>)``.
+            :param options: :py:class:`query.QueryOptions` for the query.
+            :param ancestor: Optional ancestor :py:class:`model.Key`.
+            :param channel: ``Redis`` client to read cardinalities from.
+            :param estimate: Whether to estimate costs even if there's no choice
+            to make (for :py:meth:`explain_query`).
+
+            :raises ValueError: If the ``hint`` doesn't match a filter.
+
+            :returns: :py:class:`QueryPlan`. '''
+
+        sources = cls._query_sources(kind, spec)
+        sets, ranges, orders, excluded, temps = sources
+        group = cls._group_index(ancestor) if ancestor is not None else None
+        window = None if (options.limit is None or options.limit < 0) else (options.offset or 0) + options.limit + 1
+        indexes = {'intersect': [None], 'set': [s[0] for s in sets], 'range': [r[0] for r in ranges],
+                   'group': [group], 'kind': [cls.kind_index(kind)]}
+        index = lambda driver: orders[0][0] if driver[0] == 'sort' else indexes[driver[0]][driver[1] or 0]
+
+        # candidate drivers: intersect the sets, or scan one range or the entity group (the kind, if nothing else)
+        drivers = ([('intersect', None)] if sets else []) + [('range', i) for i in xrange(len(ranges))] + (
+            [('group', None)] if group else [])
+
+        # ...or walk a single sort's index (within a range over the same index), or the kind index if unsorted
+        if len(orders) == 1:
+            drivers.append(('sort', ([i for i, r in enumerate(ranges) if r[0] == orders[0][0]] or [None])[0]))
+        elif not orders and drivers and window is not None:
+            drivers.append(('kind', None))
+        drivers = drivers or [('kind', None)]
+
+        forced = None
+        if options.hint is not None:
+            forced = cls._hinted(options.hint, sets, ranges, group)
+        elif isinstance(options.plan, QueryPlan) and options.plan.driver in drivers + [('kind', None)] + [
+                ('set', i) for i in xrange(len(sets))]:
+            forced = options.plan.driver
+
+        if forced or len(drivers) == 1:
+            driver = forced or drivers[0]
+            if not estimate:
+                return QueryPlan(driver, index(driver), sources)
+        else:
+            driver = None
+
+        # estimate every candidate (and the kind, for comparison)
+        estimates = cls._estimate(kind, sources, group, channel or cls.channel(kind, ancestor))
+        costs = dict(((candidate, cls._cost(candidate, sources, group, estimates, window))
+                      for candidate in set(drivers + [('kind', None), driver or drivers[0]])))
+        driver = driver or min(drivers, key=lambda candidate: (costs[candidate], drivers.index(candidate)))
+        return QueryPlan(driver, index(driver), sources, estimates, costs)
+
+    @classmethod
+    def _hinted(cls, hint, sets, ranges, group):
+
+        ''' Resolve a query ``hint`` to the driver it forces (see :py:meth:`plan_query`).
+
+            :param hint: Property name, ``query.KEY_KIND`` or ``query.KEY_ANCESTOR``.
+            :param sets: Set indexes of the query, from :py:meth:`_query_sources`.
+            :param ranges: Range indexes of the query, from :py:meth:`_query_sources`.
+            :param group: Entity group index of the query, if any.
+            :raises ValueError: If the ``hint`` doesn't match a filter.
+            :returns: Tupled ``(<driver>, <position>)``. '''
+
+        from apptools.model import query
+
+        if hint is query.KEY_KIND:
+            return 'kind', None
+        if hint is query.KEY_ANCESTOR and group:
+            return 'group', None
+
+        for i, (index, low, high, lexical, name) in enumerate(ranges):
+            if name == hint:
+                return 'range', i
+        for i, (index, name) in enumerate(sets):
+            if name == hint:
+                return 'set', i
+        raise ValueError('Query hint "%s" does not match any filter of the query.' % hint)
+
+    @classmethod
+    def _estimate(cls, kind, sources, group, channel):
+
+        ''' Read the cardinality of every index a query could be driven by, in
+            one round-trip. Temporary sets are built first (so they can be
+            counted), and left for the query itself to use.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param sources: Query indexes, from :py:meth:`_query_sources`.
+            :param group: Entity group index of the query, if any.
+            :param channel: ``Redis`` client to read from.
+            :returns: ``dict`` of cardinalities: ``sets`` and ``ranges`` (each
+            a ``list``), ``group``, ``kind`` and ``sort`` (the index of a single
+            sort, if sorted by one property). '''
+
+        sets, ranges, orders, excluded, temps = sources
+        sort = orders[0][0] if len(orders) == 1 else None
+
+        with channel.pipeline(transaction=False) as pipeline:
+            cls._build_temps(temps, pipeline)
+            for index, name in sets:
+                cls.execute(cls.Operations.SET_CARDINALITY, None, index, target=pipeline)
+            for index, low, high, lexical, name in ranges:
+                cls.execute(cls.Operations.SORTED_LEX_COUNT if lexical else cls.Operations.SORTED_COUNT, None,
+                            index, low, high, target=pipeline)
+            if group:
+                cls.execute(cls.Operations.SET_CARDINALITY, None, group, target=pipeline)
+            cls.execute(cls.Operations.SORTED_CARDINALITY, None, cls.kind_index(kind), target=pipeline)
+            if sort:
+                cls.execute(cls.Operations.SORTED_CARDINALITY, None, sort, target=pipeline)
+            counts = pipeline.execute()[-(len(sets) + len(ranges) + (1 if group else 0) + (2 if sort else 1)):]
+
+        counts, last = counts[:len(sets) + len(ranges)], counts[len(sets) + len(ranges):]
+        return {
+            'sets': counts[:len(sets)],
+            'ranges': counts[len(sets):],
+            'group': last.pop(0) if group else None,
+            'kind': last.pop(0),
+            'sort': last.pop(0) if sort else None
+        }
+
+    @classmethod
+    def _cost(cls, driver, sources, group, estimates, window=None):
+
+        ''' Estimate the cost of running a query with a given driver, in index
+            entries touched: those read to gather candidates, plus one lookup
+            per candidate for each filter left to check (lexicographic ranges
+            are read once, into a lookup table, instead), plus sorting every
+            match. Drivers walking an index in order (``sort``, and ``kind`` for
+            unsorted queries with a ``window``) skip the sort, check ranges per
+            entry, and stop once the page is full - after as much of the index
+            as holds ``window`` matches, if filters select independently.
+
+            :param driver: Tupled ``(<driver>, <position>)``.
+            :param sources: Query indexes, from :py:meth:`_query_sources`.
+            :param group: Entity group index of the query, if any.
+            :param estimates: Cardinalities, from :py:meth:`_estimate`.
+            :param window: Count of matches a page needs (``offset + limit + 1``),
+            or ``None`` if every match is needed.
+            :returns: Estimated cost (``int``). '''
+
+        sets, ranges, orders, excluded, temps = sources
+        strategy, position = driver
+        walk = strategy == 'sort' or (strategy == 'kind' and not orders and window is not None)
+
+        matches = total = estimates['kind']
+        for estimate in estimates['sets'] + estimates['ranges'] + ([estimates['group']] if group else []):
+            matches = (matches * estimate / float(total)) if total else 0
+
+        if strategy == 'intersect':
+            candidates = min(estimates['sets'])
+            cost = candidates * len(sets)
+        else:
+            candidates = cost = {
+                'set': lambda: estimates['sets'][position],
+                'range': lambda: estimates['ranges'][position],
+                'group': lambda: estimates['group'],
+                'sort': lambda: estimates['sort'] if position is None else estimates['ranges'][position],
+                'kind': lambda: estimates['kind']
+            }[strategy]()
+
+        # walks stop early, once they've found enough matches
+        if walk and window is not None and matches >= window:
+            candidates = cost = min(candidates, int(math.ceil(candidates * window / matches)))
+
+        checks = len(excluded) + (1 if group else 0)
+        if strategy != 'intersect':
+            checks += len(sets) - (1 if strategy == 'set' else 0)
+        for i, (index, low, high, lexical, name) in enumerate(ranges):
+            if strategy in ('range', 'sort') and i == position:
+                continue
+            if lexical and not walk:
+                cost += estimates['ranges'][i]
+            checks += 1
+
+        # everything else sorts its matches (by kind score, if unsorted - which only matters against a kind walk)
+        if not walk and (orders or window is not None) and matches > 1:
+            cost += int(matches * math.log(matches, 2))
+        return cost + (candidates * checks)
+
+    @classmethod
+    def _group_index(cls, ancestor):
+
+        ''' Resolve the entity group index for an ancestor :py:class:`model.Key`.
+
+            :param ancestor: Ancestor :py:class:`model.Key`.
+            :returns: Name of the group index for its root key. '''
+
+        root_key = [i for i in ancestor.ancestry][0]
+        return cls._magic_separator.join([cls._group_prefix, cls._encode(root_key)])
+
+    @classmethod
+    def _query_sources(cls, kind, spec):
+
+        ''' Resolve the indexes a query reads: sets to intersect, ranges to
+            check, indexes to sort by and sets to exclude, along with any
+            temporary sets to build first.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param spec: Tupled ``(<filters>, <sorts>)``.
+
+            :raises NotImplementedError: For filters or sorts that can't yet
+            be satisfied from ``Redis`` indexes.
+
+            :returns: Tupled ``(<sets>, <ranges>, <orders>, <excluded>, <temps>)``,
+            where ``sets`` are tupled ``(<index>, <property name>)``, ``ranges`` are
+            tupled ``(<index>, <low>, <high>, <lexical>, <property name>)``, ``orders``
+            are tupled ``(<index>, <descending>, <lexical>)``, ``excluded`` is a ``list``
+            of set indexes and ``temps`` lists temporary sets (see :py:meth:`_temp_union`). '''
+
+        from apptools.model import query
+
+        filters, sorts = spec
+        sets, ranges, orders, excluded, temps = [], [], [], [], []
+
+        # sort filters into set intersections, exclusions and ranges
+        for _filter in filters:
+            name = _filter.target.name
+
+            # `IN` matches any of several values: their index entries are unioned into a temporary set
+            if _filter.operator is query.CONTAINS:
+                values = _filter.value.data
+                if not isinstance(values, (list, tuple, set, frozenset)):
+                    values = [values]
+                sets.append((cls._temp_union(kind, _filter.target, [(query.EQUALS, v) for v in values], temps), name))
+                continue
+
+            operation, index, score = cls._index_for(kind, _filter.target, _filter.value.data)
+
+            # `!=` on sorted indexes unions the ranges either side of the value, otherwise members are excluded
+            if _filter.operator is query.NOT_EQUALS:
+                if score is None and not cls._lexical(_filter.target):
+                    excluded.append(index)
+                else:
+                    sets.append((cls._temp_union(kind, _filter.target, [
+                        (query.LESS_THAN, _filter.value.data), (query.GREATER_THAN, _filter.value.data)], temps), name))
+                continue
+
+            if score is None:
+                if _filter.operator is query.EQUALS:
+                    sets.append((index, name))
+                    continue
+
+                if not cls._lexical(_filter.target):
+                    raise NotImplementedError('Range filters are only supported in `Redis` for numeric and '
+                                              'string properties.')
+
+                low, high = cls._lex_range(_filter.operator, _filter.value.data)
+                ranges.append((cls.lex_index(kind, name), low, high, True, name))
+                continue
+
+            low, high = cls._score_range(_filter.operator, score)
+            ranges.append((index, low, high, False, name))
+
+        for _sort in sorts:
+            if cls._lexical(_sort.target):
+                orders.append((cls.lex_index(kind, _sort.target.name), _sort.operator is query.DESCENDING, True))
+                continue
+            if _sort.target._basetype not in _SORTABLE_SAMPLES:
+                raise NotImplementedError('Sorts are only supported in `Redis` for numeric, temporal and '
+                                          'string properties.')
+            operation, index, score = cls._index_for(kind, _sort.target, _SORTABLE_SAMPLES[_sort.target._basetype])
+            orders.append((index, _sort.operator is query.DESCENDING, False))
+
+        return sets, ranges, orders, excluded, temps
+
+    @classmethod
+    def compile_query(cls, kind, spec, options, ancestor=None, plan=None, tally=None):
+
+        ''' Compile a :py:class:`model.Query` into a Lua script that runs the
+            whole query inside ``Redis``: index intersection, range checks,
+            ordering, offset/limit and the final entity fetch. Scripts are
+            generated once per query *shape* (count of each kind of filter,
+            sort directions, storage mode, plan and so on) and cached, so
+            repeated queries only cost an ``EVALSHA``.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param spec: Tupled ``(<filters>, <sorts>)``.
+            :param options: :py:class:`query.QueryOptions` for the query.
+            :param ancestor: Optional ancestor :py:class:`model.Key`, restricting
+            results to its entity group.
+            :param plan: :py:class:`QueryPlan` to run the query with. Planned
+            via :py:meth:`plan_query` if not given.
+            :param tally: ``'count'`` to count matching entities, or the name of
+            a numeric index to aggregate over them, instead of returning results.
+
+            :raises NotImplementedError: For filters or sorts that can't yet
+            be satisfied from ``Redis`` indexes.
+
+            :raises ValueError: If ``options`` carries a cursor from a query of
+            a different shape.
+
+            :returns: Tupled ``(<script>, <keys>, <args>, <fetch>, <temps>)``, where
+            ``fetch`` is the storage mode entities are returned in, ``'projection'``
+            if the script returns only the projected fields of hash-stored entities,
+            ``'keys'`` if the script only returns keys (or ``'count'`` or ``'aggregate'``
+            for tallies), and ``temps`` lists the
+            temporary sets (see :py:meth:`_temp_union`) to build before running it. '''
+
+        plan = plan or cls.plan_query(kind, spec, options, ancestor)
+        sets, ranges, orders, excluded, temps = plan.sources
+
+        # keys-only queries never touch entities, and hash-stored projections only read the fields they need
+        mode = cls.storage_mode(kind)
+        if tally:
+            fetch = 'count' if tally == 'count' else 'aggregate'
+        elif options.keys_only or mode == RedisMode.hashkey_blob:
+            fetch = 'keys'
+        elif options.projection and mode == RedisMode.hashkey_hash:
+            fetch = 'projection'
+        else:
+            fetch = mode
+
+        # lay out KEYS: kind index, set indexes, range indexes, sort indexes, group, kind hash, exclusions, aggregate
+        keys = [cls.kind_index(kind)] + [s[0] for s in sets] + [r[0] for r in ranges] + [o[0] for o in orders]
+        if ancestor is not None:
+            keys.append(cls._group_index(ancestor))
+        if fetch == RedisMode.hashkind_blob:
+            keys.append(cls._magic_separator.join([cls._hash_prefix, cls._kind_prefix, kind]))
+        keys.extend(excluded)
+        if fetch == 'aggregate':
+            keys.append(tally)
+
+        args = [options.offset or 0, -1 if (options.limit is None or options.limit < 0) else options.limit]
+        for index, low, high, lexical, name in ranges:
+            args.extend((low, high))
+
+        # cursors hold the sort scores (or kind score) and encoded key of the last result, and resume just after it
+        position = options.cursor.position if options.cursor is not None else None
+        if position is not None:
+            if len(position) != (len(orders) or 1) + 1:
+                raise ValueError('Query cursor does not match the query it is used with.')
+            args.extend(position)
+        if fetch == 'projection':
+            args.extend(options.projection)
+
+        shape = (len(sets), tuple((r[3] for r in ranges)), tuple((o[1] for o in orders)), ancestor is not None, fetch,
+                 position is not None, tuple((o[2] for o in orders)), len(excluded), plan.driver)
+        if shape not in _scripts:
+            _scripts[shape] = cls.channel(kind).register_script(cls._generate_query_script(*shape))
+        return _scripts[shape], keys, args, fetch, temps
+
+    @classmethod
+    def _score_range(cls, operator, score):
+
+        ''' Translate a filter operator into ``ZRANGEBYSCORE`` bounds.
+
+            :param operator: Filter operator, from :py:mod:`query`.
+            :param score: Index score of the filtered value.
+            :returns: Tupled ``(<low>, <high>)`` bounds. '''
+
+        from apptools.model import query
+
+        score = unicode(score)
+        return {
+            query.EQUALS: (score, score),
+            query.GREATER_THAN: ('(' + score, '+inf'),
+            query.GREATER_THAN_EQUAL_TO: (score, '+inf'),
+            query.LESS_THAN: ('-inf', '(' + score),
+            query.LESS_THAN_EQUAL_TO: ('-inf', score)
+        }[operator]
+
+    @classmethod
+    def _lex_range(cls, operator, value):
+
+        ''' Translate a filter operator into ``ZRANGEBYLEX`` bounds over a
+            lexicographic index (see :py:meth:`lex_index`). Members are
+            ``<value>\0<key>``, so ``\0`` and ``\1`` suffixes bound every
+            member at (or just past) the value itself.
+
+            :param operator: Filter operator, from :py:mod:`query`.
+            :param value: Filtered string value.
+            :returns: Tupled ``(<low>, <high>)`` bounds. '''
+
+        from apptools.model import query
+
+        value = unicode(value)
+        return {
+            query.GREATER_THAN: (u'[' + value + u'\x01', u'+'),
+            query.GREATER_THAN_EQUAL_TO: (u'[' + value + u'\x00', u'+'),
+            query.LESS_THAN: (u'-', u'(' + value + u'\x00'),
+            query.LESS_THAN_EQUAL_TO: (u'-', u'(' + value + u'\x01')
+        }[operator]
+
+    @classmethod
+    def _temp_union(cls, kind, prop, bounds, temps):
+
+        ''' Plan a temporary set holding every entity matching any of several
+            conditions on one property: a ``SUNIONSTORE`` of set indexes, or
+            the union of ranges over a sorted (numeric or lexicographic) index.
+            Temporary sets are built right before the query runs, on the same
+            channel - the primary, for queries that would otherwise read from a
+            replica (see :py:meth:`_query_channel`) - and expire after
+            :py:attr:`EngineConfig.temp_ttl` seconds.
+            Their names are derived from their contents, so concurrent queries
+            share (and simply rebuild) them.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param prop: :py:class:`model.Property` descriptor.
+            :param bounds: ``list`` of tupled ``(<operator>, <value>)`` conditions.
+            :param temps: ``list`` of planned temporary sets to add to, each a
+            tupled ``(<name>, <'union', 'score' or 'lex'>, <sources>)``.
+            :returns: Name of the temporary set. '''
+
+        from apptools.model import query
+
+        sources, style = [], 'union'
+        for operator, value in bounds:
+            operation, index, score = cls._index_for(kind, prop, value)
+            if score is None and operator is query.EQUALS:
+                sources.append(index)
+            elif score is not None:
+                style, sources = 'score', sources or [index]
+                sources.extend(cls._score_range(operator, score))
+            else:
+                style, sources = 'lex', sources or [cls.lex_index(kind, prop.name)]
+                sources.extend(cls._lex_range(operator, value))
+
+        temp = cls._magic_separator.join([cls._temp_prefix, hashlib.md5(json.dumps(
+            [style] + sources).encode('utf-8')).hexdigest()])
+        if sources:
+            temps.append((temp, style, sources))
+        return temp
+
+    @classmethod
+    def _build_temps(cls, temps, pipeline):
+
+        ''' Build temporary query sets planned by :py:meth:`_temp_union`.
+
+            :param temps: ``list`` of planned temporary sets.
+            :param pipeline: Pipeline to buffer the commands in, ahead of the query.
+            :returns: The ``pipeline``. '''
+
+        for temp, style, sources in temps:
+            if style == 'union':
+                cls.execute(cls.Operations.SET_UNION_STORE, None, temp, *sources, target=pipeline)
+                cls.execute(cls.Operations.EXPIRE, None, temp, cls.EngineConfig.temp_ttl, target=pipeline)
+            else:
+                cls.execute(cls.Operations.EVALUATE, None, _LUA_RANGE_UNION, 2, temp, sources[0],
+                            cls.EngineConfig.temp_ttl, style, *sources[1:], target=pipeline)
+        return pipeline
+
+    @classmethod
+    def _generate_query_script(cls, sets, ranges, descending, grouped, fetch, cursor=False, lexical=(), excluded=0,
+                               driver=None):
+
+        ''' Generate Lua source for a query shape. See :py:meth:`compile_query`
+            for the layout of ``KEYS`` and ``ARGV`` the script expects.
+
+            :param sets: Count of set (equality) indexes to intersect.
+            :param ranges: Tuple of sorted indexes to check ranges against, as
+            flags indicating which are lexicographic (see :py:meth:`lex_index`).
+            :param descending: Tuple of sort directions (``True`` for descending).
+            :param grouped: Whether results are restricted to an entity group.
+            :param fetch: Storage mode to fetch entities in, ``'projection'`` or ``'keys'``
+            (or ``'count'`` or ``'aggregate'``, to tally matches instead - see
+            :py:meth:`compile_query`).
+            :param cursor: Whether the query resumes from a cursor position, passed
+            after the range bounds in ``ARGV`` (and before any projected fields).
+            :param lexical: Tuple of flags indicating which sorts are lexicographic.
+            Their values are read from each entity's reverse index.
+            :param excluded: Count of set indexes whose members are excluded.
+            :param driver: Tupled ``(<driver>, <position>)`` gathering candidates
+            (see :py:class:`QueryPlan`). Defaults to intersecting the sets, then
+            the first range, then the whole kind. Drivers walking an index in
+            order (``sort``, and ``kind`` for filtered, unsorted queries) stop at
+            the first ``offset + limit + 1`` matches, instead of sorting them all.
+            :returns: Lua source (``str``). '''
+
+        lexical = lexical or (False,) * len(descending)
+        driver = driver or (('intersect', None) if sets else ('range', 0) if ranges else ('kind', None))
+        strategy, position = driver
+        tally = fetch in _LUA_QUERY_TALLY
+        paged = strategy == 'kind' and not (sets or ranges or descending or grouped or excluded or tally)
+        walk = not tally and (strategy == 'sort' or (strategy == 'kind' and not (descending or paged)))
+        range_keys = range(2 + sets, 2 + sets + len(ranges))
+        sort_keys = range(2 + sets + len(ranges), 2 + sets + len(ranges) + len(descending))
+        group_key = 2 + sets + len(ranges) + len(descending)
+        hash_key = group_key + (1 if grouped else 0)
+        excluded_keys = range(hash_key + (1 if fetch == RedisMode.hashkind_blob else 0),
+                              hash_key + (1 if fetch == RedisMode.hashkind_blob else 0) + excluded)
+        cursor_args = range(3 + (len(ranges) * 2), 3 + (len(ranges) * 2) + (len(descending) or 1) + 1)
+        reverse = cls._reverse_prefix + cls._magic_separator
+
+        lua = [_LUA_QUERY_PRELUDE]
+
+        # parse numeric range bounds once, up front (lexicographic bounds are passed to `ZRANGEBYLEX` as-is)
+        for i, k in enumerate(range_keys):
+            if not ranges[i]:
+                lua.append("local low%(i)s, low%(i)s_x = bound(ARGV[%(low)s])\n"
+                           "local high%(i)s, high%(i)s_x = bound(ARGV[%(high)s])" % {
+                               'i': i, 'low': 3 + (i * 2), 'high': 4 + (i * 2)})
+
+        # gather candidates from the driving index
+        checks, members = list(enumerate(range_keys)), list(range(2, 2 + sets))
+        if strategy == 'intersect':
+            lua.append("local candidates = redis.call('SINTER', %s)" % ', '.join(('KEYS[%s]' % k for k in members)))
+            members = []
+        elif strategy == 'set':
+            lua.append("local candidates = redis.call('SMEMBERS', KEYS[%s])" % members.pop(position))
+        elif strategy == 'range' and ranges[position]:
+            lua.append("local candidates = {}\n"
+                       "for i, member in ipairs(redis.call('ZRANGEBYLEX', KEYS[%s], ARGV[%s], ARGV[%s])) do\n"
+                       "  candidates[i] = unlex(member)\n"
+                       "end" % (checks.pop(position)[1], 3 + (position * 2), 4 + (position * 2)))
+        elif strategy == 'range':
+            lua.append("local candidates = redis.call('ZRANGEBYSCORE', KEYS[%s], ARGV[%s], ARGV[%s])" % (
+                checks.pop(position)[1], 3 + (position * 2), 4 + (position * 2)))
+        elif strategy == 'group':
+            lua.append("local candidates = redis.call('SMEMBERS', KEYS[%s])" % group_key)
+        elif walk:
+            # walked in order, below - within the range filtering the sort index, if any
+            bounded = checks.pop(position) if position is not None else None
+        elif paged:
+            if cursor:
+                # seek past the cursor by rank, or (if its key has since been deleted) by score
+                lua.append("local start = redis.call('ZRANK', KEYS[1], ARGV[%(member)s])\n"
+                           "if start then start = start + 1 else\n"
+                           "  start = redis.call('ZCOUNT', KEYS[1], '-inf', '(' .. ARGV[%(score)s])\n"
+                           "  for _, tied in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[%(score)s], ARGV[%(score)s])) do\n"
+                           "    if not before(ARGV[%(member)s], tied) then start = start + 1 end\n"
+                           "  end\n"
+                           "end\n"
+                           "offset = offset + start" % {'score': cursor_args[0], 'member': cursor_args[-1]})
+            lua.append("local candidates = redis.call('ZRANGE', KEYS[1], offset, limit < 0 and -1 or offset + limit - 1)\n"
+                       "more = limit >= 0 and redis.call('ZCARD', KEYS[1]) > offset + limit\n"
+                       "offset = 0")
+        else:
+            lua.append("local candidates = redis.call('ZRANGE', KEYS[1], 0, -1)")
+
+        # lexicographic ranges that aren't driving are checked against the keys they select (or, by walks, per entry)
+        for i, k in checks:
+            if ranges[i] and not walk:
+                lua.append("local lex%(i)s = {}\n"
+                           "for _, member in ipairs(redis.call('ZRANGEBYLEX', KEYS[%(k)s], ARGV[%(low)s], ARGV[%(high)s])) do\n"
+                           "  lex%(i)s[unlex(member)] = true\n"
+                           "end" % {'i': i, 'k': k, 'low': 3 + (i * 2), 'high': 4 + (i * 2)})
+
+        # per-candidate checks
+        lua.append("local function match(member)")
+        for k in members:
+            lua.append("  if redis.call('SISMEMBER', KEYS[%s], member) == 0 then return false end" % k)
+        for i, k in checks:
+            if ranges[i] and walk:
+                lua.append("  local l%(i)s = redis.call('HGET', '%(reverse)s' .. member, KEYS[%(k)s])\n"
+                           "  if not (l%(i)s and lexin(string.sub(l%(i)s, 2) .. '\\0' .. member, ARGV[%(low)s], "
+                           "ARGV[%(high)s])) then return false end" % {
+                               'i': i, 'k': k, 'reverse': reverse, 'low': 3 + (i * 2), 'high': 4 + (i * 2)})
+            elif ranges[i]:
+                lua.append("  if not lex%s[member] then return false end" % i)
+            else:
+                lua.append("  if not within(redis.call('ZSCORE', KEYS[%(k)s], member), "
+                           "low%(i)s, low%(i)s_x, high%(i)s, high%(i)s_x) then return false end" % {'i': i, 'k': k})
+        if strategy == 'group':
+            lua.append("  if not redis.call('ZSCORE', KEYS[1], member) then return false end")
+        elif grouped:
+            lua.append("  if redis.call('SISMEMBER', KEYS[%s], member) == 0 then return false end" % group_key)
+        for k in excluded_keys:
+            lua.append("  if redis.call('SISMEMBER', KEYS[%s], member) == 1 then return false end" % k)
+        lua.append("  return true\nend")
+
+        if walk:
+            lua.append(cls._generate_walk(
+                sort_keys[0] if strategy == 'sort' else 1, strategy == 'sort' and descending[0],
+                strategy == 'sort' and lexical[0], bounded and (3 + (bounded[0] * 2), 4 + (bounded[0] * 2)),
+                cursor_args if cursor else None))
+            return cls._generate_page(lua, tally, fetch, hash_key, excluded, ranges, cursor_args, cursor)
+
+        # order matches by their sort values (or kind scores, if unsorted - which shard merges order by)
+        ordered = not tally and (bool(descending) or not paged)
+        keep = lambda entry, indent: "%smatches[#matches + 1] = %s" % (indent, entry)
+        if ordered:
+            lua.append("local function less(a, b)")
+            for n, d in enumerate(descending or (False,)):
+                if descending and lexical[n]:
+                    lua.append("  if a[%(i)s] ~= b[%(i)s] then return before(%(a)s[%(i)s], %(b)s[%(i)s]) end" % {
+                        'i': n + 2, 'a': 'b' if d else 'a', 'b': 'a' if d else 'b'})
+                else:
+                    lua.append("  if a[%(i)s] ~= b[%(i)s] then return a[%(i)s] %(op)s b[%(i)s] end" % {
+                        'i': n + 2, 'op': '>' if d else '<'})
+            lua.append("  return before(a[1], b[1])\nend")
+
+            # cursors drop whatever sorts before (or at) their position as matches are collected, ahead of sorting
+            if cursor:
+                lua.append("local resume = {ARGV[%s], %s}" % (cursor_args[-1], ', '.join((
+                    ('ARGV[%s]' if (descending and lexical[n]) else 'tonumber(ARGV[%s])') % i
+                    for n, i in enumerate(cursor_args[:-1])))))
+                keep = lambda entry, indent: ("%(indent)slocal entry = %(entry)s\n"
+                                              "%(indent)sif less(resume, entry) then matches[#matches + 1] = entry end"
+                                              % {'indent': indent, 'entry': entry})
+
+        # collect matches with their sort values (or kind scores, if unsorted)
+        lua.append("local matches = {}\nfor _, member in ipairs(candidates) do\n  if match(member) then")
+        if descending:
+            for n, k in enumerate(sort_keys):
+                if lexical[n]:
+                    lua.append("    local s%s = redis.call('HGET', '%s' .. member, KEYS[%s])" % (n, reverse, k))
+                else:
+                    lua.append("    local s%s = redis.call('ZSCORE', KEYS[%s], member)" % (n, k))
+            lua.append("    if %s then" % ' and '.join(('s%s' % n for n in range(len(descending)))))
+            lua.append(keep("{member, %s}" % ', '.join((
+                ('string.sub(s%s, 2)' if lexical[n] else 'tonumber(s%s)') % n for n in range(len(descending)))),
+                "      ") + "\n    end")
+        elif not tally:
+            lua.append(keep("{member, tonumber(redis.call('ZSCORE', KEYS[1], member) or 0)}", "    "))
+        else:
+            lua.append("    matches[#matches + 1] = {member}")
+        lua.append("  end\nend")
+        if ordered:
+            lua.append("table.sort(matches, less)")
+
+        return cls._generate_page(lua, tally, fetch, hash_key, excluded, ranges, cursor_args, cursor)
+
+    @classmethod
+    def _generate_walk(cls, key, descending, lexical, bounds, cursor_args):
+
+        ''' Generate Lua source walking a sorted index in order, collecting the
+            ``matches`` of a query (see :py:meth:`_generate_query_script`) in
+            chunks, until ``offset + limit + 1`` of them are found. Ties are
+            broken by encoded key, so runs of equal values are collected whole.
+
+            :param key: Position of the index in ``KEYS``.
+            :param descending: Whether to walk the index in descending order.
+            :param lexical: Whether the index is lexicographic (see :py:meth:`lex_index`).
+            :param bounds: Positions in ``ARGV`` of the low and high bounds of a
+            range filter over the index, to walk only that range of it, if any.
+            :param cursor_args: Positions in ``ARGV`` of the cursor to resume
+            after, if any.
+            :returns: Lua source (``str``). '''
+
+        lua, check, first, last = [], 'match(member)', '0', 'nil'
+        names = {'key': key, 'count': 'ZLEXCOUNT' if lexical else 'ZCOUNT', 'floor': "'-'" if lexical else "'-inf'",
+                 'ceiling': "'+'" if lexical else "'+inf'"}
+
+        # a range over the index bounds the walk: count what lies beyond it, either side
+        if bounds:
+            names.update(low='ARGV[%s]' % bounds[0], high='ARGV[%s]' % bounds[1])
+            if lexical:
+                lua.append("local function outside(bound)\n"
+                           "  return (string.sub(bound, 1, 1) == '(' and '[' or '(') .. string.sub(bound, 2)\nend")
+            else:
+                lua.append("local function outside(bound)\n"
+                           "  if string.sub(bound, 1, 1) == '(' then return string.sub(bound, 2) end\n"
+                           "  return '(' .. bound\nend")
+            if descending:
+                first = ("%(high)s == %(ceiling)s and 0 or "
+                         "redis.call('%(count)s', KEYS[%(key)s], outside(%(high)s), %(ceiling)s)") % names
+                last = "redis.call('%(count)s', KEYS[%(key)s], %(low)s, %(ceiling)s) - 1" % names
+            else:
+                first = ("%(low)s == %(floor)s and 0 or "
+                         "redis.call('%(count)s', KEYS[%(key)s], %(floor)s, outside(%(low)s))") % names
+                last = "redis.call('%(count)s', KEYS[%(key)s], %(floor)s, %(high)s) - 1" % names
+
+        # cursors seek past every value sorting before theirs, then skip the keys tied with it up to their own
+        if cursor_args:
+            names['resume'] = 'ARGV[%s]' % cursor_args[0]
+            first = "math.max(%s, redis.call('%s', KEYS[%s], %s))" % (first, names['count'], key, {
+                (False, False): "'-inf', '(' .. %(resume)s",
+                (False, True): "'(' .. %(resume)s, '+inf'",
+                (True, False): "'-', '(' .. %(resume)s .. '\\0'",
+                (True, True): "'[' .. %(resume)s .. '\\1', '+'"}[(bool(lexical), bool(descending))] % names)
+            lua.append("local resume = %s" % (('%s' if lexical else 'tonumber(%s)') % names['resume']))
+            check = '(score ~= resume or before(ARGV[%s], member)) and match(member)' % cursor_args[-1]
+
+        lua.append(_LUA_QUERY_WALK % {
+            'first': first,
+            'last': last,
+            'walk': 'ZREVRANGE' if descending else 'ZRANGE',
+            'key': key,
+            'scores': '' if lexical else ", 'WITHSCORES'",
+            'step': 1 if lexical else 2,
+            'entry': ("score, member = string.match(chunk[i], '^(.*)%z(.*)$')" if lexical else
+                      "member, score = chunk[i], tonumber(chunk[i + 1])"),
+            'order': "  table.sort(run, function(a, b) return before(a[1], b[1]) end)\n" if descending else '',
+            'check': check})
+        return '\n'.join(lua)
+
+    @classmethod
+    def _generate_page(cls, lua, tally, fetch, hash_key, excluded, ranges, cursor_args, cursor):
+
+        ''' Finish the Lua source of a query script, once it has collected its
+            ``matches``: tally them, or page through them and fetch the page.
+
+            :param lua: ``list`` of Lua source generated so far.
+            :param tally: Whether to tally matches (see :py:meth:`compile_query`).
+            :param fetch: Storage mode (or tally) to fetch in.
+            :param hash_key: Position in ``KEYS`` of the kind hash, if any.
+            :param excluded: Count of set indexes whose members are excluded.
+            :param ranges: Tuple of range flags (see :py:meth:`_generate_query_script`).
+            :param cursor_args: Positions in ``ARGV`` of the cursor position.
+            :param cursor: Whether the query resumes from a cursor.
+            :returns: Lua source (``str``). '''
+
+        if tally:
+            lua.append(_LUA_QUERY_TALLY[fetch] % {'target': hash_key + excluded})
+            return '\n'.join(lua)
+
+        fields = (cursor_args[-1] + 1) if cursor else (3 + len(ranges) * 2)
+        lua.append(_LUA_QUERY_PAGE)
+        lua.append(_LUA_QUERY_FETCH[fetch] % {'hash': hash_key, 'fields': fields}
+                   if fetch in (RedisMode.hashkind_blob, 'projection') else _LUA_QUERY_FETCH[fetch])
+        return '\n'.join(lua)
+
+    @classmethod
+    def _filter_ancestry(cls, matching_keys, ancestor):
+
+        ''' Filter encoded keys down to descendants of ``ancestor``.
+
+            :param matching_keys: Iterable of encoded keys.
+            :param ancestor: Ancestor :py:class:`model.Key`.
+            :returns: ``list`` of encoded keys descending from ``ancestor``. '''
+
+        joined = ancestor.flatten(True)[0]
+        return [encoded for encoded in matching_keys
+                if joined in [k.flatten(True)[0] for k in cls.decode_key(encoded).ancestry][:-1]]
+
+    @classmethod
+    def execute_query(cls, kind, spec, options, **kwargs):
 
         ''' Execute a :py:class:`model.Query` across one (or multiple)
-            indexed properties.
+            indexed properties. The query is compiled to a Lua script (see
+            :py:meth:`compile_query`) and run in one ``EVALSHA`` - only the
+            requested page of keys (and entities) comes back over the wire.
 
             :param kind: Kind name (``str``) for which we are querying
             across, or ``None`` if this is a ``kindless`` query.
@@ -787,184 +3206,325 @@ class RedisAdapter(IndexedModelAdapter):
             as :py:class:`QueryOptions`, specifying options for the execution
             of this :py:class:`Query`.
 
-            :param **kwargs: Low-level options for handling this query, such
-            as ``pipeline`` (for pipelining support) and ``execute`` (to trigger
-            a buffer flush for a generated or constructed pipeline or operation
-            buffer).
-
-            :returns: Iterable (``list``) of matching :py:class:`model.Key`
+            :returns: Iterable (``list``) of matching :py:class:`model.Model`
+            entities (or :py:class:`model.Key` objects, if ``keys_only`` is set)
             yielded by execution of the current :py:class:`Query`. Returns
             empty iterable (``[]``) in the case that no results could be found. '''
 
-        # @TODO(sgammon): desparately needs rewriting. absolute utter plebbery.
-
-        from apptools import model
         from apptools.model import query
 
         if not kind:
             # @TODO(sgammon): implement kindless queries
             raise NotImplementedError('Kindless queries are not yet implemented in `Redis`.')
 
-        # extract filter and sort directives and build ancestor
-        filters, sorts = spec
-        ancestry_parent = model.Key.from_urlsafe(options.ancestor) if options.ancestor else None
-        _data_frame = []  # allocate results window
+        ancestor = options.ancestor or None
+        if isinstance(ancestor, basestring):
+            ancestor = cls.decode_key(ancestor)
 
-        if filters:
-            kinded_key = model.Key(kind, parent=ancestry_parent)
+        # sharded kinds: scatter to every shard, each returning its first `offset + limit + 1` results, then merge and page
+        if ancestor is None and kind.kind() in _shards_by_model:
+            offset = options.offset or 0
+            stop = None if (options.limit is None or options.limit < 0) else offset + options.limit
 
-            ## HUGE HACK: use generate_indexes to make index names.
-            # fix this plz
+            # shards return the sort scores of each result, so merging never needs entities
+            shard_options = query.QueryOptions(limit=(-1 if stop is None else stop + 1), cursor=options.cursor,
+                                               consistency=options.consistency, keys_only=options.keys_only,
+                                               projection=options.projection, hint=options.hint,
+                                               plan=options.plan)
+            results = cls._merge_results([result for channel in cls.readers(kind.kind(), options.consistency)
+                                          for result in cls._query_shard(kind, spec, shard_options, None, channel)[0]],
+                                         spec[1])
 
-            _filters, _filter_i_lookup = {}, set()
-            for _f in filters:
+            more, results = stop is not None and len(results) > stop, results[offset:stop]
+            position = cls._position(results[-1][0], results[-1][3]) if (more and results) else None
 
-                origin, meta, property_map = cls.generate_indexes(kinded_key, {
-                    _f.target.name: (_f.target, _f.value.data)
-                })
+        else:
+            # unsharded kinds, and entity groups (which live on one shard)
+            results, position, more = cls._query_shard(kind, spec, options, ancestor,
+                                                       cls.reader(kind, ancestor, options.consistency))
 
-                for operation, index, config in cls.write_indexes((origin, [], property_map), None, False):
+        # leave a cursor just past this page, if anything follows it
+        options.cursor = query.Cursor(position) if (more and position) else None
 
-                    if operation == 'ZADD':
-                        _flag, _index_key, value = 'Z', index[1], index[2]
-                    else:
-                        _flag, _index_key, value = 'S', index[1], index[2]
-
-                if (_flag, _index_key) not in _filter_i_lookup:
-                    _filters[(_flag, _index_key)] = []
-                    _filter_i_lookup.add((_flag, _index_key))
-
-                _filters[(_flag, _index_key)].append((_f.operator, value))
-
-            # process sorted sets first: leads to lower cardinality
-            sorted_indexes = dict([(index, _filters[index]) for index in filter(lambda x: x[0] == 'Z', _filters.iterkeys())])
-            unsorted_indexes = dict([(index, _filters[index]) for index in filter(lambda x: x[0] == 'S', _filters.iterkeys())])
-
-            if sorted_indexes:
-
-                for prop, _directives in sorted_indexes.iteritems():
-
-                    # double-filters
-                    if len(_filters[prop]) == 2:
-
-                        # extract info
-                        _operators = [operator for operator, value in _directives]
-                        _values = [value for operator, value in _directives]
-                        _, prop = prop
-
-                        # special case: maybe we can do a sorted range request
-                        if (query.GREATER_THAN in _operators) or (query.GREATER_THAN_EQUAL_TO in _operators):
-                            if (query.LESS_THAN in _operators) or (query.LESS_THAN_EQUAL_TO in _operators):
-
-                                # range value query over sorted index
-                                greater, lesser = max(_values), min(_values)
-                                _data_frame.append(cls.execute(*(
-                                    cls.Operations.SORTED_RANGE_BY_SCORE,
-                                    None,
-                                    prop,
-                                    min(_values),
-                                    max(_values),
-                                    options.offset,
-                                    options.limit
-                                )))
-
-                                continue
-
-                    # single-filters
-                    if len(_filters[prop]) == 1:
-
-                        # extract info
-                        _operator = [operator for operator, value in _directives][0]
-                        _value = float([value for operator, value in _directives][0])
-                        _, prop = prop
-
-                        if _operator is query.EQUALS:
-
-                            # static value query over sorted index
-                            _data_frame.append(cls.execute(*(
-                                cls.Operations.SORTED_RANGE_BY_SCORE,
-                                None,
-                                prop,
-                                _value,
-                                _value,
-                                options.offset,
-                                options.limit
-                            )))
-
-                            continue
-
-                    ## @TODO(sgammon): build this query branch
-                    raise RuntimeError("Specified query is not yet supported.")
-
-            if unsorted_indexes:
-
-                _intersections = set()
-                for prop, _directives in unsorted_indexes.iteritems():
-                    _flag, index = prop
-                    _intersections.add(index)
-
-                # special case: only one unsorted set - pull content instead of a intersection merge
-                if _intersections and len(_intersections) == 1:
-                    _data_frame.append(cls.execute(*(
-                        cls.Operations.SET_MEMBERS,
-                        None,
-                        _intersections.pop()
-                    )))
-
-                # more than one intersection: do an `SINTER` call instead of `SMEMBERS`
-                if _intersections and len(_intersections) > 1:
-                    _data_frame.append(cls.execute(*(
-                        cls.Operations.SET_INTERSECT,
-                        None,
-                        _intersections
-                    )))
-
-            if _data_frame:  # there were results, start merging
-                _result_window = set()
-                for frame in _data_frame:
-
-                    if not len(_result_window):
-                        _result_window = set(frame)
-                        continue  # initial frame: fill background
-
-                    _result_window = (_result_window & set(frame))
-                matching_keys = [k for k in _result_window]
-            else:
-                matching_keys = []
+        if options.keys_only:
+            return [key for encoded, key, entity, scores in results]
+        return [entity for encoded, key, entity, scores in results]
+
+    @classmethod
+    def _query_shard(cls, kind, spec, options, ancestor, channel):
+
+        ''' Run a query against one channel (see :py:meth:`execute_query`).
+
+            :param kind: :py:class:`model.Model` class being queried.
+            :param spec: Tupled ``(<filters>, <sorts>)``.
+            :param options: :py:class:`query.QueryOptions` for the query.
+            :param ancestor: Optional ancestor :py:class:`model.Key`.
+            :param channel: ``Redis`` client to run the query on.
+            :returns: Tupled ``(<results>, <position>, <more>)``, where ``results`` is a
+            ``list`` of tupled ``(<encoded key>, <key>, <entity>, <sort scores>)`` results
+            (with ``None`` entities for ``keys_only`` queries), ``position`` is the cursor
+            position after the last result and ``more`` indicates whether further results
+            follow. '''
+
+        from apptools.model import query
+
+        channel = cls._query_channel(kind.kind(), spec, channel)
+        values, fetch, position, more, scores = None, 'keys', None, False, None
+        if ancestor is not None and ancestor.parent:
+
+            # descendants of a non-root ancestor are filtered client-side, so fetch every matching key
+            script, keys, args, fetch, temps = cls._plan_and_compile(kind.kind(), spec, query.QueryOptions(
+                keys_only=True, cursor=options.cursor, hint=options.hint, plan=options.plan), ancestor, channel)
+            result = cls._run_query(script, keys, args, temps, channel)
+            descendants = frozenset(cls._filter_ancestry(result[0], ancestor))
+            matching = [(encoded, score) for encoded, score in zip(result[0], result[4]) if encoded in descendants]
+
+            offset = options.offset or 0
+            stop = None if (options.limit is None or options.limit < 0) else offset + options.limit
+            more, matching = stop is not None and len(matching) > stop, matching[offset:stop]
+            matching_keys, scores = [encoded for encoded, score in matching], [score for encoded, score in matching]
 
         else:
-            if not sorts:
+            script, keys, args, fetch, temps = cls._plan_and_compile(kind.kind(), spec, options, ancestor, channel)
 
-                # grab all entities of this kind
-                prefix = model.Key(kind, 0, parent=ancestry_parent).urlsafe().replace('=', '')[0:-3]
-                matching_keys = cls.execute(cls.Operations.KEYS, kind.kind(), prefix + '*')  # regex search it. why not
+            try:
+                result = cls._run_query(script, keys, args, temps, channel)
 
-                # if we're doing keys only, we're done
-                if options.keys_only:
-                    return [model.Key.from_urlsafe(k, _persisted=True) for k in matching_keys]
+            except _redis_client.exceptions.ResponseError:
+                if spec[0] or spec[1] or options.cursor is not None:
+                    raise
 
-        # otherwise, build entities and return
-        result_entities = []
+                # legacy (set-based) kind index: walk it with cursors instead
+                fetch, result = 'keys', [cls.scan_kind(kind.kind(), options.offset, options.limit, ancestor, channel)]
 
-        # fetch keys
-        with cls.channel(kind.kind()).pipeline() as pipeline:
+            matching_keys = result[0]
+            if fetch != 'keys':
+                values = result[1]
+            if len(result) > 2:
+                position, more, scores = result[2], bool(result[3]), result[4]
 
-            # fill pipeline
-            for key in matching_keys:
-                cls.execute(cls.Operations.GET, kind.kind(), key, target=pipeline)
+        keys = [cls.decode_key(k) for k in matching_keys]
+        scores = scores or [[] for k in matching_keys]
 
-            _blob_results = pipeline.execute()
+        # if we're doing keys only, we're done
+        if options.keys_only:
+            if more and matching_keys and not position:
+                position = cls._position(matching_keys[-1], scores[-1])
+            return [(encoded, key, None, score) for encoded, key, score in zip(matching_keys, keys, scores)], position, more
 
-            # execute pipeline, zip keys and build results
-            for key, entity in zip([model.Key.from_urlsafe(k, _persisted=True) for k in matching_keys], _blob_results):
-                if not entity:
-                    continue
+        if values is None:
+            values = cls.get_multi([(k, key.flatten(True)[1]) for k, key in zip(matching_keys, keys)],
+                                   consistency=options.consistency)
+
+        elif fetch == 'projection':
+            values = [None if raw is None else dict(((name, cls.serializer.loads(value))
+                                                     for name, value in zip(options.projection, raw) if value is not None))
+                      for raw in values]
+
+        elif fetch == RedisMode.hashkey_hash:
+            values = [cls._deserialize(dict(zip(raw[::2], raw[1::2])), fetch) for raw in values]
+
+        else:
+            values = [cls._deserialize(raw, fetch) for raw in values]
+
+        # attach keys, skip entities that vanished since they were indexed, and construct
+        results = []
+        for encoded, key, decoded, score in zip(matching_keys, keys, values, scores):
+            if decoded is None:
+                continue
+            if options.projection:
+                decoded = dict(((name, decoded[name]) for name in options.projection if name in decoded))
+                decoded['_projection'] = options.projection
+            decoded['key'] = key
+            results.append((encoded, key, kind(_persisted=True, **decoded), score))
+
+        if more and matching_keys and not position:
+            position = cls._position(matching_keys[-1], scores[-1])
+        return results, position, more
+
+    @classmethod
+    def _plan_and_compile(cls, kind, spec, options, ancestor, channel, tally=None):
+
+        ''' Plan a query against one channel (see :py:meth:`plan_query`), and
+            compile it (see :py:meth:`compile_query`).
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param spec: Tupled ``(<filters>, <sorts>)``.
+            :param options: :py:class:`query.QueryOptions` for the query.
+            :param ancestor: Optional ancestor :py:class:`model.Key`.
+            :param channel: ``Redis`` client the query will run on.
+            :param tally: What to tally instead of returning results, if anything
+            (see :py:meth:`compile_query`).
+            :returns: Compiled query, as returned by :py:meth:`compile_query`
+            (with no temporary sets left to build, if planning built them). '''
+
+        plan = cls.plan_query(kind, spec, options, ancestor, channel)
+        script, keys, args, fetch, temps = cls.compile_query(kind, spec, options, ancestor, plan, tally)
+        return script, keys, args, fetch, ([] if plan.estimates else temps)
+
+    @classmethod
+    def _tally(cls, kind, filters, options, ancestor, channel, prop=None, function=None):
+
+        ''' Count (or aggregate a numeric property over) the entities matching
+            a query's filters on one channel (see :py:meth:`count_query` and
+            :py:meth:`aggregate_query`).
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param filters: :py:class:`query.Filter` directives of the query.
+            :param options: :py:class:`query.QueryOptions` for the query.
+            :param ancestor: Optional root ancestor :py:class:`model.Key`.
+            :param channel: ``Redis`` client to read from.
+            :param prop: :py:class:`model.Property` to aggregate, if aggregating.
+            :param function: Aggregate function, if aggregating.
+            :returns: Count of matching entities or, if aggregating, tupled
+            ``(<count>, <sum>, <min>, <max>)`` (each ``None`` if not known). '''
+
+        from apptools.model import query
+
+        sets, ranges, orders, excluded, temps = cls._query_sources(kind, (filters, []))
+        direct = ancestor is None and not (excluded or temps)
+        channel = cls._primary_of(channel) if temps else channel
+
+        if prop is None and direct:
+
+            # single indexes are counted directly
+            if not filters:
+                try:
+                    return cls.execute(cls.Operations.SORTED_CARDINALITY, None, cls.kind_index(kind), target=channel)
+                except _redis_client.exceptions.ResponseError:
+                    # legacy (set-based) kind index
+                    return cls.execute(cls.Operations.SET_CARDINALITY, None, cls.kind_index(kind), target=channel)
+            if len(sets) == 1 and not ranges:
+                return cls.execute(cls.Operations.SET_CARDINALITY, None, sets[0][0], target=channel)
+            if len(ranges) == 1 and not sets:
+                index, low, high, lexical, name = ranges[0]
+                return cls.execute(cls.Operations.SORTED_LEX_COUNT if lexical else cls.Operations.SORTED_COUNT, None,
+                                   index, low, high, target=channel)
+
+            # equality filters alone: intersect into a short-lived set, shared by repeated counts (replicas, being
+            # read-only, tally in the query script below instead)
+            if not ranges and cls.EngineConfig.count_ttl and cls._primary_of(channel) is channel:
+                indexes = sorted((index for index, name in sets))
+                cached = cls._magic_separator.join([cls._temp_prefix, hashlib.md5(json.dumps(
+                    ['count'] + indexes).encode('utf-8')).hexdigest()])
+                return cls.execute(cls.Operations.EVALUATE, None, _LUA_CACHED_INTERSECT, len(indexes) + 1, cached,
+                                   *(indexes + [cls.EngineConfig.count_ttl]), target=channel)
+
+        target = None
+        if prop is not None:
+            target = cls._index_for(kind, prop, _SORTABLE_SAMPLES[prop._basetype])[1]
+
+            # the property's own index answers unfiltered (or range-filtered) aggregates
+            if direct and not sets and (not ranges or (len(ranges) == 1 and ranges[0][4] == prop.name)):
+                low, high = ranges[0][1:3] if ranges else ('-inf', '+inf')
+                if function == 'min':
+                    entries = cls.execute(cls.Operations.SORTED_RANGE_BY_SCORE, None, target, low, high,
+                                          start=0, num=1, withscores=True, target=channel)
+                    return None, None, (entries[0][1] if entries else None), None
+                if function == 'max':
+                    entries = cls.execute(cls.Operations.SORTED_MEMBERS_BY_SCORE, None, target, high, low,
+                                          start=0, num=1, withscores=True, target=channel)
+                    return None, None, None, (entries[0][1] if entries else None)
+                return cls.execute(cls.Operations.EVALUATE, None, _LUA_AGGREGATE_INDEX, 1, target, low, high,
+                                   target=channel)
+
+        # otherwise, match in a query script and tally there
+        script, keys, args, fetch, temps = cls._plan_and_compile(kind, (filters, []), query.QueryOptions(
+            hint=options.hint, plan=options.plan), ancestor, channel, target or 'count')
+        return cls._run_query(script, keys, args, temps, channel)
+
+    @classmethod
+    def _query_channel(cls, kind, spec, channel):
+
+        ''' Resolve the channel to run a query on: ``channel`` itself, unless
+            the query builds temporary sets (for ``IN`` and ``!=`` filters, see
+            :py:meth:`_temp_union`) - which replicas can't hold, so those queries
+            run on the primary behind ``channel`` instead.
+
+            :param kind: String :py:class:`model.Model` kind.
+            :param spec: Tupled ``(<filters>, <sorts>)``.
+            :param channel: ``Redis`` client picked to read from.
+            :returns: ``Redis`` client. '''
+
+        return cls._primary_of(channel) if cls._query_sources(kind, spec)[4] else channel
+
+    @classmethod
+    def _run_query(cls, script, keys, args, temps, channel):
+
+        ''' Run a compiled query script (see :py:meth:`compile_query`),
+            building any temporary sets it reads in the same round-trip.
+
+            :param script: Registered query script.
+            :param keys: ``KEYS`` for the script.
+            :param args: ``ARGV`` for the script.
+            :param temps: Temporary sets to build first.
+            :param channel: ``Redis`` client to run the query on.
+            :returns: The script's result. '''
+
+        if not temps:
+            return script(keys=keys, args=args, client=channel)
+
+        with channel.pipeline(transaction=True) as pipeline:
+            script(keys=keys, args=args, client=cls._build_temps(temps, pipeline))
+            return pipeline.execute()[-1]
+
+    @classmethod
+    def _position(cls, encoded, scores=None):
+
+        ''' Calculate the cursor position of a result client-side, in the
+            form query scripts return it in: the result's sort scores (or
+            its kind score, if unsorted), followed by its encoded key.
+
+            :param encoded: Encoded key of the result.
+            :param scores: Sort scores of the result, as returned by the query
+            script. Empty (or ``None``) for results of unsorted queries.
+            :returns: ``list`` position. '''
+
+        if not scores:
+            return list(cls._kind_order(encoded))
+        return list(scores) + [encoded]
+
+    @classmethod
+    def _merge_results(cls, results, sorts):
+
+        ''' Merge query results gathered from several shards back into the
+            order a single server would return them in: by the sort values
+            each shard returned (numeric scores, or strings for lexicographic
+            sorts, with ties broken by encoded key) or, if unsorted, in kind
+            index order - by the kind scores shards return with unsorted
+            results, which is how keys were actually scored when they were
+            written (see :py:meth:`kind_score`).
+
+            :param results: ``list`` of tupled ``(<encoded key>, <key>, <entity>, <sort scores>)`` results.
+            :param sorts: :py:class:`query.Sort` directives of the query.
+            :returns: Ordered ``list`` of results. '''
+
+        from apptools.model import query
+
+        if not sorts:
+            return sorted(results, key=lambda result: (
+                (float(result[3][0]), result[0]) if result[3] else cls._kind_order(result[0])))
+
+        # stable sorts, least significant first
+        results = sorted(results, key=lambda result: result[0])
+        for i, _sort in reversed(list(enumerate(sorts))):
+            convert = str if cls._lexical(_sort.target) else float
+            results.sort(key=lambda result: convert(result[3][i]), reverse=(_sort.operator is query.DESCENDING))
+        return results
+
+    @classmethod
+    def _kind_order(cls, encoded):
 
-                # decode raw entity
-                decoded = cls.get(None, None, entity)
+        ''' Estimate the kind index position of an encoded key, for merging
+            keys gathered from several shards without their kind scores (from
+            legacy set-based kind indexes). Encoded keys can't tell integer IDs
+            from their strings, so numeric strings are taken as integers (see
+            :py:meth:`kind_score`).
 
-                # attach key, decode entity and construct
-                decoded['key'] = key
-                result_entities.append(kind(_persisted=True, **decoded))
+            :param encoded: Encoded :py:class:`model.Key`.
+            :returns: Tupled ``(<kind score>, <encoded key>)``. '''
 
-        return result_entities
+        key_id = cls.decode_key(encoded).id
+        if isinstance(key_id, basestring) and (key_id[1:] if key_id[:1] == '-' else key_id).isdigit():
+            key_id = int(key_id)  # IDs come back from encoded keys as strings
+        return (key_id if isinstance(key_id, (int, long)) and not isinstance(key_id, bool) else 0), encoded
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+    apptools model adapter: session
+
+    request-scoped identity map and unit of work,
+    coalescing the model reads and writes made
+    while it's open.
+
+    :author: Sam Gammon <sam@momentum.io>
+    :copyright: (c) momentum labs, 2013
+    :license: The inspection, use, distribution, modification or implementation
+              of this source code is governed by a private license - all rights
+              are reserved by the Authors (collectively, "momentum labs, ltd")
+              and held under relevant California and US Federal Copyright laws.
+              For full details, see ``LICENSE.md`` at the root of this project.
+              Continued inspection of this source code demands agreement with
+              the included license and explicitly means acceptance to these terms.
+
+'''
+
+
+# stdlib
+import threading
+import collections
+
+
+## Globals
+_state = threading.local()  # holds the stack of open sessions, per thread
+
+
+## Session
+# Identity map and unit of work for the model API, scoped to a request.
+class Session(object):
+
+    ''' Request-scoped identity map and unit of work. While a session is
+        open (as a context manager, or for the length of a request handled
+        by a :py:class:`core.BaseHandler` with ``model_session`` enabled),
+        the model API routes through it:
+
+        - repeated reads of a key return the same entity instance (or
+          ``None``), reading from storage only once.
+        - writes and deletes are buffered, and flushed when the
+          session closes, in one batched adapter call per adapter. Repeated
+          writes to one key coalesce into the last of them.
+
+        Entities are validated (and keyless entities get their IDs) as
+        they're put, so ``put`` still returns a complete key. The session
+        holds the entity itself, not a copy: changes made to it after
+        ``put`` (and before the session closes) are flushed with it, and
+        aren't re-validated. Buffered deletes return ``None``. Queries flush buffered writes before
+        they execute, so their results include them. If the session closes
+        with an exception, buffered writes are discarded. '''
+
+    def __init__(self):
+
+        ''' Initialize an empty :py:class:`Session`. '''
+
+        self.identity, self.writes, self.deletes = {}, collections.OrderedDict(), collections.OrderedDict()
+
+    def __enter__(self):
+
+        ''' Open this session, for the current thread.
+
+            :returns: This :py:class:`Session`. '''
+
+        if not hasattr(_state, 'sessions'):
+            _state.sessions = []
+        _state.sessions.append(self)
+        return self
+
+    def __exit__(self, exc_type, exception, traceback):
+
+        ''' Close this session, flushing buffered writes - or, if an
+            exception was raised, discarding them.
+
+            :returns: ``False``, so exceptions propagate. '''
+
+        _state.sessions.remove(self)
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+        return False
+
+    @classmethod
+    def current(cls):
+
+        ''' Resolve the innermost open session, for the current thread.
+
+            :returns: Open :py:class:`Session`, or ``None``. '''
+
+        sessions = getattr(_state, 'sessions', None)
+        return sessions[-1] if sessions else None
+
+    @staticmethod
+    def _identify(adapter, key):
+
+        ''' Build an identity map key for a :py:class:`model.Key`, via its adapter. '''
+
+        return adapter.__class__.__name__, key.urlsafe()
+
+    def get(self, adapter, key, **kwargs):
+
+        ''' Retrieve an entity by key, once per session.
+
+            :param adapter: :py:class:`ModelAdapter` to read through.
+            :param key: :py:class:`model.Key` to retrieve.
+            :returns: Entity :py:class:`model.Model` instance, or ``None``. '''
+
+        return self.get_multi(adapter, [key], **kwargs)[0]
+
+    def get_multi(self, adapter, keys, **kwargs):
+
+        ''' Retrieve a batch of entities by key, reading only keys that
+            aren't already known to the session, in one adapter call.
+
+            :param adapter: :py:class:`ModelAdapter` to read through.
+            :param keys: Iterable of :py:class:`model.Key` objects.
+            :returns: ``list`` of entities (or ``None``), in the same order as ``keys``. '''
+
+        identities, missing = [self._identify(adapter, key) for key in keys], collections.OrderedDict()
+        for identity, key in zip(identities, keys):
+            if identity not in self.identity:
+                missing.setdefault(identity, key)
+
+        if missing:
+            for identity, entity in zip(missing.keys(), adapter._get_multi(missing.values(), **kwargs)):
+                self.identity[identity] = entity
+        return [self.identity[identity] for identity in identities]
+
+    def put(self, adapter, entity):
+
+        ''' Buffer an entity write.
+
+            :param adapter: :py:class:`ModelAdapter` to write through.
+            :param entity: Entity :py:class:`model.Model` to persist.
+            :returns: The entity's (possibly newly-allocated) :py:class:`model.Key`. '''
+
+        return self.put_multi(adapter, [entity])[0]
+
+    def put_multi(self, adapter, entities):
+
+        ''' Buffer a batch of entity writes, validating each entity and
+            allocating IDs for keyless ones (in one call per kind).
+
+            :param adapter: :py:class:`ModelAdapter` to write through.
+            :param entities: Iterable of :py:class:`model.Model` entities.
+            :returns: ``list`` of :py:class:`model.Key` objects, in the same order as ``entities``. '''
+
+        keyless = {}
+        for entity in entities:
+            _model = adapter._validate(entity)
+            if not entity.key:
+                keyless.setdefault(entity.kind(), (_model, []))[1].append(entity)
+
+        for kind, (_model, batch) in keyless.items():
+            for entity, id in zip(batch, adapter.allocator.allocate(_model.__keyclass__, kind, len(batch))):
+                entity._set_key(_model.__keyclass__(kind, id))
+
+        for entity in entities:
+            identity = self._identify(adapter, entity.key)
+            self.deletes.pop(identity, None)
+            self.writes.pop(identity, None)  # later writes flush in their own order
+            self.writes[identity] = adapter, entity
+            self.identity[identity] = entity
+        return [entity.key for entity in entities]
+
+    def delete(self, adapter, key):
+
+        ''' Buffer a delete.
+
+            :param adapter: :py:class:`ModelAdapter` to delete through.
+            :param key: :py:class:`model.Key` to delete.
+            :returns: ``None``, as the delete hasn't happened yet. '''
+
+        self.delete_multi(adapter, [key])
+
+    def delete_multi(self, adapter, keys):
+
+        ''' Buffer a batch of deletes.
+
+            :param adapter: :py:class:`ModelAdapter` to delete through.
+            :param keys: Iterable of :py:class:`model.Key` objects to delete.
+            :returns: ``list`` of ``None``, as the deletes haven't happened yet. '''
+
+        for key in keys:
+            identity = self._identify(adapter, key)
+            self.writes.pop(identity, None)
+            self.deletes[identity] = adapter, key
+            self.identity[identity] = None
+        return [None] * len(keys)
+
+    def flush(self):
+
+        ''' Flush buffered writes, and then deletes, in one batched call per adapter.
+
+            :returns: Nothing. '''
+
+        writes, deletes = self.writes, self.deletes
+        self.writes, self.deletes = collections.OrderedDict(), collections.OrderedDict()
+
+        for batches, method in ((writes, '_put_multi'), (deletes, '_delete_multi')):
+            by_adapter = collections.OrderedDict()
+            for adapter, target in batches.itervalues():
+                by_adapter.setdefault(adapter, []).append(target)
+            for adapter, targets in by_adapter.iteritems():
+                getattr(adapter, method)(targets)
+
+    def discard(self):
+
+        ''' Drop buffered writes and forget every entity known to the session.
+
+            :returns: Nothing. '''
+
+        self.identity.clear()
+        self.writes.clear()
+        self.deletes.clear()
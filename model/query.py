@@ -26,9 +26,11 @@ __version__ = 'v2'
 
 # stdlib
 import abc
+import base64
 import operator
 
 # apptools utils
+from apptools.util import json
 from apptools.util import datastructures
 
 
@@ -91,7 +93,8 @@ class QueryOptions(object):
         '_projection',
         '_hint',
         '_plan',
-        '_cursor'
+        '_cursor',
+        '_consistency'
     ))
 
     # == Option Defaults == #
@@ -103,7 +106,8 @@ class QueryOptions(object):
         '_projection': None,
         '_hint': None,
         '_plan': None,
-        '_cursor': None
+        '_cursor': None,
+        '_consistency': None
     }
 
     ## == Internal Methods == ##
@@ -124,7 +128,7 @@ class QueryOptions(object):
             :returns: Nothing, as this is a constructor. '''
 
         map(lambda bundle: self._set_option(*bundle),
-            map(lambda slot: (slot, kwargs.get(slot, datastructures._EMPTY)), self.__slots__))
+            map(lambda slot: (slot, kwargs.get(slot[1:], kwargs.get(slot, datastructures._EMPTY))), self.__slots__))
 
     ## == Protected Methods == ##
     def _set_option(self, name, value=datastructures._EMPTY):
@@ -215,9 +219,12 @@ class QueryOptions(object):
     # ``offset`` - skip an amount of records before building results
     offset = property(lambda self: self._get_option('offset'))
 
-    # ``projection`` - retrieve entity values from indexes while fulfilling query
+    # ``projection`` - properties to retrieve, returned on partially-populated entities (optional)
     projection = property(lambda self: self._get_option('projection'))
 
+    # ``hint`` - property (or ``KEY_KIND``/``KEY_ANCESTOR``) whose index should drive the query (optional)
+    hint = property(lambda self: self._get_option('hint'))
+
     # ``plan`` - cached plan to fulfill the query (optional)
     plan = property(lambda self: self._get_option('plan'),
                     lambda self, value: self._set_option('plan', value))
@@ -226,6 +233,84 @@ class QueryOptions(object):
     cursor = property(lambda self: self._get_option('cursor'),
                       lambda self, value: self._set_option('cursor', value))
 
+    # ``consistency`` - read consistency, for adapters that can serve reads from replicas (optional)
+    consistency = property(lambda self: self._get_option('consistency'))
+
+
+## Cursor
+# Opaque position in the results of a :py:class:`Query`.
+class Cursor(object):
+
+    ''' Opaque, URL-safe position in the results of a
+        :py:class:`Query`, pointing just past the last
+        result that was returned. The ``position`` is
+        recorded (and understood) by the adapter that
+        executed the query - usually the sort values
+        and key of that last result - so adapters can
+        seek straight to the next page, rather than
+        skipping an ever-growing offset. '''
+
+    __slots__ = ('position',)
+
+    def __init__(self, position):
+
+        ''' Initialize this :py:class:`Cursor`.
+
+            :param position: Adapter-specific, JSON-
+            serializable ``list`` of values. '''
+
+        self.position = list(position)
+
+    def __repr__(self):
+
+        ''' Generate a string representation of
+            this :py:class:`Cursor`. '''
+
+        return 'Cursor(%s)' % self.urlsafe()
+
+    def __eq__(self, other):
+
+        ''' Compare two cursors by position. '''
+
+        return isinstance(other, Cursor) and self.position == other.position
+
+    def __ne__(self, other):
+
+        ''' Compare two cursors by position. '''
+
+        return not self.__eq__(other)
+
+    def urlsafe(self):
+
+        ''' Encode this :py:class:`Cursor` for
+            transport, in URLs or otherwise.
+
+            :returns: URL-safe ``str``. '''
+
+        return base64.urlsafe_b64encode(json.dumps(self.position)).rstrip('=')
+
+    @classmethod
+    def from_urlsafe(cls, encoded):
+
+        ''' Inflate a :py:class:`Cursor` from its
+            :py:meth:`urlsafe` form.
+
+            :param encoded: URL-safe cursor string.
+
+            :raises ValueError: If ``encoded`` is not
+            a valid cursor.
+
+            :returns: :py:class:`Cursor`. '''
+
+        try:
+            position = json.loads(base64.urlsafe_b64decode(str(encoded) + ('=' * (-len(encoded) % 4))))
+        except (TypeError, ValueError):
+            raise ValueError('Invalid query cursor: "%s".' % encoded)
+
+        if not isinstance(position, list):
+            raise ValueError('Invalid query cursor: "%s".' % encoded)
+        return cls(position)
+
 
 ## AbstractQuery
 # Specifies the interface for an ``apptools`` model API query class.
@@ -380,20 +465,19 @@ class Query(AbstractQuery):
             key is encountered. Passed up from
             :py:class:`QueryOptions`.
 
+            :raises AttributeError: If a ``projection``
+            names a property the queried kind doesn't
+            have.
+
             :raises NotImplementedError: In the case
-            that a ``kindless`` or ``projection``
-            query is encountered, as those features
-            are not yet supported.
+            that a ``kindless`` query is encountered,
+            as those are not yet supported.
 
             :returns: Synchronously-retrieved results
             to this :py:class:`Query`. '''
 
         ## build query options
-        options = options.get('options', QueryOptions(**options))
-
-        ## fail for projection queries
-        if options.projection:
-            raise NotImplementedError('Projection queries are not yet supported.')
+        options = self._prepare(options.get('options', QueryOptions(**options)))
 
         if self.kind:  # kinded query
 
@@ -405,6 +489,55 @@ class Query(AbstractQuery):
             # kindless queries are not yet supported
             raise NotImplementedError('Kindless queries are not yet supported.')
 
+    def _prepare(self, options):
+
+        ''' Internal method to resolve query options
+            before they're passed to an adapter: any
+            ``hint`` given to :py:meth:`hint` is applied
+            (unless overridden), and properties named
+            by ``projection`` and ``hint`` are reduced
+            to their names.
+
+            :param options: :py:class:`QueryOptions`
+            to resolve.
+
+            :raises AttributeError: If a ``projection``
+            or ``hint`` names a property the queried
+            kind doesn't have.
+
+            :returns: ``options``, resolved. '''
+
+        from apptools.model.adapter.session import Session
+
+        # writes buffered by an open session are flushed first, so results include them
+        session = Session.current()
+        if session is not None:
+            session.flush()
+
+        if options.hint is None and self.options.hint is not None:
+            options._set_option('hint', self.options.hint)
+
+        if self.kind:
+
+            # projections may list properties or property names - adapters get names
+            if options.projection:
+                projection = tuple((getattr(prop, 'name', prop) for prop in options.projection))
+                for name in projection:
+                    if name not in self.kind.__lookup__:
+                        raise AttributeError('Cannot project nonexistent property "%s" '
+                                             'of kind "%s".' % (name, self.kind.kind()))
+                options._set_option('projection', projection)
+
+            # hints name a property (or the kind or ancestry indexes)
+            if options.hint is not None and options.hint is not KEY_KIND and options.hint is not KEY_ANCESTOR:
+                hint = getattr(options.hint, 'name', options.hint)
+                if hint not in self.kind.__lookup__:
+                    raise AttributeError('Cannot hint nonexistent property "%s" '
+                                         'of kind "%s".' % (hint, self.kind.kind()))
+                options._set_option('hint', hint)
+
+        return options
+
     def filter(self, expression):
 
         ''' Add a filter to this :py:class:`Query`.
@@ -443,17 +576,46 @@ class Query(AbstractQuery):
 
         ''' Provide an external hint to the query
             planning logic about how to plan the
-            query.
+            query: the index to drive it from, which
+            adapters use instead of the one they'd
+            otherwise estimate is cheapest.
 
-            Currently stubbed.
+            :param directive: Property (or property
+            name) filtered on by this :py:class:`Query`,
+            or ``KEY_KIND`` or ``KEY_ANCESTOR``, to scan
+            the kind or ancestry indexes instead.
 
-            :raises NotImplementedError: Always,
-            as this method is currently stubbed.
+            :raises AttributeError: If ``directive``
+            names a property the queried kind doesn't
+            have.
 
             :returns: ``self``, for chainability. '''
 
-        # @TODO(sgammon): fill out query hinting logic
-        raise NotImplementedError('Query method `hint` is currently stubbed.')
+        self.options._set_option('hint', directive)
+        self._prepare(self.options)
+        return self
+
+    def explain(self, **options):
+
+        ''' Explain how the currently-built
+            :py:class:`Query` would be executed,
+            without executing it.
+
+            :param **options: Accepts any valid and
+            registered options on :py:class:`QueryOptions`.
+
+            :raises NotImplementedError: If the attached
+            ``kind``'s adapter can't plan queries, or
+            the query is ``kindless``.
+
+            :returns: Adapter-specific plan for the
+            query, along with its estimated costs. '''
+
+        options = self._prepare(QueryOptions(**options))
+
+        if not self.kind:
+            raise NotImplementedError('Kindless queries are not yet supported.')
+        return self.kind.__adapter__.explain_query(self.kind, (self.filters, self.sorts), options)
 
     def get(self, **options):
 
@@ -485,19 +647,226 @@ class Query(AbstractQuery):
 
         return self._execute(options=QueryOptions(**options))
 
-    def fetch_page(self, **options):
+    def count(self, **options):
+
+        ''' Count the results of the currently-built
+            :py:class:`Query`, without fetching them.
+            Adapters answer counts from their indexes
+            where they can.
+
+            :param **options: Accepts any valid and
+            registered options on :py:class:`QueryOptions`.
+            ``offset`` and ``limit`` apply to the count.
+
+            :raises NotImplementedError: In the case
+            that a ``kindless`` query is encountered.
+
+            :returns: Number (``int``) of matching
+            entities. '''
+
+        options = self._prepare(QueryOptions(**options))
+
+        if not self.kind:
+            raise NotImplementedError('Kindless queries are not yet supported.')
+        return self.kind.__adapter__.count_query(self.kind, (self.filters, []), options)
+
+    def sum(self, prop, **options):
+
+        ''' Sum a numeric property over every result
+            of the currently-built :py:class:`Query`.
+
+            :param prop: Property (or property name)
+            to sum.
+
+            :param **options: Accepts any valid and
+            registered options on :py:class:`QueryOptions`.
+
+            :returns: Sum of the property's values,
+            or ``0`` if no entities match. '''
+
+        return self._aggregate(prop, 'sum', options)
+
+    def min(self, prop, **options):
+
+        ''' Find the smallest value of a numeric
+            property across the results of the
+            currently-built :py:class:`Query`.
+
+            :param prop: Property (or property name)
+            to find the minimum of.
+
+            :param **options: Accepts any valid and
+            registered options on :py:class:`QueryOptions`.
+
+            :returns: Smallest value, or ``None`` if
+            no entities match. '''
+
+        return self._aggregate(prop, 'min', options)
+
+    def max(self, prop, **options):
+
+        ''' Find the largest value of a numeric
+            property across the results of the
+            currently-built :py:class:`Query`.
+
+            :param prop: Property (or property name)
+            to find the maximum of.
+
+            :param **options: Accepts any valid and
+            registered options on :py:class:`QueryOptions`.
+
+            :returns: Largest value, or ``None`` if
+            no entities match. '''
+
+        return self._aggregate(prop, 'max', options)
+
+    def avg(self, prop, **options):
+
+        ''' Average a numeric property over the
+            results of the currently-built
+            :py:class:`Query`.
+
+            :param prop: Property (or property name)
+            to average.
+
+            :param **options: Accepts any valid and
+            registered options on :py:class:`QueryOptions`.
+
+            :returns: Mean (``float``) of the property's
+            values, or ``None`` if no entities match. '''
+
+        return self._aggregate(prop, 'avg', options)
+
+    def _aggregate(self, prop, function, options):
+
+        ''' Internal method to aggregate a numeric
+            property over the results of a query,
+            via the underlying driver's
+            :py:meth:`aggregate_query` method.
+
+            :param prop: Property (or property name)
+            to aggregate.
+
+            :param function: Aggregate function name
+            (``sum``, ``min``, ``max`` or ``avg``).
+
+            :param options: ``dict`` of query options.
+
+            :raises AttributeError: If ``prop`` names
+            a property the queried kind doesn't have.
+
+            :raises ValueError: If ``prop`` isn't a
+            numeric property.
+
+            :raises NotImplementedError: In the case
+            that a ``kindless`` query is encountered.
+
+            :returns: Aggregated value. '''
+
+        options = self._prepare(QueryOptions(**options))
+
+        if not self.kind:
+            raise NotImplementedError('Kindless queries are not yet supported.')
+
+        name = getattr(prop, 'name', prop)
+        if name not in self.kind.__lookup__:
+            raise AttributeError('Cannot aggregate nonexistent property "%s" '
+                                 'of kind "%s".' % (name, self.kind.kind()))
+
+        prop = getattr(self.kind, name)
+        if prop._basetype not in (int, long, float):
+            raise ValueError('Cannot aggregate non-numeric property "%s" '
+                             'of kind "%s".' % (name, self.kind.kind()))
+        return self.kind.__adapter__.aggregate_query(self.kind, (self.filters, []), options, prop, function)
+
+    def fetch_page(self, page_size=None, **options):
 
         ''' Fetch a page of results, potentially
             as the next in a sequence of page
-            requests.
+            requests. Pages resume from a
+            :py:class:`Cursor` rather than an
+            offset, so adapters can seek straight
+            to them.
+
+            Adapters supporting cursors set the
+            ``cursor`` option, after execution, to
+            a :py:class:`Cursor` just past the last
+            result - or to ``None``, if no results
+            follow.
+
+            :param page_size: Maximum number of
+            results in the page. Defaults to the
+            ``limit`` option.
+
+            :param **options: Accepts any valid and
+            registered options on :py:class:`QueryOptions`,
+            including a ``cursor`` (or its ``urlsafe``
+            form) returned with a previous page.
+
+            :raises ValueError: If no page size is
+            given, or the ``cursor`` is invalid.
+
+            :returns: Tupled ``(<results>, <cursor>,
+            <more>)``, where ``cursor`` resumes after
+            this page (or is ``None``), and ``more``
+            indicates whether further results follow. '''
+
+        page_size = page_size or options.pop('limit', None)
+        if not page_size or page_size < 0:
+            raise ValueError('Query method `fetch_page` requires a positive page size.')
+
+        if isinstance(options.get('cursor'), basestring):
+            options['cursor'] = Cursor.from_urlsafe(options['cursor'])
+
+        options['limit'] = page_size
+        options = QueryOptions(**options)
+        results = self._execute(options=options)
+        return results, options.cursor, options.cursor is not None
+
+    def iter(self, batch_size=100, **options):
+
+        ''' Iterate over results lazily, for queries
+            too large to hold in memory at once.
+            Results are fetched in batches (via
+            :py:meth:`fetch_page`, so each batch
+            resumes from a :py:class:`Cursor`), and
+            each batch is released before the next
+            one is fetched.
+
+            :param batch_size: Number of results to
+            fetch per round-trip. Defaults to ``100``.
 
             :param **options: Accepts any valid and
             registered options on :py:class:`QueryOptions`.
+            ``limit`` caps the total number of results,
+            and ``offset`` applies to the first batch.
+
+            :raises ValueError: If ``batch_size`` is
+            not positive.
+
+            :returns: Generator, yielding matching model
+            entities (or keys, if ``keys_only`` is truthy). '''
+
+        if not batch_size or batch_size < 1:
+            raise ValueError('Query method `iter` requires a positive batch size.')
+
+        limit = options.pop('limit', None)
+        remaining = None if (limit is None or limit < 0) else limit
+
+        while remaining is None or remaining > 0:
+            batch, options['cursor'], more = self.fetch_page(
+                batch_size if remaining is None else min(batch_size, remaining), **options)
+            options.pop('offset', None)  # only skip ahead once
+
+            for result in batch:
+                yield result
 
-            :param page: '''
+            if remaining is not None:
+                remaining -= len(batch)
+            del batch  # release this batch before fetching the next
 
-        # @TODO(sgammon): build out paging support
-        raise NotImplementedError('Query method `fetch_page` is currently stubbed.')
+            if not more:
+                break
 
 
 ## QueryComponent
@@ -548,7 +917,7 @@ class Filter(QueryComponent):
 
         from apptools import model
         value = model.AbstractModel._PropertyValue(value, False)  # make a value
-        self.target, self.value, self.kind, self.operator = prop, value, type, operator
+        self.target, self.value, self.kind, self.operator = property, value, type, operator
 
     def __repr__(self):
 
@@ -593,4 +962,4 @@ class Sort(QueryComponent):
         ''' Generate a string representation of
             this :py:class:`Sort`. '''
 
-        return 'Sort(%s, %s)' % (self.target.name, self.direction)
+        return 'Sort(%s, %s)' % (self.target.name, self.operator.name)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+    apptools model benchmarks
+
+    times validation, serialization and puts of a wide
+    model, through the routines generated for each model
+    class against the generic routines they replace.
+    run with ``python -m apptools.tests.test_model.benchmark``.
+
+    :author: Sam Gammon <sam@momentum.io>
+    :copyright: (c) momentum labs, 2013
+    :license: The inspection, use, distribution, modification or implementation
+              of this source code is governed by a private license - all rights
+              are reserved by the Authors (collectively, "momentum labs, ltd")
+              and held under relevant California and US Federal Copyright laws.
+              For full details, see ``LICENSE.md`` at the root of this project.
+              Continued inspection of this source code demands agreement with
+              the included license and explicitly means acceptance to these terms.
+
+'''
+
+
+# stdlib
+import time
+import datetime
+
+# apptools model API
+from apptools import model
+from apptools.model.adapter import inmemory
+
+
+## Globals
+_WIDTH = 40  # number of properties on benchmarked models
+_ROUNDS = 3  # best-of rounds per measurement
+
+
+def _wide(name, compact=False):
+
+    ''' Build a wide model class, with a mix of basetypes and policies.
+
+        :param name: Model class (kind) name.
+        :param compact: Whether the model uses slot storage.
+        :returns: :py:class:`model.Model` subclass. '''
+
+    specs = (basestring, int, (float, {'required': True}), (int, {'repeated': True}), (bool, {'default': False}),
+             datetime.date, (basestring, {'repeated': True}), long)
+    properties = dict((('p%02d' % i, specs[i % len(specs)]) for i in xrange(_WIDTH)))
+    properties.update({'__adapter__': inmemory.InMemoryAdapter, '__compact__': compact})
+    return type(model.Model)(name, (model.Model,), properties)
+
+
+def _entity(wide, i):
+
+    ''' Build an entity of a wide model, leaving a few properties unset. '''
+
+    samples = ('value', i, 1.5, [1, 2, 3], True, datetime.date(2013, 1, 1), ['a', 'b'], 10L)
+    return wide(**dict((('p%02d' % n, samples[n % len(samples)]) for n in xrange(_WIDTH) if n % 10 != 9)))
+
+
+def _generic_validate(entity):
+
+    ''' Validate an entity the generic way: :py:meth:`Property.valid` for every property, in explicit mode. '''
+
+    with entity:
+        for name in entity.to_dict(_all=True, filter=lambda x: True):
+            entity.__class__.__dict__[name].valid(entity)
+    return True
+
+
+def _generic_to_dict(entity, _all=False):
+
+    ''' Serialize an entity the generic way (a passthrough ``filter`` skips the generated serializer). '''
+
+    return entity.to_dict(_all=_all, filter=lambda x: True)
+
+
+def _best(fn, count):
+
+    ''' Time ``count`` calls of ``fn``, best of :py:data:`_ROUNDS`.
+
+        :returns: Seconds per call. '''
+
+    timings = []
+    for i in xrange(_ROUNDS):
+        started = time.time()
+        for n in xrange(count):
+            fn(n)
+        timings.append(time.time() - started)
+    return min(timings) / count
+
+
+def run(count=2000):
+
+    ''' Run the benchmark, and print a comparison table. Each measurement
+        gets fresh model classes, so puts start from empty indexes.
+
+        :param count: Number of operations per measurement.
+        :returns: ``list`` of ``(<name>, <generic seconds>, <generated seconds>)`` results. '''
+
+    measures = (('validate', lambda wide, entities: lambda n: wide.__validate__(entities[n])),
+                ('to_dict', lambda wide, entities: lambda n: entities[n].to_dict()),
+                ('put', lambda wide, entities: lambda n: _entity(wide, n).put()))
+
+    results = []
+    for compact in (False, True):
+        for name, measure in measures:
+            timings = []
+            for generic in (True, False):
+                wide = _wide('Benchmark%s%s%s' % (name.title().replace('_', ''), 'Compact' if compact else '',
+                                                  'Generic' if generic else 'Generated'), compact)
+                if generic:
+                    wide.__validate__, wide.__to_dict__ = staticmethod(_generic_validate), staticmethod(_generic_to_dict)
+                timings.append(_best(measure(wide, [_entity(wide, i) for i in xrange(count)]), count))
+            results.append(('%s%s' % (name, ' (compact)' if compact else ''), timings[0], timings[1]))
+
+    print '%-20s %14s %14s %8s' % ('%d properties' % _WIDTH, 'generic (us)', 'generated (us)', 'speedup')
+    for name, before, after in results:
+        print '%-20s %14.1f %14.1f %7.1fx' % (name, before * 1e6, after * 1e6, before / after)
+    return results
+
+
+if __name__ == '__main__':
+    run()
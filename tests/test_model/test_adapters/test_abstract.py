@@ -23,9 +23,72 @@
 # apptools test
 from apptools.tests import AppToolsTest
 
+# apptools model API
+from apptools import model
+from apptools.model.adapter import abstract
+
+
+## DictionaryAdapter
+# Keeps a `KeyCodec` kind dictionary in memory, shared by every codec built on it.
+class DictionaryAdapter(object):
+
+    ''' Kind dictionary stand-in for a model adapter. '''
+
+    kinds = {}
+
+    @classmethod
+    def kind_code(cls, kind):
+
+        ''' Assign codes in order. '''
+
+        return cls.kinds.setdefault(kind, len(cls.kinds) + 1)
+
+    @classmethod
+    def code_kind(cls, code):
+
+        ''' Look up assigned codes. '''
+
+        return dict(((v, k) for k, v in cls.kinds.iteritems())).get(code)
+
 
 ## AbstractAdapterTests
 # Tests the `ModelAdapter` abstract base class.
 class AbstractAdapterTests(AppToolsTest):
 
     ''' Tests `model.adapter.abstract`. '''
+
+    def test_key_codec(self):
+
+        ''' Test that keys survive compact packing, in fewer bytes than `base64`. '''
+
+        codec = abstract.KeyCodec(DictionaryAdapter)
+        root = model.Key("CodecSample", 5629499534213120)
+        child = model.Key("CodecChild", "named \\key", parent=root)
+        grandchild = model.Key("CodecSample", -3, parent=child)
+
+        for key in (root, child, grandchild, model.Key("CodecSample", "0"), model.Key("CodecSample", None)):
+            packed = codec.encode(key.flatten(True)[1])
+            self.assertTrue(codec.compact(packed) and not codec.compact(key.urlsafe()))
+            self.assertTrue(all((0 < ord(c) < 0x80) for c in packed))
+            self.assertEqual(codec.decode(packed, model.Key).urlsafe(), key.urlsafe())
+
+        self.assertTrue(len(codec.encode(grandchild.flatten(True)[1])) < len(grandchild.urlsafe()) / 2)
+        self.assertEqual(codec.decode(codec.encode(root.flatten(True)[1]), model.Key).id, 5629499534213120)
+
+        # joined keys can't tell integer IDs from their strings, so packed keys don't either
+        self.assertEqual(codec.encode(model.Key("CodecSample", "12").flatten()),
+                         codec.encode(model.Key("CodecSample", 12).flatten()))
+
+    def test_key_codec_dictionary(self):
+
+        ''' Test that kind codes are shared through the adapter, and unknown ones refused. '''
+
+        first, second = abstract.KeyCodec(DictionaryAdapter), abstract.KeyCodec(DictionaryAdapter)
+        packed = first.encode(model.Key("CodecShared", 1).flatten(True)[1])
+        self.assertEqual(second.decode(packed, model.Key).kind, "CodecShared")
+        self.assertEqual(second.code("CodecShared"), first.code("CodecShared"))
+
+        self.assertRaises(ValueError, second.decode, first.marker + first._pack(1) + first._pack(999) + first._pack(1),
+                          model.Key)
+        self.assertRaises(ValueError, second.decode, model.Key("CodecShared", 1).urlsafe(), model.Key)
+        self.assertEqual(first.encode((None, None, "app", "CodecShared", 1)), None)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+    apptools model tests: `apptools.model.adapter.cache`
+
+    tests the read-through entity cache that sits
+    in front of model adapters.
+
+    :author: Sam Gammon <sam@momentum.io>
+    :copyright: (c) momentum labs, 2013
+    :license: The inspection, use, distribution, modification or implementation
+              of this source code is governed by a private license - all rights
+              are reserved by the Authors (collectively, "momentum labs, ltd")
+              and held under relevant California and US Federal Copyright laws.
+              For full details, see ``LICENSE.md`` at the root of this project.
+              Continued inspection of this source code demands agreement with
+              the included license and explicitly means acceptance to these terms.
+
+'''
+
+
+# stdlib
+import time
+
+# apptools test
+from apptools.tests import AppToolsTest
+
+# apptools model API
+from apptools import model
+from apptools.model.adapter import cache
+from apptools.model.adapter import inmemory
+
+
+## CachedModel
+# Cached in front of the builtin `InMemory` model adapter.
+class CachedModel(model.Model):
+
+    ''' Test model. '''
+
+    __adapter__ = inmemory.InMemoryAdapter
+    __cache__ = {'size': 50, 'shared': False}
+
+    string = basestring
+    integer = int, {'repeated': True}
+
+
+## SharedClient
+# Stands in for a memcache client.
+class SharedClient(object):
+
+    ''' Dict-backed memcache client, with CAS. '''
+
+    def __init__(self):
+
+        ''' Initialize an empty client. '''
+
+        self.data, self.versions, self.seen = {}, {}, {}
+
+    def write(self, key, value):
+
+        ''' Write a key, bumping its CAS version. '''
+
+        self.data[key], self.versions[key] = value, self.versions.get(key, 0) + 1
+
+    def get_multi(self, keys):
+
+        ''' Get keys that are present. '''
+
+        return dict(((key, self.data[key]) for key in keys if key in self.data))
+
+    def gets(self, key):
+
+        ''' Get a key, noting its CAS version. '''
+
+        self.seen[key] = self.versions.get(key)
+        return self.data.get(key)
+
+    def add_multi(self, mapping, time=0):
+
+        ''' Add keys that aren't already present. '''
+
+        for key, value in mapping.iteritems():
+            if key not in self.data:
+                self.write(key, value)
+
+    def set_multi(self, mapping, time=0):
+
+        ''' Set keys. '''
+
+        for key, value in mapping.iteritems():
+            self.write(key, value)
+
+    def cas(self, key, value, time=0):
+
+        ''' Set a key, if it's unchanged since it was last fetched with `gets`. '''
+
+        if key in self.data and self.seen.pop(key, None) == self.versions[key]:
+            self.write(key, value)
+            return True
+        return False
+
+
+## EntityCacheTests
+# Tests the two-tier entity cache.
+class EntityCacheTests(AppToolsTest):
+
+    ''' Tests `model.adapter.cache`. '''
+
+    def setUp(self):
+
+        ''' Start each test with an empty process tier. '''
+
+        CachedModel.__adapter__._cache(CachedModel.kind()).clear()
+
+    def gets(self):
+
+        ''' Shortcut to the number of entities read from storage. '''
+
+        return inmemory._metadata['ops']['get']
+
+    def test_read_through(self):
+
+        ''' Test that repeated gets are served from the cache, as copies. '''
+
+        key = CachedModel(string="cached", integer=[1, 2]).put()
+        key.get()
+
+        reads = self.gets()
+        first, second = key.get(), CachedModel.get_multi([key])[0]
+        self.assertEqual(self.gets(), reads)
+        self.assertEqual((first.string, second.integer), ("cached", [1, 2]))
+
+        # callers can't mutate cached state
+        first.integer.append(3)
+        self.assertEqual(key.get().integer, [1, 2])
+
+    def test_invalidation(self):
+
+        ''' Test that puts and deletes invalidate cached entities. '''
+
+        key = CachedModel(string="before").put()
+        key.get()
+
+        entity = key.get()
+        entity.string = "after"
+        entity.put()
+        self.assertEqual(key.get().string, "after")
+        self.assertEqual(CachedModel.get_multi([key])[0].string, "after")
+
+        key.delete()
+        self.assertEqual(key.get(), None)
+        CachedModel.put_multi([CachedModel(key=key, string="again")])
+        self.assertEqual(key.get().string, "again")
+
+    def test_negative_caching(self):
+
+        ''' Test that misses are cached, and expire sooner than entities. '''
+
+        entities = cache.EntityCache('Sample', ttl=60, negative=1)
+        entities.fill({'missing': None, 'found': {'string': "found"}}, entities.token())
+        self.assertEqual(entities.lookup(['missing', 'found', 'unknown']),
+                         {'missing': None, 'found': {'string': "found"}})
+
+        entities.entries['missing'] = (time.time() - 1,) + entities.entries['missing'][1:]
+        self.assertEqual(entities.lookup(['missing', 'found']), {'found': {'string': "found"}})
+
+    def test_eviction_and_stale_fills(self):
+
+        ''' Test LRU eviction, and that fills racing an invalidation are skipped. '''
+
+        entities = cache.EntityCache('Sample', size=2)
+        entities.fill({'a': {}, 'b': {}}, entities.token())
+        entities.lookup(['a'])
+        entities.fill({'c': {}}, entities.token())
+        self.assertEqual(sorted(entities.lookup(['a', 'b', 'c'])), ['a', 'c'])
+
+        started = entities.token()
+        entities.invalidate(['a'])
+        entities.fill({'a': {'stale': True}}, started)
+        self.assertEqual(entities.lookup(['a']), {})
+
+    def test_shared_tier(self):
+
+        ''' Test that entities are shared (and invalidated) through memcache. '''
+
+        client = SharedClient()
+        first, second = cache.EntityCache('Sample', client=client), cache.EntityCache('Sample', client=client)
+
+        started = first.token()
+        self.assertEqual(first.lookup(['found', 'missing']), {})
+        first.fill({'found': {'string': "found"}, 'missing': None}, started)
+        self.assertEqual(second.lookup(['found', 'missing']), {'found': {'string': "found"}, 'missing': None})
+
+        first.invalidate(['found'])
+        self.assertEqual(client.get_multi([first._shared_key('found')]), {first._shared_key('found'): cache._LOCKED})
+        self.assertEqual(second.lookup(['found']), {'found': {'string': "found"}})  # second's own tier
+        second.clear()
+        self.assertEqual(second.lookup(['found']), {})
+
+    def test_shared_stale_fills(self):
+
+        ''' Test that a read racing another process's invalidation can't refill memcache with what it read. '''
+
+        client = SharedClient()
+        reader, writer = cache.EntityCache('Sample', client=client), cache.EntityCache('Sample', client=client)
+
+        # the reader misses, and reads storage while the writer writes and invalidates
+        started = reader.token()
+        self.assertEqual(reader.lookup(['a']), {})
+        writer.invalidate(['a'])
+        reader.fill({'a': {'stale': True}}, started)
+        self.assertEqual(client.data[reader._shared_key('a')], cache._LOCKED)
+
+        # fills without a reservation are skipped, too
+        writer.fill({'a': {'stale': True}}, writer.token())
+        self.assertEqual(client.data[reader._shared_key('a')], cache._LOCKED)
+
+        # the next read, inside the lock window, fills it
+        fresh = cache.EntityCache('Sample', client=client)
+        started = fresh.token()
+        self.assertEqual(fresh.lookup(['a']), {})
+        fresh.fill({'a': {'fresh': True}}, started)
+        self.assertEqual(cache.EntityCache('Sample', client=client).lookup(['a']), {'a': {'fresh': True}})
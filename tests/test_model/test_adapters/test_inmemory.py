@@ -20,6 +20,9 @@
 '''
 
 
+# stdlib
+import threading
+
 # apptools test
 from apptools.tests import AppToolsTest
 
@@ -183,3 +186,165 @@ class InMemoryAdapterTests(AppToolsTest):
         self.assertEqual(len(next_range), 10)
         for i in next_range:
             self.assertIsInstance(i, int)
+
+    def test_allocate_ids_range(self):
+
+        ''' Allocate a range of ID's, which must not overlap previous allocations. '''
+
+        first = inmemory.InMemoryAdapter.allocate_ids(model.Key, "RangeSample", 1)
+        next_range = [i for i in inmemory.InMemoryAdapter.allocate_ids(model.Key, "RangeSample", 5)()]
+        self.assertEqual(next_range, range(first + 1, first + 6))
+
+    def test_put_get_multi(self):
+
+        ''' Test putting and getting a batch of entities. '''
+
+        # put entities, one named and two ID'd
+        entities = [
+            InMemoryModel(key=model.Key(InMemoryModel.kind(), "MultiEntity"), string="named", integer=[1]),
+            InMemoryModel(string="first", integer=[2]),
+            InMemoryModel(string="second", integer=[3])
+        ]
+
+        keys = InMemoryModel.put_multi(entities)
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(keys[0].id, "MultiEntity")
+        self.assertNotEqual(keys[1].id, keys[2].id)
+
+        for key, entity in zip(keys, entities):
+            self.assertEqual(key, entity.key)
+            self.assertTrue(key.__persisted__)
+            self.assertTrue((key.urlsafe() in inmemory._metadata['__key__']))
+            self.assertTrue((not entity.__dirty__))
+
+        # get them back, with a missing key in the middle
+        missing = model.Key(InMemoryModel.kind(), "_____")
+        fetched = model.Key.get_multi([keys[0], missing, keys[1], keys[2]])
+
+        self.assertEqual(len(fetched), 4)
+        self.assertEqual(fetched[1], None)
+        self.assertEqual([e.string for e in fetched if e is not None], ["named", "first", "second"])
+
+        # get them back at the model level, via urlsafe and raw keys
+        fetched = InMemoryModel.get_multi([keys[0].urlsafe(), keys[1].flatten(False)[1:]])
+        self.assertEqual([e.string for e in fetched], ["named", "first"])
+
+    def test_delete_multi(self):
+
+        ''' Test deleting a batch of entities. '''
+
+        keys = InMemoryModel.put_multi([InMemoryModel(string="one"), InMemoryModel(string="two")])
+        missing = model.Key("SampleKind", "____InvalidKey____")
+
+        results = model.Key.delete_multi(keys + [missing])
+        self.assertEqual(results, [True, True, False])
+
+        for key in keys:
+            self.assertTrue((key.urlsafe() not in inmemory._metadata['__key__']))
+        self.assertEqual(model.Key.get_multi(keys), [None, None])
+
+    def test_incremental_index_update(self):
+
+        ''' Test that re-putting a changed entity only swaps index entries for changed properties. '''
+
+        key = InMemoryModel(string="before", integer=[1, 2]).put()
+        entity = key.get()
+        self.assertEqual(entity.__previous__, {})
+
+        # change one property, leave the other alone
+        entity.string = "after"
+        self.assertEqual(entity.__previous__, {'string': "before"})
+        entity.put()
+        self.assertEqual(entity.__previous__, {})
+
+        encoded, index = key.urlsafe(), inmemory._metadata['__index__']
+        self.assertTrue(encoded not in index.get((('InMemoryModel', 'string'), "before"), set()))
+        self.assertTrue(encoded in index[(('InMemoryModel', 'string'), "after")])
+        self.assertTrue(encoded in index[(('InMemoryModel', 'integer'), 1)])
+        self.assertTrue(encoded in index[(('InMemoryModel', 'integer'), 2)])
+
+        reverse = inmemory._metadata['__reverse__'][encoded]
+        self.assertTrue(('__index__', ('InMemoryModel', 'string'), "after") in reverse)
+        self.assertTrue(('__index__', ('InMemoryModel', 'string'), "before") not in reverse)
+
+        # repeated property changes swap every value
+        entity.integer = [2, 3]
+        entity.put()
+        self.assertTrue(encoded not in index.get((('InMemoryModel', 'integer'), 1), set()))
+        self.assertTrue(encoded in index[(('InMemoryModel', 'integer'), 2)])
+        self.assertTrue(encoded in index[(('InMemoryModel', 'integer'), 3)])
+
+    def test_id_allocator_blocks(self):
+
+        ''' Test handing out IDs from locally-reserved blocks. '''
+
+        from apptools.model.adapter import abstract
+
+        allocator = abstract.IDAllocator(inmemory.InMemoryAdapter, block=5)
+        first = allocator.allocate(model.Key, "BlockSample", 3)
+        self.assertEqual(first, range(first[0], first[0] + 3))
+        self.assertEqual(inmemory._metadata['kinds']['BlockSample']['id_pointer'], first[0] + 4)
+
+        # drains the first block, then reserves a second (doubled, since the first went quickly)
+        second = allocator.allocate(model.Key, "BlockSample", 4)
+        self.assertEqual(second[:2], [first[0] + 3, first[0] + 4])
+        self.assertEqual(allocator.blocks["BlockSample"][2], 10)
+        self.assertTrue(second[2] > first[0] + 4)
+
+        # a block size of 1 goes straight to the adapter
+        passthrough = abstract.IDAllocator(inmemory.InMemoryAdapter, block=1)
+        single = passthrough.allocate(model.Key, "BlockSample")
+        self.assertEqual(inmemory._metadata['kinds']['BlockSample']['id_pointer'], single[0])
+
+    def test_projected_put(self):
+
+        ''' Test that partially-populated (projected) entities can't be persisted. '''
+
+        entity = InMemoryModel(key=model.Key(InMemoryModel.kind(), "Projected"), string="partial",
+                               _persisted=True, _projection=('string',))
+        self.assertEqual(entity.__projection__, ('string',))
+        self.assertRaises(ValueError, entity.put)
+        self.assertRaises(ValueError, InMemoryModel.put_multi, [entity])
+        self.assertEqual(model.Key(InMemoryModel.kind(), "Projected").get(), None)
+
+    def test_concurrent_writes(self):
+
+        ''' Test that concurrent threads don't lose IDs, entities, counts or index entries. '''
+
+        keys, lock = [], threading.Lock()
+        puts, count = inmemory._metadata['ops']['put'], inmemory._metadata['kinds'].get('InMemoryModel', {}).get(
+            'entity_count', 0)
+
+        def write(n):
+            written = [InMemoryModel(string="concurrent", integer=[n]).put() for x in xrange(25)]
+            with lock:
+                keys.extend(written)
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set((key.id for key in keys))), 200)
+        self.assertEqual(inmemory._metadata['ops']['put'], puts + 200)
+        self.assertEqual(len(inmemory._metadata['__index__'][(('InMemoryModel', 'string'), "concurrent")]), 200)
+        self.assertEqual(model.Key.delete_multi(keys), [True] * 200)
+        self.assertEqual(inmemory._metadata['kinds']['InMemoryModel']['entity_count'], count)
+
+    def test_allocation_lock_order(self):
+
+        ''' Test that IDs can be reserved while a write holds the kind's stripe, since writes take the allocator's
+            lock inside it. '''
+
+        adapter, kind, ids = InMemoryModel.__adapter__, InMemoryModel.kind(), []
+        adapter.allocator.blocks.pop(kind, None)  # force a block reservation
+
+        thread = threading.Thread(target=lambda: ids.extend(adapter.allocator.allocate(model.Key, kind)))
+        with adapter._locked((kind,)):
+            thread.start()
+            thread.join(5)
+            allocated = list(ids)
+        thread.join()
+
+        self.assertEqual(len(allocated), 1)
@@ -5,7 +5,12 @@
     apptools model tests: `apptools.model.adapter.redis`
 
     this package contains test cases for the `RedisAdapter`
-    model adapter class.
+    model adapter class. they run against a scratch server
+    given as ``<host>:<port>`` in ``APPTOOLS_TEST_REDIS``,
+    whose databases 13 to 15 are flushed as they go, and
+    are skipped if it isn't set. tests of read-only replicas
+    also need one of that server, given the same way in
+    ``APPTOOLS_TEST_REDIS_REPLICA``.
 
     :author: Sam Gammon <sam@momentum.io>
     :copyright: (c) momentum labs, 2013
@@ -20,12 +25,599 @@
 '''
 
 
+# stdlib
+import os
+
 # apptools test
 from apptools.tests import AppToolsTest
 
+# apptools model API
+from apptools import model
+from apptools.model import query
+from apptools.model.adapter import redis
+
+
+## Globals
+_SERVER = os.environ.get('APPTOOLS_TEST_REDIS')  # `<host>:<port>` of a scratch Redis server, if any
+_REPLICA = os.environ.get('APPTOOLS_TEST_REDIS_REPLICA')  # `<host>:<port>` of a read-only replica of it, if any
+_DATABASES = {'default': 13, 'replica': 14, 'shard': 15}  # scratch databases, by server profile
+_STATE = ('_server_profiles', '_client_connections', '_connection_pools', '_profiles_by_model', '_shards_by_model',
+          '_modes_by_model', '_consistency_by_model', '_replica_sets', '_last_writes')  # module state tests swap out
+_MODES = (redis.RedisMode.toplevel_blob, redis.RedisMode.hashkind_blob,
+          redis.RedisMode.hashkey_blob, redis.RedisMode.hashkey_hash)
+
 
 ## RedisAdapterTests
-# Tests builtin core model adapters (JSON/dict/msgpack).
+# Tests the `RedisAdapter` against a live server.
 class RedisAdapterTests(AppToolsTest):
 
-    ''' Tests `model.adapter.core`. '''
+    ''' Tests `model.adapter.redis`. '''
+
+    def setUp(self):
+
+        ''' Point the adapter at empty scratch databases, or skip if there's no server to test against. '''
+
+        super(RedisAdapterTests, self).setUp()
+        if not (_SERVER and redis.RedisAdapter.is_supported()):
+            return self.skipTest("No Redis server configured (set `APPTOOLS_TEST_REDIS` to `<host>:<port>`).")
+
+        host, port = _SERVER.rsplit(':', 1)
+        self.state = dict((name, getattr(redis, name)) for name in _STATE + ('_default_profile',))
+        for name in _STATE:
+            setattr(redis, name, {})
+
+        redis._default_profile = 'default'
+        redis._server_profiles.update(((profile, {'host': host, 'port': int(port), 'db': db})
+                                       for profile, db in _DATABASES.items()))
+        for profile in _DATABASES:
+            redis.RedisAdapter.client(profile).flushdb()
+        redis.RedisAdapter.allocator.blocks.clear()
+
+    def tearDown(self):
+
+        ''' Restore the adapter's server profiles and connections. '''
+
+        for name, value in getattr(self, 'state', {}).items():
+            setattr(redis, name, value)
+        super(RedisAdapterTests, self).tearDown()
+
+    def model(self, _kind, **properties):
+
+        ''' Build a model class stored in Redis.
+
+            :param _kind: Model class (kind) name.
+            :param properties: Model properties and options.
+            :returns: :py:class:`model.Model` subclass. '''
+
+        properties['__adapter__'] = redis.RedisAdapter
+        return type(model.Model)(_kind, (model.Model,), properties)
+
+    def replicate(self):
+
+        ''' Route eventually-consistent reads of the default profile to a read-only replica of the scratch server, once
+            it has caught up with every write so far - or skip, if there's no replica to test against.
+
+            :returns: The replica's :py:class:`redis.ConnectionPool`. '''
+
+        if not _REPLICA:
+            return self.skipTest("No Redis replica configured (set `APPTOOLS_TEST_REDIS_REPLICA` to `<host>:<port>`).")
+
+        host, port = _REPLICA.rsplit(':', 1)
+        redis._server_profiles['default']['replicas'] = [{'host': host, 'port': int(port), 'db': _DATABASES['default']}]
+        redis._replica_sets.clear()
+        redis._last_writes.clear()
+        redis.RedisAdapter.client('default').execute_command('WAIT', 1, 5000)
+        redis.RedisAdapter.replicas('default')
+        return redis.RedisAdapter.pool('default::replica::0')
+
+    def data(self, profile='default'):
+
+        ''' Shortcut to the sorted names of every Redis key in a server profile's database (except ID counters). '''
+
+        client = redis.RedisAdapter.client(profile)
+        return sorted((name for name in client.keys('*') if not name.startswith('__meta__')))
+
+    def test_pipelined_writes(self):
+
+        ''' Test that a batch of entities and their indexes is written in one round-trip. '''
+
+        Pipelined = self.model('Pipelined', name=basestring, tags=(basestring, {'repeated': True}))
+        named = model.Key('Pipelined', 'named')
+        Pipelined(name="warm").put()  # reserves a block of IDs
+
+        checkouts = redis.RedisAdapter.pool().stats()['checkouts']
+        keys = Pipelined.put_multi([Pipelined(name="one", tags=["a", "b"]), Pipelined(key=named, name="two")])
+        self.assertEqual(redis.RedisAdapter.pool().stats()['checkouts'], checkouts + 1)
+
+        self.assertEqual(keys[1], named)
+        entities = Pipelined.get_multi(keys + [model.Key('Pipelined', 'missing')])
+        self.assertEqual([entity and entity.name for entity in entities], ["one", "two", None])
+        self.assertEqual([entity.name for entity in Pipelined.query().filter(Pipelined.tags == "b").fetch()], ["one"])
+
+    def test_storage_modes(self):
+
+        ''' Test entities (and entity groups) round-trip through every storage mode. '''
+
+        for mode in _MODES:
+            Stored = self.model('Stored', __redis_mode__=mode, name=basestring, n=int)
+            parent = Stored(name="parent", n=1).put()
+            child = Stored(key=model.Key('Stored', 'child', parent=parent), name="child").put()
+
+            self.assertEqual([entity and (entity.name, entity.n) for entity in
+                              Stored.get_multi([parent, child, model.Key('Stored', 'missing')])],
+                             [("parent", 1), ("child", None), None])
+
+            child.delete()
+            self.assertEqual(Stored.get(child), None)
+            parent.delete()
+            self.assertEqual(self.data(), [])
+
+    def test_migrate(self):
+
+        ''' Test that entities are migrated between storage modes, and that migrations can be re-run. '''
+
+        Migrated = self.model('Migrated', name=basestring)
+        keys = Migrated.put_multi([Migrated(name=str(i)) for i in xrange(7)])
+
+        for source, target in zip(_MODES, _MODES[1:] + _MODES[:1]):
+            self.assertEqual(redis.RedisAdapter.migrate(Migrated, source, target, batch_size=3), 7)
+            self.assertEqual(redis.RedisAdapter.migrate(Migrated, source, target, batch_size=3), 0)
+            self.assertEqual([entity.name for entity in Migrated.get_multi(keys)], [str(i) for i in xrange(7)])
+
+    def test_kind_index(self):
+
+        ''' Test that unfiltered queries page through the kind index, in key ID order. '''
+
+        Indexed = self.model('Indexed', name=basestring)
+        keys = Indexed.put_multi([Indexed(name="e%s" % i) for i in xrange(12)])
+        keys.insert(0, Indexed(key=model.Key('Indexed', 'child', parent=keys[0]), name="child").put())
+        encoded = [redis.RedisAdapter.encode_key(*key.flatten(True)) for key in keys]
+
+        # named keys share a score of `0`, so they come first
+        self.assertEqual(redis.RedisAdapter.client('default').type(redis.RedisAdapter.kind_index('Indexed')), 'zset')
+        self.assertEqual(redis.RedisAdapter.scan_kind('Indexed', 2, 3), encoded[2:5])
+        self.assertEqual([entity.name for entity in Indexed.query().fetch(limit=2, offset=11)], ["e10", "e11"])
+        self.assertEqual([key.id for key in Indexed.query().fetch(ancestor=keys[1], keys_only=True)], ['child'])
+        self.assertEqual(sum((len(batch) for batch in redis.RedisAdapter._iter_kind('Indexed', 5))), 13)
+
+        # kind indexes written as plain sets are still walked, without `KEYS`
+        redis.RedisAdapter.client('default').delete(redis.RedisAdapter.kind_index('Indexed'))
+        redis.RedisAdapter.client('default').sadd(redis.RedisAdapter.kind_index('Indexed'), *encoded[:4])
+        self.assertEqual(len(Indexed.query().fetch(limit=3)), 3)
+        self.assertEqual(sorted(redis.RedisAdapter.scan_kind('Indexed')), sorted(encoded[:4]))
+
+    def test_queries(self):
+
+        ''' Test filtered, sorted and keys-only queries, run server-side in cached scripts. '''
+
+        for mode in _MODES:
+            Queried = self.model('Queried', __redis_mode__=mode, name=basestring, color=basestring, n=int, f=float)
+            keys = Queried.put_multi([Queried(name="e%s" % i, color=("red" if i % 2 else "blue"), n=i, f=(i / 2.0))
+                                      for i in xrange(10)])
+            Queried(key=model.Key('Queried', 'child', parent=keys[0]), name="child", color="red", n=100).put()
+
+            names = lambda q, **options: [entity.name for entity in q.fetch(**options)]
+            self.assertEqual(names(Queried.query().filter(Queried.color == "red"), limit=3), ["child", "e1", "e3"])
+            self.assertEqual(names(Queried.query().filter(Queried.color == "red").filter(Queried.n >= 3)
+                                   .filter(Queried.n < 9)), ["e3", "e5", "e7"])
+            self.assertEqual(names(Queried.query().filter(Queried.color == "blue").sort(-Queried.n), limit=2),
+                             ["e8", "e6"])
+            self.assertEqual(names(Queried.query().filter(Queried.f <= 1.0).sort(-Queried.n)), ["e2", "e1", "e0"])
+            self.assertEqual(names(Queried.query().filter(Queried.color == "red"), ancestor=keys[0]), ["child"])
+            self.assertEqual(names(Queried.query().filter(Queried.color == "green")), [])
+            self.assertEqual([key.urlsafe() for key in Queried.query().filter(Queried.n == 5).fetch(keys_only=True)],
+                             [keys[5].urlsafe()])
+
+            # one script per query shape, whatever the values
+            scripts = len(redis._scripts)
+            self.assertEqual(names(Queried.query().filter(Queried.color == "blue"), limit=3), ["e0", "e2", "e4"])
+            self.assertEqual(len(redis._scripts), scripts)
+            redis.RedisAdapter.client('default').flushdb()
+
+    def test_index_cleanup(self):
+
+        ''' Test that overwrites and deletes remove stale index entries, via reverse indexes. '''
+
+        for mode in (redis.RedisMode.toplevel_blob, redis.RedisMode.hashkey_hash):
+            Cleaned = self.model('Cleaned', __redis_mode__=mode, name=basestring, n=int)
+            key = Cleaned(name="before", n=1).put()
+            child = Cleaned(key=model.Key('Cleaned', 'child', parent=key), name="child").put()
+
+            Cleaned(key=model.Key('Cleaned', key.id), name="after", n=5).put()
+            self.assertEqual(Cleaned.query().filter(Cleaned.name == "before").fetch(), [])
+            self.assertEqual(Cleaned.query().filter(Cleaned.n == 1).fetch(), [])
+            self.assertEqual([entity.name for entity in Cleaned.query().filter(Cleaned.n == 5).fetch()], ["after"])
+
+            Cleaned.delete_multi([child, key])
+            self.assertEqual(self.data(), [])
+
+        # entities written before reverse indexes were kept are still cleaned up
+        key = Cleaned(name="legacy").put()
+        redis.RedisAdapter.client('default').delete(redis.RedisAdapter.reverse_index(
+            redis.RedisAdapter.encode_key(*key.flatten(True))))
+        key.delete()
+        self.assertEqual(Cleaned.query().fetch(), [])
+
+    def test_connection_pools(self):
+
+        ''' Test that profiles share blocking connection pools, which time out when exhausted. '''
+
+        redis._server_profiles['alias'] = 'default'
+        redis._server_profiles['small'] = dict(redis._server_profiles['default'], pool={
+            'max_connections': 1, 'timeout': 0.1, 'health_check': 0.1})
+
+        pool = redis.RedisAdapter.pool('alias')
+        self.assertTrue(pool is redis.RedisAdapter.pool())
+        self.assertTrue(redis.RedisAdapter.client('alias').ping())
+
+        small = redis.RedisAdapter.pool('small')
+        connection = small.get_connection('GET')
+        self.assertRaises(redis.redis.ConnectionError, small.get_connection, 'GET')
+        small.release(connection)
+        connection._released -= 1  # idle for long enough to be checked on checkout
+        small.release(small.get_connection('GET'))
+
+        stats = redis.RedisAdapter.pool_stats()['small']
+        self.assertEqual((stats['max'], stats['created'], stats['timeouts'], stats['pings']), (1, 1, 1, 1))
+        self.assertEqual((stats['checkouts'], stats['idle'], stats['in_use']), (2, 1, 0))
+
+    def test_replica_reads(self):
+
+        ''' Test that reads go to replicas (or stay on the primary) by consistency level. '''
+
+        # the replica's database isn't actually replicated, so reads served by it come back empty
+        redis._server_profiles['default']['replicas'] = ['replica']
+        Replicated = self.model('Replicated', name=basestring)
+        Strong = self.model('Strong', __redis_consistency__=redis.RedisConsistency.strong, name=basestring)
+        key, strong = Replicated(name="primary").put(), Strong(name="primary").put()
+
+        self.assertEqual(Replicated.get(key), None)
+        self.assertEqual(Replicated.query().fetch(), [])
+        self.assertEqual(Replicated.get(key, consistency=redis.RedisConsistency.strong).name, "primary")
+        self.assertEqual(len(Replicated.query().fetch(consistency=redis.RedisConsistency.strong)), 1)
+        self.assertEqual(Strong.get(strong).name, "primary")
+
+        # session reads stay on the primary for a while after this process writes to it
+        self.assertEqual(Replicated.get(key, consistency=redis.RedisConsistency.session).name, "primary")
+        redis._last_writes.clear()
+        self.assertEqual(Replicated.get(key, consistency=redis.RedisConsistency.session), None)
+
+        self.assertRaises(ValueError, self.model, 'Invalid', __redis_consistency__='sometimes')
+
+    def test_lexical_indexes(self):
+
+        ''' Test sorts and range filters over string properties, via lexicographic indexes. '''
+
+        Lexical = self.model('Lexical', name=basestring, n=int)
+        names = [u"delta", u"Alpha", u"charlie", u"bravo", u"echo", u"bravo", u"\xe9clair", u"b"]
+        keys = Lexical.put_multi([Lexical(name=name, n=i) for i, name in enumerate(names)])
+        ordered = sorted(names, key=lambda name: name.encode('utf-8'))
+
+        fetch = lambda q, **options: [entity.name for entity in q.fetch(**options)]
+        self.assertEqual(fetch(Lexical.query().sort(+Lexical.name)), ordered)
+        self.assertEqual(fetch(Lexical.query().sort(-Lexical.name), limit=2), ordered[::-1][:2])
+        self.assertEqual(fetch(Lexical.query().filter(Lexical.name >= u"b").filter(Lexical.name < u"d")
+                               .sort(+Lexical.name)), [u"b", u"bravo", u"bravo", u"charlie"])
+        self.assertEqual([(entity.name, entity.n) for entity in Lexical.query().sort(+Lexical.name).sort(-Lexical.n)
+                          .fetch(offset=2, limit=2)], [(u"bravo", 5), (u"bravo", 3)])
+
+        # updates and deletes keep the index clean
+        entity = Lexical.get(keys[0])
+        entity.name = u"aardvark"
+        entity.put()
+        keys[1].delete()
+        self.assertEqual(fetch(Lexical.query().sort(+Lexical.name), limit=2), [u"aardvark", u"b"])
+        self.assertEqual(redis.RedisAdapter.client('default').zcard('__lex__::Lexical::name'), len(names) - 1)
+
+    def test_in_and_not_equal(self):
+
+        ''' Test `IN` and `!=` filters, which are run over temporary sets. '''
+
+        Matched = self.model('Matched', color=basestring, n=int, tags=(basestring, {'repeated': True}))
+        colors = ["red", "blue", "green", "red", None, "blue"]
+        for i, color in enumerate(colors):
+            entity = Matched(n=(i % 3), tags=["t%s" % (i % 2), "all"])
+            if color:
+                entity.color = color
+            entity.put()
+
+        fetch = lambda *filters: sorted((entity.n for entity in reduce(
+            lambda q, f: q.filter(f), filters, Matched.query()).fetch()))
+        self.assertEqual(fetch(Matched.color.IN(["red", "green"])), [0, 0, 2])
+        self.assertEqual(fetch(Matched.tags.IN(["t1"])), [0, 1, 2])
+        self.assertEqual(fetch(Matched.color.IN([])), [])
+        self.assertEqual(fetch(Matched.color != "red"), [1, 2, 2])
+        self.assertEqual(fetch(Matched.color != "red", Matched.n.IN([1, 2])), [1, 2, 2])
+
+        client = redis.RedisAdapter.client('default')
+        temps = client.keys('__temp__*')
+        self.assertTrue(temps)
+        self.assertTrue(all((0 < client.ttl(temp) <= redis.RedisAdapter.EngineConfig.temp_ttl for temp in temps)))
+
+    def test_query_planner(self):
+
+        ''' Test that queries are driven by their most selective index, unless hinted otherwise. '''
+
+        Planned = self.model('Planned', color=basestring, rare=bool, n=int)
+        Planned.put_multi([Planned(color=("red", "blue")[i % 2], rare=(i == 8), n=i) for i in xrange(40)])
+
+        q = Planned.query().filter(Planned.color == "red").filter(Planned.rare == True).filter(Planned.n >= 0)
+        plan = q.explain()
+        self.assertEqual(plan.driver, ('intersect', None))
+        self.assertEqual((plan.estimates['sets'], plan.estimates['ranges']), ([20, 1], [40]))
+        self.assertEqual(plan.cost, min(plan.costs.values()))
+
+        # a narrow range beats a broad set, and hints (or earlier plans) override the planner
+        narrow = Planned.query().filter(Planned.color == "red").filter(Planned.n >= 38)
+        self.assertEqual(narrow.explain().driver, ('range', 0))
+        hinted = Planned.query().filter(Planned.color == "red").filter(Planned.n >= 38).hint(Planned.color)
+        self.assertEqual(hinted.explain().driver, ('set', 0))
+        self.assertEqual(Planned.query().hint(query.KEY_KIND).explain().driver, ('kind', None))
+
+        self.assertEqual([entity.n for entity in q.fetch()], [8])
+        self.assertEqual([entity.n for entity in hinted.fetch()], [38])
+        self.assertEqual([entity.n for entity in narrow.fetch(plan=hinted.explain())], [38])
+        self.assertRaises(ValueError, Planned.query().filter(Planned.color == "red").hint(Planned.n).fetch)
+
+    def test_index_walks(self):
+
+        ''' Test that queries sorted by one property walk its index in order, stopping once the page is full. '''
+
+        Walked = self.model('Walked', color=basestring, name=basestring, n=int)
+        keys = Walked.put_multi([Walked(color=("red", "blue")[i % 2], name="e%02d" % (i % 9), n=(i % 7))
+                                 for i in xrange(300)])
+
+        encoded = lambda key: redis.RedisAdapter.encode_key(*key.flatten(True))
+        entities = sorted(Walked.get_multi(keys), key=lambda entity: encoded(entity.key))
+        expected = lambda match, value, reverse=False: [encoded(entity.key) for entity in sorted(
+            (entity for entity in entities if match(entity)), key=value, reverse=reverse)]
+        fetch = lambda q, **options: [encoded(entity.key) for entity in q.fetch(**options)]
+
+        # ties break by key, in either direction
+        red = Walked.query().filter(Walked.color == "red").sort(-Walked.n)
+        self.assertEqual(red.explain(limit=5).driver, ('sort', None))
+        reds = expected(lambda entity: entity.color == "red", lambda entity: -entity.n)
+        self.assertEqual(fetch(red, limit=5), reds[:5])
+        self.assertEqual(fetch(red, offset=40, limit=10), reds[40:50])
+        self.assertEqual(fetch(red), reds)
+
+        # a range over the sorted property bounds the walk
+        bounded = Walked.query().filter(Walked.n >= 2).filter(Walked.n < 5).sort(+Walked.n)
+        self.assertEqual(bounded.explain().driver, ('sort', 0))
+        self.assertEqual(fetch(bounded, offset=100, limit=20), expected(lambda entity: 2 <= entity.n < 5,
+                                                                          lambda entity: entity.n)[100:120])
+
+        # lexicographic indexes, with lexicographic ranges checked per entry
+        named = Walked.query().filter(Walked.n == 3).filter(Walked.name > "e05").sort(-Walked.name)
+        self.assertTrue(('sort', 1) in named.explain(limit=3).costs)
+        self.assertEqual(fetch(named, limit=3, plan=redis.QueryPlan(('sort', 1), None, None)), expected(
+            lambda entity: entity.n == 3 and entity.name > "e05", lambda entity: entity.name, True)[:3])
+
+        # unsorted queries walk the kind index, in the order of a full fetch
+        self.assertEqual(Walked.query().filter(Walked.color == "blue").explain(limit=2).driver, ('kind', None))
+        self.assertEqual(fetch(Walked.query().filter(Walked.color == "blue"), limit=2),
+                         fetch(Walked.query().filter(Walked.color == "blue"))[:2])
+
+    def test_cursor_seeks(self):
+
+        ''' Test that cursors resume sorted queries just past their position, even once that entity has changed. '''
+
+        Paged = self.model('Paged', name=basestring, n=int)
+        Paged.put_multi([Paged(name="e%02d" % (i % 6), n=(i % 5)) for i in xrange(40)])
+        encoded = lambda key: redis.RedisAdapter.encode_key(*key.flatten(True))
+
+        def pages(q, size, cursor=None):
+            results, more = [], True
+            while more:
+                page, cursor, more = q.fetch_page(size, cursor=cursor)
+                results.extend((encoded(entity.key) for entity in page))
+            return results
+
+        for q in (Paged.query().sort(-Paged.n), Paged.query().sort(+Paged.name),
+                  Paged.query().filter(Paged.n >= 2).sort(-Paged.name), Paged.query().filter(Paged.n < 3),
+                  Paged.query().sort(+Paged.n).sort(-Paged.name)):
+            self.assertEqual(pages(q, 3), [encoded(entity.key) for entity in q.fetch()])
+
+        # seeks go by the cursor's value and key, wherever its entity has since moved (or gone)
+        page, cursor, more = Paged.query().sort(+Paged.n).fetch_page(10)
+        position = (page[-1].n, encoded(page[-1].key))
+        page[-1].n = 4
+        page[-1].put()
+        page[-2].delete()
+        self.assertEqual(pages(Paged.query().sort(+Paged.n), 7, cursor), [
+            key for n, key in sorted(((entity.n, encoded(entity.key)) for entity in Paged.query().fetch()))
+            if (n, key) > position])
+
+    def test_count_and_aggregates(self):
+
+        ''' Test `count`, `sum`, `min`, `max` and `avg`, answered from indexes. '''
+
+        Tallied = self.model('Tallied', color=basestring, n=int, f=float)
+        keys = Tallied.put_multi([Tallied(color=("red", "blue", "green")[i % 3], n=i, f=(i / 4.0)) for i in xrange(12)])
+        Tallied(key=model.Key('Tallied', 'child', parent=keys[0]), color="red", n=100, f=0.5).put()
+
+        red = lambda: Tallied.query().filter(Tallied.color == "red")
+        self.assertEqual((Tallied.query().count(), red().count(), red().count(limit=2), red().count(offset=4)),
+                         (13, 5, 2, 1))
+        self.assertEqual(Tallied.query().filter(Tallied.n > 3).filter(Tallied.n <= 9).count(), 6)
+        self.assertEqual(Tallied.query().filter(Tallied.color != "red").count(), 8)
+        self.assertEqual((red().sum(Tallied.n), red().min(Tallied.n), red().max(Tallied.n)), (118, 0, 100))
+        self.assertEqual(Tallied.query().avg(Tallied.f), sum((i / 4.0 for i in xrange(12)), 0.5) / 13)
+        self.assertEqual(type(Tallied.query().sum(Tallied.n)), int)
+        self.assertEqual(Tallied.query().filter(Tallied.color == "purple").max(Tallied.n), None)
+        self.assertEqual((red().count(ancestor=keys[0]), Tallied.query().sum('n', ancestor=keys[0])), (1, 100))
+
+    def test_incremental_indexes(self):
+
+        ''' Test that re-puts update changed index entries, even when two copies of an entity race. '''
+
+        Updated = self.model('Updated', name=basestring, n=int, tags=(basestring, {'repeated': True}))
+        key = Updated(name="a", n=1, tags=["x", "y"]).put()
+
+        entity = Updated.get(key)
+        entity.n, entity.tags = 2, ["y", "z"]
+        entity.put()
+        self.assertEqual([e.n for e in Updated.query().filter(Updated.tags == "z").filter(Updated.n == 2).fetch()], [2])
+        self.assertEqual(Updated.query().filter(Updated.tags == "x").fetch(), [])
+
+        # both copies change `name` - the second must also drop what the first wrote
+        first, second = Updated.get(key), Updated.get(key)
+        first.name, second.name = "b", "c"
+        first.put()
+        second.put()
+
+        names = lambda q: [entity.name for entity in q.fetch()]
+        self.assertEqual(names(Updated.query().filter(Updated.name == "b")), [])
+        self.assertEqual(names(Updated.query().filter(Updated.name >= "b")), ["c"])
+        self.assertEqual(names(Updated.query().filter(Updated.name == "c")), ["c"])
+
+        key.delete()
+        self.assertEqual(self.data(), [])
+
+    def test_sharding(self):
+
+        ''' Test that sharded kinds keep entity groups together, and merge query results in single-server order. '''
+
+        Sharded = self.model('Sharded', __redis__=('default', 'shard'), name=basestring, n=int)
+        keys = Sharded.put_multi([Sharded(name="e%02d" % i, n=(i % 4)) for i in xrange(16)])
+        keys += Sharded.put_multi([Sharded(key=model.Key('Sharded', id), name=str(id), n=1)
+                                   for id in (-3, "512", "zed")])
+        keys += [Sharded(key=model.Key('Sharded', 'child', parent=keys[0]), name="child", n=2).put()]
+
+        encoded = lambda key: redis.RedisAdapter.encode_key(*key.flatten(True))
+        shards = [frozenset(redis.RedisAdapter.client(profile).zrange('__kind__::Sharded', 0, -1))
+                  for profile in ('default', 'shard')]
+        self.assertTrue(all(shards) and sum(map(len, shards)) == len(keys))
+        self.assertEqual(len([shard for shard in shards if set((encoded(keys[0]), encoded(keys[-1]))) <= shard]), 1)
+
+        # unsorted results come back in kind index order: named keys (even numeric ones) score `0`
+        scores = [id if isinstance(id, (int, long)) else 0 for id in (key.id for key in keys)]
+        ordered = [key for score, key in sorted(zip(scores, map(encoded, keys)))]
+        fetch = lambda q, **options: [encoded(result if isinstance(result, model.Key) else result.key)
+                                      for result in q.fetch(**options)]
+        self.assertEqual(fetch(Sharded.query()), ordered)
+        self.assertEqual(fetch(Sharded.query(), limit=4, offset=3, keys_only=True), ordered[3:7])
+        self.assertEqual(fetch(Sharded.query().filter(Sharded.n == 1)),
+                         [key for key in ordered if Sharded.get(key).n == 1])
+        self.assertEqual(redis.RedisAdapter.scan_kind('Sharded', 2, 5), ordered[2:7])
+
+        seen, cursor, more = [], None, True
+        while more:
+            page, cursor, more = Sharded.query().fetch_page(3, cursor=cursor)
+            seen.extend((encoded(entity.key) for entity in page))
+        self.assertEqual(seen, ordered)
+
+        # sorted results come back by sort value, ties broken by encoded key
+        entities = Sharded.get_multi(keys)
+        by_n = [encoded(entity.key) for entity in sorted(sorted(entities, key=lambda entity: encoded(entity.key)),
+                                                         key=lambda entity: entity.n, reverse=True)]
+        self.assertEqual(fetch(Sharded.query().sort(-Sharded.n)), by_n)
+        self.assertEqual(fetch(Sharded.query().sort(-Sharded.n), limit=5, offset=4), by_n[4:9])
+        self.assertEqual([entity.name for entity in Sharded.query().sort(+Sharded.name).fetch()],
+                         sorted((entity.name for entity in entities)))
+
+    def test_read_only_replicas(self):
+
+        ''' Test that reads served by read-only replicas never write to them. '''
+
+        ReadOnly = self.model('ReadOnly', color=basestring, name=basestring, n=int)
+        keys = ReadOnly.put_multi([ReadOnly(color=("red", "blue", "green")[i % 3], name="e%02d" % i, n=i)
+                                   for i in xrange(9)])
+        pool = self.replicate()
+        checkouts = redis.RedisAdapter.pool_stats()['default::replica::0']['checkouts']
+
+        # gets, filtered and sorted queries, pages and aggregates read from the replica
+        self.assertEqual(ReadOnly.get(keys[4]).name, "e04")
+        self.assertEqual([entity.n for entity in ReadOnly.get_multi(keys[:3])], [0, 1, 2])
+        self.assertEqual([entity.n for entity in ReadOnly.query().filter(ReadOnly.color == "red").filter(
+            ReadOnly.n >= 3).sort(-ReadOnly.n).fetch()], [6, 3])
+        self.assertEqual([entity.name for entity in ReadOnly.query().filter(ReadOnly.name > "e05").sort(
+            +ReadOnly.name).fetch(limit=2)], ["e06", "e07"])
+        page, cursor, more = ReadOnly.query().sort(+ReadOnly.n).fetch_page(4)
+        page, cursor, more = ReadOnly.query().sort(+ReadOnly.n).fetch_page(4, cursor=cursor)
+        self.assertEqual(([entity.n for entity in page], more), ([4, 5, 6, 7], True))
+        self.assertEqual((ReadOnly.query().filter(ReadOnly.color == "blue").sum(ReadOnly.n),
+                          ReadOnly.query().max(ReadOnly.n)), (12, 8))
+        self.assertTrue(redis.RedisAdapter.pool_stats()['default::replica::0']['checkouts'] >= checkouts + 8)
+        self.assertTrue(pool is redis.RedisAdapter.pool('default::replica::0'))
+
+        # `IN` and `!=` filters build temporary sets, so they run on the primary
+        fetch = lambda q: sorted((entity.n for entity in q.fetch()))
+        self.assertEqual(fetch(ReadOnly.query().filter(ReadOnly.color.IN(["red", "green"]))), [0, 2, 3, 5, 6, 8])
+        self.assertEqual(fetch(ReadOnly.query().filter(ReadOnly.n != 4)), [0, 1, 2, 3, 5, 6, 7, 8])
+        self.assertEqual(fetch(ReadOnly.query().filter(ReadOnly.color != "red")), [1, 2, 4, 5, 7, 8])
+        self.assertEqual(ReadOnly.query().filter(ReadOnly.color.IN(["blue"])).explain().estimates['sets'], [3])
+
+        # counts read the replica's indexes, tallying in a query script rather than caching intersections there
+        self.assertEqual(ReadOnly.query().filter(ReadOnly.color == "red").count(), 3)
+        self.assertEqual(ReadOnly.query().filter(ReadOnly.color == "red").filter(ReadOnly.n == 3).count(), 1)
+        self.assertEqual(ReadOnly.query().filter(ReadOnly.color != "red").count(), 6)
+        self.assertEqual(ReadOnly.query().filter(ReadOnly.color.IN(["red", "blue"])).count(), 6)
+
+
+## ReplicaSetTests
+# Tests picking and probing read replicas, without a server.
+class ReplicaSetTests(AppToolsTest):
+
+    ''' Tests `model.adapter.redis.ReplicaSet`. '''
+
+    class Replica(object):
+
+        ''' Stand-in for a replica's ``Redis`` client, counting ``PING``s. '''
+
+        def __init__(self, up=True):
+
+            ''' Initialize this ``Replica``. '''
+
+            self.up, self.pings = up, 0
+
+        def ping(self):
+
+            ''' Answer a ``PING``, or fail to connect if this replica is down. '''
+
+            self.pings += 1
+            if not self.up:
+                raise redis._redis_client.ConnectionError("replica down")
+            return True
+
+    def setUp(self):
+
+        ''' Skip if the Redis client library isn't installed. '''
+
+        super(ReplicaSetTests, self).setUp()
+        if not redis._REDIS:
+            return self.skipTest("The Redis client library isn't installed.")
+
+    def test_probe_one_per_pick(self):
+
+        ''' Test that each pick probes at most one replica - the one probed longest ago - once probes are due. '''
+
+        replicas = [self.Replica(), self.Replica(up=False), self.Replica()]
+        replica_set = redis.ReplicaSet(replicas, probe_interval=0)
+        replica_set.probed = [3.0, 1.0, 2.0]
+
+        picked = replica_set.pick()
+        self.assertEqual([replica.pings for replica in replicas], [0, 1, 0])
+        self.assertEqual(replica_set.latencies[1], None)
+        self.assertTrue(picked is not replicas[1])
+
+        replica_set.pick()
+        replica_set.pick()
+        self.assertEqual([replica.pings for replica in replicas], [1, 1, 1])
+
+        # down replicas stay out of rotation until they answer a probe again
+        self.assertEqual(set(map(id, (replica_set.pick() for turn in xrange(4)))), set(map(id, replicas[::2])))
+        replicas[1].up = True
+        self.assertTrue(replica_set.probe(1) is not None)
+        self.assertTrue(replicas[1] in [replica_set.pick() for turn in xrange(3)])
+
+    def test_probe_interval(self):
+
+        ''' Test that picks don't probe replicas probed within the interval, and pick the fastest by latency. '''
+
+        replicas = [self.Replica(), self.Replica()]
+        replica_set = redis.ReplicaSet(replicas, redis.ReplicaSet.least_latency)
+        replica_set.latencies = [0.2, 0.1]
+        self.assertTrue(all((replica_set.pick() is replicas[1] for turn in xrange(5))))
+        self.assertEqual([replica.pings for replica in replicas], [0, 0])
+        self.assertRaises(ValueError, redis.ReplicaSet, replicas, 'random')
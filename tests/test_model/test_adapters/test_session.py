@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+    apptools model tests: `apptools.model.adapter.session`
+
+    tests the request-scoped identity map and
+    unit of work for the model API.
+
+    :author: Sam Gammon <sam@momentum.io>
+    :copyright: (c) momentum labs, 2013
+    :license: The inspection, use, distribution, modification or implementation
+              of this source code is governed by a private license - all rights
+              are reserved by the Authors (collectively, "momentum labs, ltd")
+              and held under relevant California and US Federal Copyright laws.
+              For full details, see ``LICENSE.md`` at the root of this project.
+              Continued inspection of this source code demands agreement with
+              the included license and explicitly means acceptance to these terms.
+
+'''
+
+
+# apptools test
+from apptools.tests import AppToolsTest
+
+# apptools model API
+from apptools import model
+from apptools.model.adapter import inmemory
+
+
+## SessionModel
+# Persisted via the builtin `InMemory` model adapter.
+class SessionModel(model.Model):
+
+    ''' Test model. '''
+
+    __adapter__ = inmemory.InMemoryAdapter
+
+    string = basestring
+    integer = int
+
+
+## SessionTests
+# Tests `model.Session`.
+class SessionTests(AppToolsTest):
+
+    ''' Tests `model.adapter.session`. '''
+
+    def ops(self, op):
+
+        ''' Shortcut to the number of entity operations of a type performed by storage. '''
+
+        return inmemory._metadata['ops'][op]
+
+    def test_identity_map(self):
+
+        ''' Test that repeated gets of a key return one instance. '''
+
+        key = SessionModel(string="identity").put()
+        missing = model.Key(SessionModel.kind(), "_____")
+
+        with model.Session():
+            gets = self.ops('get')
+            first, second = key.get(), SessionModel.get(key=key.urlsafe())
+            self.assertTrue(first is second)
+            self.assertEqual(model.Key.get_multi([missing, key]), [None, first])
+            self.assertEqual(missing.get(), None)
+            self.assertEqual(self.ops('get'), gets + 1)
+
+        self.assertFalse(key.get() is first)
+
+    def test_coalesced_writes(self):
+
+        ''' Test that writes are buffered, deduplicated and flushed in one batch. '''
+
+        puts = self.ops('put')
+        with model.Session():
+            entity = SessionModel(string="first")
+            key = entity.put()
+            self.assertTrue(key.id is not None)
+
+            entity.integer = 2
+            entity.put()
+            other = SessionModel(string="other")
+            SessionModel.put_multi([other, entity])
+
+            self.assertTrue(key.get() is entity)
+            self.assertEqual(self.ops('put'), puts)
+            other.string = "changed"  # the session flushes the live entity
+
+        self.assertEqual(self.ops('put'), puts + 2)
+        self.assertEqual((key.get().string, key.get().integer), ("first", 2))
+        self.assertEqual(other.key.get().string, "changed")
+
+    def test_buffered_deletes(self):
+
+        ''' Test that deletes are buffered, and cancel (or are cancelled by) writes. '''
+
+        keys = SessionModel.put_multi([SessionModel(string="one"), SessionModel(string="two")])
+
+        with model.Session():
+            self.assertEqual(keys[0].delete(), None)
+            self.assertEqual(keys[0].get(), None)
+
+            entity = keys[1].get()
+            entity.delete()
+            entity.put()  # re-put after delete: the write wins
+            self.assertTrue(keys[0].urlsafe() in inmemory._metadata['__key__'])
+
+        self.assertTrue(keys[0].urlsafe() not in inmemory._metadata['__key__'])
+        self.assertEqual(keys[1].get().string, "two")
+
+    def test_query_flush_and_discard(self):
+
+        ''' Test that queries see buffered writes, and that errors discard them. '''
+
+        with model.Session():
+            SessionModel(string="queried", integer=7).put()
+            self.assertEqual(SessionModel.query().filter(SessionModel.integer == 7).count(), 1)
+
+        def fail():
+            with model.Session():
+                SessionModel(string="discarded", integer=8).put()
+                raise RuntimeError()
+
+        self.assertRaises(RuntimeError, fail)
+        self.assertEqual(model.Session.current(), None)
+        self.assertEqual(SessionModel.query().filter(SessionModel.integer == 8).count(), 0)
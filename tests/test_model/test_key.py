@@ -435,3 +435,33 @@ class KeyTests(AppToolsTest):
         with self.assertRaises(AttributeError):
             k = PersistedKeyTest().put()
             k._set_internal("id", 25)
+
+    def test_key_memoized_forms(self):
+
+        ''' Test that flattened and encoded forms are memoized, and dropped when parts change. '''
+
+        k = model.Key("MemoKind")
+        self.assertEqual(k.flatten(), (None, "MemoKind", None))
+        encoded = k.urlsafe()
+
+        k.id = 5
+        self.assertEqual(k.flatten(), (None, "MemoKind", 5))
+        self.assertEqual(k.flatten(True)[0], u":MemoKind:5")
+        self.assertNotEqual(k.urlsafe(), encoded)
+        self.assertTrue(k.flatten(True) is k.flatten(True))
+
+    def test_key_interned_decodes(self):
+
+        ''' Test that persisted keys decoded from their URL-safe form are interned, but not shared. '''
+
+        encoded = model.Key("InternKind", "child", parent=model.Key("InternKind", "root")).urlsafe()
+        first = model.Key.from_urlsafe(encoded, _persisted=True)
+        second = model.Key.from_urlsafe(encoded, _persisted=True)
+
+        self.assertTrue(first is not second)
+        self.assertEqual(first, second)
+        self.assertTrue(first.__persisted__)
+        self.assertEqual((second.id, second.parent.id, second.urlsafe()), ("child", "root", encoded))
+
+        first._set_internal('owner', object())
+        self.assertEqual(second.owner, None)
@@ -766,3 +766,67 @@ class ModelTests(AppToolsTest):
 
         # try on the class level
         self.assertIsInstance(ClassDefaultSample.sample_default, model.Property)
+
+    def test_compact_model(self):
+
+        ''' Make sure compact models store values in slots, behind the same API. '''
+
+        ## CompactCar
+        # Holds its values in slots.
+        class CompactCar(Car):
+
+            ''' A compactly-stored automobile. '''
+
+            __compact__ = True
+            owner = basestring, {'default': 'nobody'}
+
+        self.assertEqual(CompactCar.__order__, ('color', 'make', 'model', 'owner', 'year'))
+        car = CompactCar(make='BMW', year=2010)
+        self.assertEqual((car.make, car.model, car.owner, car['year'], len(car)), ('BMW', None, 'nobody', 2010, 2))
+        self.assertEqual(car.__values__, [model.Property._sentinel, 'BMW', model.Property._sentinel,
+                                          model.Property._sentinel, 2010])
+        self.assertEqual(car.__data__['make'], ('BMW', True))
+        self.assertEqual(vars(car), {})  # no per-entity `__dict__` is built
+
+        # dirtiness is kept as a bitmask, in property order
+        self.assertEqual(car.__dirtied__, 0b10010)
+        car._set_persisted()
+        self.assertTrue(not car.__dirty__)
+        car.color = 'red'
+        self.assertEqual((car.__dirtied__, car.__previous__), (0b1, {'color': model.Property._sentinel}))
+
+        with car:
+            self.assertEqual(car.model, model.Property._sentinel)
+        with self.assertRaises(AttributeError):
+            car.nope
+
+        # storage round-trips, and subclasses stay compact
+        key = car.put()
+        self.assertEqual(key.get().to_dict(), car.to_dict())
+        self.assertTrue(CompactCar.__compact__ and type('Sub', (CompactCar,), {'trim': basestring}).__compact__)
+
+    def test_generated_routines(self):
+
+        ''' Make sure the validator and serializer generated for each model class match the generic ones. '''
+
+        for compact in (False, True):
+            sample = type(model.Model)('GeneratedSample%s' % compact, (model.Model,), {
+                '__compact__': compact, 'name': (basestring, {'required': True}), 'tags': (int, {'repeated': True}),
+                'active': (bool, {'default': True}), 'anything': None})
+
+            entity = sample(name='sample', tags=[1, 2])
+            self.assertTrue(sample.__validate__(entity))
+            for _all in (False, True):
+                self.assertEqual(entity.to_dict(_all=_all), entity.to_dict(_all=_all, filter=lambda x: True))
+            with entity:
+                self.assertEqual(entity.to_dict(), entity.to_dict(filter=lambda x: True))
+            self.assertEqual(entity.to_dict(), {'name': 'sample', 'tags': [1, 2], 'active': True})
+
+            for values, exception in (({'tags': [1]}, exceptions.PropertyRequired),
+                                      ({'name': 'x', 'tags': 5}, exceptions.PropertyRepeated),
+                                      ({'name': 'x', 'tags': None}, exceptions.PropertyRepeated),
+                                      ({'name': ['x']}, exceptions.PropertyNotRepeated),
+                                      ({'name': 5}, exceptions.InvalidPropertyValue),
+                                      ({'name': 'x', 'tags': ['one']}, exceptions.InvalidPropertyValue)):
+                with self.assertRaises(exception):
+                    sample.__validate__(sample(**values))
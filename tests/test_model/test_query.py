@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+    apptools model tests: `apptools.model.query`
+
+    tests the :py:class:`model.Query` API, executed
+    by the builtin in-memory model adapter.
+
+    :author: Sam Gammon <sam@momentum.io>
+    :copyright: (c) momentum labs, 2013
+    :license: The inspection, use, distribution, modification or implementation
+              of this source code is governed by a private license - all rights
+              are reserved by the Authors (collectively, "momentum labs, ltd")
+              and held under relevant California and US Federal Copyright laws.
+              For full details, see ``LICENSE.md`` at the root of this project.
+              Continued inspection of this source code demands agreement with
+              the included license and explicitly means acceptance to these terms.
+
+'''
+
+
+# stdlib
+import datetime
+
+# apptools test
+from apptools.tests import AppToolsTest
+
+# apptools model API
+from apptools import model
+from apptools.model import query
+from apptools.model.adapter import inmemory
+
+
+## QueryModel
+# Queried via the builtin `InMemory` model adapter.
+class QueryModel(model.Model):
+
+    ''' Test model. '''
+
+    __adapter__ = inmemory.InMemoryAdapter
+
+    name = basestring
+    color = basestring
+    number = int
+    day = datetime.date
+    tags = int, {'repeated': True}
+
+
+## QueryTests
+# Tests queries against the `InMemory` model adapter.
+class QueryTests(AppToolsTest):
+
+    ''' Tests `model.Query`. '''
+
+    def setUp(self):
+
+        ''' Replace stored `QueryModel` entities with a fresh fixture. '''
+
+        model.Key.delete_multi(QueryModel.query().fetch(keys_only=True))
+        self.keys = QueryModel.put_multi([
+            QueryModel(name="q%02d" % i, color=("red", "blue", "green")[i % 3], number=(i % 7),
+                       day=datetime.date(2013, 1, 1 + (i % 5)), tags=[i % 2, (i % 3) + 10]) for i in range(20)])
+
+    def names(self, results):
+
+        ''' Shortcut to the names of query results. '''
+
+        return [entity.name for entity in results]
+
+    def test_equality_filters(self):
+
+        ''' Test intersecting equality filters. '''
+
+        q = QueryModel.query().filter(QueryModel.color == "red")
+        self.assertEqual(self.names(q.fetch()), ["q00", "q03", "q06", "q09", "q12", "q15", "q18"])
+
+        q = QueryModel.query().filter(QueryModel.color == "red").filter(QueryModel.number == 5)
+        self.assertEqual(self.names(q.fetch()), ["q12"])
+        self.assertEqual(QueryModel.query().filter(QueryModel.color == "purple").fetch(), [])
+
+        # repeated properties match on any value
+        q = QueryModel.query().filter(QueryModel.tags == 12)
+        self.assertEqual(self.names(q.fetch()), ["q02", "q05", "q08", "q11", "q14", "q17"])
+
+        q = QueryModel.query().filter(QueryModel.color.IN(["red", "green"])).filter(QueryModel.number == 2)
+        self.assertEqual(self.names(q.fetch()), ["q02", "q09"])
+
+    def test_range_filters(self):
+
+        ''' Test range and inequality filters. '''
+
+        q = QueryModel.query().filter(QueryModel.number > 2).filter(QueryModel.number <= 3)
+        self.assertEqual(self.names(q.fetch()), ["q03", "q10", "q17"])
+
+        q = QueryModel.query().filter(QueryModel.day >= datetime.date(2013, 1, 5))
+        self.assertEqual(self.names(q.fetch()), ["q04", "q09", "q14", "q19"])
+
+        q = QueryModel.query().filter(QueryModel.name < "q03").filter(QueryModel.color != "red")
+        self.assertEqual(self.names(q.fetch()), ["q01", "q02"])
+
+    def test_sorts(self):
+
+        ''' Test sorting by one and several properties. '''
+
+        q = QueryModel.query().filter(QueryModel.color == "blue").sort(-QueryModel.name)
+        self.assertEqual(self.names(q.fetch(limit=3)), ["q19", "q16", "q13"])
+
+        q = QueryModel.query().sort(-QueryModel.number).sort(+QueryModel.name)
+        self.assertEqual(self.names(q.fetch(limit=4)), ["q06", "q13", "q05", "q12"])
+        self.assertEqual(self.names(q.fetch(limit=2, offset=3)), ["q12", "q19"])
+
+    def test_index_updates(self):
+
+        ''' Test that queries follow updated and deleted entities. '''
+
+        entity = self.keys[0].get()
+        entity.number = 100
+        entity.put()
+        self.keys[7].delete()
+
+        self.assertEqual(self.names(QueryModel.query().filter(QueryModel.number > 50).fetch()), ["q00"])
+        self.assertEqual(self.names(QueryModel.query().filter(QueryModel.number == 0).fetch()), ["q14"])
+        self.assertEqual(self.names(QueryModel.query().sort(-QueryModel.number).fetch(limit=1)), ["q00"])
+
+    def test_pages(self):
+
+        ''' Test paging through results with cursors. '''
+
+        for q in (QueryModel.query().sort(+QueryModel.name), QueryModel.query().filter(QueryModel.number < 4)):
+            expected, names, cursor, more = self.names(q.fetch()), [], None, True
+            while more:
+                results, cursor, more = q.fetch_page(3, cursor=(cursor and cursor.urlsafe()))
+                names.extend(self.names(results))
+            self.assertEqual(names, expected)
+            self.assertEqual(self.names(q.iter(batch_size=4)), expected)
+
+    def test_keys_projections_and_ancestors(self):
+
+        ''' Test keys-only, projection and ancestor queries. '''
+
+        keys = QueryModel.query().filter(QueryModel.color == "red").fetch(keys_only=True, limit=2)
+        self.assertEqual([key.urlsafe() for key in keys], [key.urlsafe() for key in self.keys[0:4:3]])
+
+        projected = QueryModel.query().filter(QueryModel.number == 3).fetch(projection=(QueryModel.name,))
+        self.assertEqual([entity.to_dict() for entity in projected],
+                         [{'name': "q03"}, {'name': "q10"}, {'name': "q17"}])
+        self.assertEqual(projected[0].__projection__, ('name',))
+
+        child = QueryModel(key=model.Key(QueryModel.kind(), "child", parent=self.keys[2]), name="child", number=3).put()
+        descendants = QueryModel.query().filter(QueryModel.number == 3).fetch(ancestor=self.keys[2], keys_only=True)
+        self.assertEqual([key.urlsafe() for key in descendants], [child.urlsafe()])
+
+    def test_count_and_aggregates(self):
+
+        ''' Test counting and aggregating query results. '''
+
+        self.assertEqual(QueryModel.query().count(), 20)
+        self.assertEqual(QueryModel.query().filter(QueryModel.color == "red").count(), 7)
+        self.assertEqual(QueryModel.query().filter(QueryModel.color == "red").count(limit=5), 5)
+
+        self.assertEqual(QueryModel.query().sum(QueryModel.number), 57)
+        self.assertEqual(QueryModel.query().filter(QueryModel.color == "red").avg('number'), 3.0)
+        self.assertEqual(QueryModel.query().max(QueryModel.number), 6)
+        self.assertEqual(QueryModel.query().filter(QueryModel.number > 100).min(QueryModel.number), None)
+
+        self.assertRaises(AttributeError, QueryModel.query().sum, 'missing')
+        self.assertRaises(ValueError, QueryModel.query().sum, QueryModel.name)
+
+    def test_hints(self):
+
+        ''' Test validation of query hints. '''
+
+        q = QueryModel.query().filter(QueryModel.color == "red").hint(QueryModel.color)
+        self.assertEqual(q.options.hint, 'color')
+        self.assertTrue(QueryModel.query().hint(query.KEY_KIND).options.hint is query.KEY_KIND)
+        self.assertRaises(AttributeError, QueryModel.query().hint, 'missing')
+        self.assertRaises(NotImplementedError, q.explain)